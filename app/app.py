@@ -1,5 +1,13 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, g
 from redis_operations import RedisSessionManager
+from memory_operations import MemorySessionManager
+import metricas
+from session_reaper import SessionReaper, metricas_publicadas
+from stats_service import ServicioEstadisticas
+from rate_limiter import LimitadorPeticiones, parsear_cuotas
+from sharding import parsear_nodos
+import json
+import math
 import os
 import redis
 
@@ -9,15 +17,231 @@ app.secret_key = 'clave_secreta_para_sesiones_flask'
 # Configurar Redis
 redis_host = os.getenv('REDIS_HOST', 'localhost')
 redis_port = int(os.getenv('REDIS_PORT', 6379))
+redis_db = int(os.getenv('REDIS_DB', 0))
 
-# Inicializar manejador de sesiones Redis
+# Modo shards: REDIS_NODES='host1:6379,host2:6379' reparte las claves entre
+# varios nodos; REDIS_PREVIOUS_NODES es la lista anterior durante un rebalanceo
+redis_nodes = parsear_nodos(os.getenv('REDIS_NODES', ''))
+redis_previous_nodes = parsear_nodos(os.getenv('REDIS_PREVIOUS_NODES', ''))
+
+# Réplicas de lectura: REDIS_REPLICAS='replica1:6379,replica2:6379'. Una réplica
+# con más de REDIS_MAX_REPLICA_LAG bytes de retraso deja de recibir lecturas;
+# REDIS_REPLICA_TIMEOUT (segundos) acota cada conexión y lectura en una réplica
+redis_replicas = parsear_nodos(os.getenv('REDIS_REPLICAS', ''))
+redis_replica_selection = os.getenv('REDIS_REPLICA_SELECTION', 'round_robin')
+redis_max_replica_lag = int(os.getenv('REDIS_MAX_REPLICA_LAG', 1024 * 1024))
+redis_replica_timeout = float(os.getenv('REDIS_REPLICA_TIMEOUT', 0.5))
+
+# Backend de sesiones: 'redis' o 'memory' (motor en proceso, sin servidor;
+# SESSION_AOF_PATH activa su persistencia en un archivo de solo anexado)
+session_backend = os.getenv('SESSION_BACKEND', 'redis')
+session_aof_path = os.getenv('SESSION_AOF_PATH') or None
+session_aof_fsync = os.getenv('SESSION_AOF_FSYNC', 'everysec')
+
+# Caché local de sesiones (0 = desactivada), su TTL en segundos y su
+# almacenamiento: 'lru' o 'engine' (motor en proceso como nivel L1)
+session_cache_size = int(os.getenv('SESSION_CACHE_SIZE', 0))
+session_cache_ttl = float(os.getenv('SESSION_CACHE_TTL', 5))
+session_cache_backend = os.getenv('SESSION_CACHE_BACKEND', 'lru')
+
+# Expiración deslizante: renovar el TTL de sesiones usadas, como mucho
+# una vez cada SESSION_REFRESH_INTERVAL segundos por token
+session_sliding_expiration = os.getenv('SESSION_SLIDING_EXPIRATION', '1') == '1'
+session_refresh_interval = int(os.getenv('SESSION_REFRESH_INTERVAL', 60))
+
+# Formato de las sesiones nuevas: 'hash' (un campo por atributo) o 'packed'
+# (msgpack compacto); las sesiones existentes se leen en cualquier formato
+session_codec = os.getenv('SESSION_CODEC', 'hash')
+
+# Máximo de sesiones abiertas por usuario (0 = sin límite); al superarlo se
+# cierra la sesión más antigua del usuario
+max_sessions_per_user = int(os.getenv('MAX_SESSIONS_PER_USER', 0))
+
+# Tokens firmados: SESSION_TOKEN_SECRETS (separados por comas; el primero
+# firma, el resto se aceptan durante una rotación) y su vida máxima en
+# segundos. SESSION_ACCEPT_UNSIGNED=0 rechaza los tokens uuid anteriores.
+# SESSION_REVOKED_FILTER_SIZE > 0 activa el filtro de tokens revocados
+session_token_secrets = [s for s in os.getenv('SESSION_TOKEN_SECRETS', '').split(',') if s]
+session_token_max_age = int(os.getenv('SESSION_TOKEN_MAX_AGE', 86400))
+session_accept_unsigned = os.getenv('SESSION_ACCEPT_UNSIGNED', '1') == '1'
+session_revoked_filter_size = int(os.getenv('SESSION_REVOKED_FILTER_SIZE', 0))
+
+# Efectos secundarios de crear/usar/cerrar sesiones (perfil, ranking,
+# analítica): 'inline' en la propia petición o 'stream' para publicarlos en
+# stream:session_events y que los aplique event_worker.py
+session_side_effects = os.getenv('SESSION_SIDE_EFFECTS', 'inline')
+
+# Tamaño máximo de lote aceptado por las APIs /api/sesiones/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 1000))
+
+# Métricas Prometheus en /metrics (METRICS_ENABLED=0 las desactiva); las
+# llamadas más lentas que SLOW_CALL_MS se registran en el logger 'sesiones.lentas'
+if os.getenv('METRICS_ENABLED', '1') == '1' and metricas.DISPONIBLE:
+    metricas.activar(umbral_lento_ms=float(os.getenv('SLOW_CALL_MS', 100)))
+
+# Estadísticas del panel: se calculan cada STATS_INTERVAL segundos y todas
+# las consultas y conexiones SSE reciben el mismo valor cacheado
+stats_interval = float(os.getenv('STATS_INTERVAL', 2))
+
+# Control de admisión (desactivado por defecto): RATE_LIMITS fija la cuota de
+# cada endpoint por cliente ('endpoint=peticiones/segundos,...'; vacío = sin
+# cuotas), identificado por IP o, con RATE_LIMIT_BY=session, por el token de
+# sesión firmado cuando la petición trae uno válido.
+# RATE_LIMIT_TRUST_PROXY=1 toma la IP de X-Forwarded-For. Por encima de
+# MAX_CONCURRENT_REQUESTS peticiones simultáneas (0 = sin límite) se responde 503
+rate_limits = parsear_cuotas(os.getenv('RATE_LIMITS', ''))
+rate_limit_by = os.getenv('RATE_LIMIT_BY', 'ip')
+rate_limit_trust_proxy = os.getenv('RATE_LIMIT_TRUST_PROXY', '0') == '1'
+max_concurrent_requests = int(os.getenv('MAX_CONCURRENT_REQUESTS', 0))
+
+# Endpoints fuera del control de admisión: diagnóstico y conexiones SSE de
+# larga duración (ocuparían un hueco de concurrencia mientras siguen abiertas)
+ENDPOINTS_SIN_LIMITE = {'static', 'metrics', 'health_check', 'api_estadisticas_stream'}
+
+# Endpoints por lotes: consumen la cuota del endpoint individual equivalente,
+# un token por elemento de la lista indicada del cuerpo JSON
+ENDPOINTS_POR_LOTES = {
+    'api_crear_sesiones': ('crear_sesion', 'sesiones'),
+    'api_obtener_sesiones': ('obtener_sesion', 'tokens'),
+    'api_cerrar_sesiones': ('cerrar_sesion', 'tokens')
+}
+
+# Inicializar manejador de sesiones
 try:
-    session_manager = RedisSessionManager(host=redis_host, port=redis_port)
-    print(f"✅ Conectado a Redis en {redis_host}:{redis_port}")
+    if session_backend == 'memory':
+        session_manager = MemorySessionManager(
+            sliding_expiration=session_sliding_expiration,
+            refresh_interval=session_refresh_interval,
+            codec=session_codec,
+            max_sessions_per_user=max_sessions_per_user,
+            token_secrets=session_token_secrets,
+            token_max_age=session_token_max_age,
+            accept_unsigned_tokens=session_accept_unsigned,
+            revoked_filter_size=session_revoked_filter_size,
+            aof_path=session_aof_path,
+            aof_fsync=session_aof_fsync
+        )
+        print(f"✅ Sesiones en memoria del proceso (AOF: {session_aof_path or 'desactivado'})")
+    else:
+        session_manager = RedisSessionManager(
+            host=redis_host,
+            port=redis_port,
+            db=redis_db,
+            cache_size=session_cache_size,
+            cache_ttl=session_cache_ttl,
+            cache_backend=session_cache_backend,
+            sliding_expiration=session_sliding_expiration,
+            refresh_interval=session_refresh_interval,
+            codec=session_codec,
+            max_sessions_per_user=max_sessions_per_user,
+            token_secrets=session_token_secrets,
+            token_max_age=session_token_max_age,
+            accept_unsigned_tokens=session_accept_unsigned,
+            revoked_filter_size=session_revoked_filter_size,
+            side_effects=session_side_effects,
+            nodes=redis_nodes,
+            previous_nodes=redis_previous_nodes,
+            replicas=redis_replicas,
+            replica_selection=redis_replica_selection,
+            max_replica_lag=redis_max_replica_lag,
+            replica_timeout=redis_replica_timeout
+        )
+        print(f"✅ Conectado a Redis en {redis_host}:{redis_port}")
 except Exception as e:
     print(f"❌ Error conectando a Redis: {e}")
     session_manager = None
 
+# Reaper de sesiones expiradas en un hilo de este proceso (opcional; también
+# puede ejecutarse como servicio independiente con session_reaper.py)
+session_reaper = None
+if session_manager and session_backend == 'redis' and os.getenv('SESSION_REAPER_THREAD', '0') == '1':
+    session_reaper = SessionReaper(session_manager)
+    session_reaper.iniciar()
+
+servicio_estadisticas = None
+if session_manager:
+    servicio_estadisticas = ServicioEstadisticas(session_manager, interval=stats_interval)
+    servicio_estadisticas.iniciar()
+
+limitador = None
+if session_manager and (rate_limits or max_concurrent_requests):
+    limitador = LimitadorPeticiones(
+        cliente=session_manager.redis_client if session_backend == 'redis' else None,
+        cuotas=rate_limits,
+        max_concurrentes=max_concurrent_requests
+    )
+
+@app.before_request
+def iniciar_metricas_peticion():
+    if metricas.activo():
+        g.metricas = metricas.iniciar_peticion()
+
+def cliente_de_peticion():
+    """
+    Identidad del cliente para su cuota: session:{cuerpo del token} con
+    RATE_LIMIT_BY=session si la petición trae un token firmado y vigente, o
+    ip:{dirección}. Un user_id del formulario no sirve: lo elige el cliente
+    """
+    firmador = session_manager.validador.firmador if session_manager.validador else None
+    if rate_limit_by == 'session' and firmador:
+        token = request.form.get('session_token')
+        if token and firmador.verificar(token) == 'ok':
+            return f"session:{token.rsplit('.', 2)[0]}"
+    direccion = request.access_route[0] if rate_limit_trust_proxy and request.access_route else request.remote_addr
+    return f"ip:{direccion}"
+
+@app.before_request
+def controlar_admision():
+    """
+    Middleware de admisión: primero el límite de concurrencia del proceso
+    (503, sin tocar Redis) y después la cuota del cliente en el endpoint (429)
+    """
+    if limitador is None or request.endpoint in ENDPOINTS_SIN_LIMITE:
+        return None
+    if not limitador.admitir(request.endpoint):
+        respuesta = jsonify({'error': 'Servicio saturado, reintenta en unos segundos'})
+        respuesta.headers['Retry-After'] = '1'
+        return respuesta, 503
+    g.admitida = True
+    
+    endpoint, coste = request.endpoint, 1
+    if endpoint in ENDPOINTS_POR_LOTES:
+        endpoint, campo = ENDPOINTS_POR_LOTES[endpoint]
+        cuerpo = request.get_json(silent=True)
+        if isinstance(cuerpo, dict) and isinstance(cuerpo.get(campo), list):
+            coste = max(1, len(cuerpo[campo]))
+    permitida, restantes, espera = limitador.comprobar(endpoint, cliente_de_peticion(), coste)
+    if restantes is not None:
+        g.cuota_restante = restantes
+    if espera is None:
+        return jsonify({'error': f'El lote supera la cuota de {endpoint}; divídelo en lotes más pequeños'}), 429
+    if not permitida:
+        respuesta = jsonify({'error': 'Demasiadas peticiones', 'retry_after': round(espera, 3)})
+        respuesta.headers['Retry-After'] = str(max(1, math.ceil(espera)))
+        return respuesta, 429
+    return None
+
+@app.after_request
+def registrar_metricas_peticion(response):
+    if 'metricas' in g:
+        metricas.finalizar_peticion(g.pop('metricas'), request.endpoint, response.status_code)
+    if 'cuota_restante' in g:
+        response.headers['X-RateLimit-Remaining'] = str(g.pop('cuota_restante'))
+    return response
+
+@app.teardown_request
+def liberar_admision(error=None):
+    if g.pop('admitida', False):
+        limitador.liberar()
+
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if not metricas.activo():
+        return jsonify({'error': 'Métricas desactivadas'}), 404
+    cuerpo, content_type = metricas.exportar()
+    return Response(cuerpo, content_type=content_type)
+
 @app.route('/')
 def index():
     """Página principal con interfaz para gestión de sesiones"""
@@ -33,14 +257,33 @@ def health_check():
         'status': 'ok' if redis_status['connected'] else 'error',
         'redis': redis_status,
         'host': redis_host,
-        'port': redis_port
+        'port': redis_port,
+        'cache': session_manager.estadisticas_cache() if session_manager else None,
+        'replicas': session_manager.estadisticas_replicas() if session_manager else None,
+        'tokens': session_manager.estadisticas_tokens() if session_manager else None,
+        'backend': session_backend,
+        'motor': session_manager.estadisticas_motor() if session_backend == 'memory' and session_manager else None,
+        'reaper': metricas_reaper(),
+        'estadisticas': servicio_estadisticas.metricas() if servicio_estadisticas else None,
+        'limitador': limitador.metricas() if limitador else None
     })
 
+def metricas_reaper():
+    """Métricas del reaper de este proceso o, si corre aparte, las que publicó en Redis"""
+    if session_reaper:
+        return session_reaper.metricas()
+    if session_manager and session_backend == 'redis':
+        try:
+            return metricas_publicadas(session_manager.redis_client)
+        except redis.RedisError:
+            return None
+    return None
+
 def verificar_conexion_redis():
     """Verificar si Redis está disponible"""
     try:
         if session_manager:
-            session_manager.redis_client.ping()
+            session_manager.ping()
             return {'connected': True, 'message': 'Redis conectado correctamente'}
         else:
             return {'connected': False, 'message': 'Session manager no inicializado'}
@@ -49,6 +292,10 @@ def verificar_conexion_redis():
     except Exception as e:
         return {'connected': False, 'message': f'Error de conexión: {str(e)}'}
 
+def leer_del_primario():
+    """primary=1 en la URL fuerza la lectura del primario (leer lo recién escrito)"""
+    return request.args.get('primary') == '1'
+
 @app.route('/crear_sesion', methods=['POST'])
 def crear_sesion():
     """Endpoint para crear nueva sesión"""
@@ -128,13 +375,76 @@ def cerrar_sesion():
 
 @app.route('/api/estadisticas')
 def api_estadisticas():
-    """API endpoint para obtener estadísticas en tiempo real"""
+    """
+    API endpoint para obtener estadísticas en tiempo real
+    Sirve el valor cacheado por ServicioEstadisticas; la cabecera Age indica
+    sus segundos de antigüedad. primary=1 calcula en el momento en el primario
+    """
+    if not session_manager:
+        return jsonify({'error': 'Redis no disponible'}), 503
+        
+    try:
+        if leer_del_primario():
+            return jsonify(session_manager.obtener_estadisticas(use_primary=True))
+        stats, edad = servicio_estadisticas.obtener()
+        response = jsonify(stats)
+        response.headers['Age'] = str(int(edad))
+        response.headers['Cache-Control'] = f"max-age={max(int(stats_interval - edad), 0)}"
+        return response
+    except redis.ConnectionError:
+        return jsonify({'error': 'No se puede conectar a Redis'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/estadisticas/stream')
+def api_estadisticas_stream():
+    """
+    Server-Sent Events: un evento con las estadísticas en cada cálculo del
+    servicio (cada STATS_INTERVAL segundos) y un comentario cada 15 s para
+    mantener viva la conexión
+    """
+    if not session_manager:
+        return jsonify({'error': 'Redis no disponible'}), 503
+        
+    def generar():
+        version = servicio_estadisticas.suscribir()
+        try:
+            try:
+                stats, _ = servicio_estadisticas.obtener()
+                yield f"data: {json.dumps(stats)}\n\n"
+            except redis.RedisError:
+                pass
+            while True:
+                version, stats = servicio_estadisticas.esperar(version, timeout=15)
+                yield f"data: {json.dumps(stats)}\n\n" if stats is not None else ": ping\n\n"
+        finally:
+            servicio_estadisticas.desuscribir()
+            
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/analitica')
+def api_analitica():
+    """
+    API endpoint de analítica por cubetas de tiempo
+    Parámetros: window (segundos hacia atrás, por defecto 3600), granularity
+    (minute, hour o day; por defecto según la ventana) y primary=1
+    """
     if not session_manager:
         return jsonify({'error': 'Redis no disponible'}), 503
         
     try:
-        stats = session_manager.obtener_estadisticas()
-        return jsonify(stats)
+        analitica = session_manager.obtener_analitica(
+            ventana=int(request.args.get('window', 3600)),
+            granularidad=request.args.get('granularity'),
+            use_primary=leer_del_primario()
+        )
+        return jsonify(analitica)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except redis.ConnectionError:
         return jsonify({'error': 'No se puede conectar a Redis'}), 503
     except Exception as e:
@@ -142,13 +452,146 @@ def api_estadisticas():
 
 @app.route('/api/sesiones_activas')
 def api_sesiones_activas():
-    """API endpoint para listar sesiones activas"""
+    """
+    API endpoint para listar sesiones activas paginadas
+    Parámetros: limit (1-1000, por defecto 100), cursor (de la página anterior)
+    y primary=1 para leer del primario en lugar de una réplica
+    """
+    if not session_manager:
+        return jsonify({'error': 'Redis no disponible'}), 503
+        
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+        pagina = session_manager.listar_sesiones_paginado(
+            limit=limit, cursor=request.args.get('cursor'), use_primary=leer_del_primario()
+        )
+        return jsonify(pagina)
+    except ValueError:
+        return jsonify({'error': 'Parámetros limit o cursor inválidos'}), 400
+    except redis.ConnectionError:
+        return jsonify({'error': 'No se puede conectar a Redis'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sesiones_activas/export')
+def api_exportar_sesiones():
+    """
+    Exportar todas las sesiones activas como NDJSON (una sesión por línea)
+    La respuesta se transmite mientras se leen lotes de Redis, con memoria acotada
+    Parámetro: batch_size (1-1000, por defecto 500)
+    """
+    if not session_manager:
+        return jsonify({'error': 'Redis no disponible'}), 503
+        
+    try:
+        batch_size = min(max(int(request.args.get('batch_size', 500)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': 'Parámetro batch_size inválido'}), 400
+        
+    def generar():
+        for sesion in session_manager.iterar_sesiones_activas(batch_size=batch_size):
+            yield json.dumps(sesion, ensure_ascii=False) + '\n'
+            
+    return Response(
+        stream_with_context(generar()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=sesiones_activas.ndjson'}
+    )
+
+def leer_lista_json(campo):
+    """Leer una lista del cuerpo JSON de la petición, validando su tamaño"""
+    cuerpo = request.get_json(silent=True)
+    if not isinstance(cuerpo, dict) or not isinstance(cuerpo.get(campo), list):
+        return None, (jsonify({'error': f"Se esperaba un objeto JSON con la lista '{campo}'"}), 400)
+    if len(cuerpo[campo]) > MAX_BATCH_SIZE:
+        return None, (jsonify({'error': f'El lote excede el máximo de {MAX_BATCH_SIZE} elementos'}), 400)
+    return cuerpo[campo], None
+
+@app.route('/api/sesiones/batch', methods=['POST'])
+def api_crear_sesiones():
+    """API endpoint para crear sesiones por lotes: {"sesiones": [{user_id, username, email}, ...]}"""
+    if not session_manager:
+        return jsonify({'error': 'Redis no disponible'}), 503
+        
+    sesiones, error = leer_lista_json('sesiones')
+    if error:
+        return error
+        
+    try:
+        return jsonify({'resultados': session_manager.crear_sesiones(sesiones)})
+    except redis.ConnectionError:
+        return jsonify({'error': 'No se puede conectar a Redis'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sesiones/batch/obtener', methods=['POST'])
+def api_obtener_sesiones():
+    """
+    API endpoint para consultar sesiones por lotes: {"tokens": [...]}
+    Con primary=1 se leen del primario en lugar de una réplica
+    """
+    if not session_manager:
+        return jsonify({'error': 'Redis no disponible'}), 503
+        
+    tokens, error = leer_lista_json('tokens')
+    if error:
+        return error
+        
+    try:
+        validos = [token for token in tokens if isinstance(token, str) and token]
+        sesiones = dict(zip(validos, session_manager.obtener_sesiones(validos, use_primary=leer_del_primario())))
+        resultados = []
+        for token in tokens:
+            if not isinstance(token, str) or not token:
+                resultados.append({'ok': False, 'token': token, 'error': 'Token inválido'})
+            elif sesiones[token]:
+                resultados.append({'ok': True, 'token': token, 'sesion': sesiones[token]})
+            else:
+                resultados.append({'ok': False, 'token': token, 'error': 'Sesión no encontrada o expirada'})
+        return jsonify({'resultados': resultados})
+    except redis.ConnectionError:
+        return jsonify({'error': 'No se puede conectar a Redis'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sesiones/batch/cerrar', methods=['POST'])
+def api_cerrar_sesiones():
+    """API endpoint para cerrar sesiones por lotes: {"tokens": [...]}"""
+    if not session_manager:
+        return jsonify({'error': 'Redis no disponible'}), 503
+        
+    tokens, error = leer_lista_json('tokens')
+    if error:
+        return error
+        
+    try:
+        validos = [token for token in tokens if isinstance(token, str) and token]
+        cerradas = session_manager.cerrar_sesiones(validos)
+        resultados = []
+        posicion = 0
+        for token in tokens:
+            if not isinstance(token, str) or not token:
+                resultados.append({'ok': False, 'token': token, 'error': 'Token inválido'})
+                continue
+            if cerradas[posicion]:
+                resultados.append({'ok': True, 'token': token})
+            else:
+                resultados.append({'ok': False, 'token': token, 'error': 'Sesión no encontrada'})
+            posicion += 1
+        return jsonify({'resultados': resultados})
+    except redis.ConnectionError:
+        return jsonify({'error': 'No se puede conectar a Redis'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/usuarios/<user_id>/sesiones', methods=['DELETE'])
+def api_cerrar_sesiones_usuario(user_id):
+    """API endpoint para cerrar todas las sesiones de un usuario"""
     if not session_manager:
         return jsonify({'error': 'Redis no disponible'}), 503
         
     try:
-        sesiones = session_manager.listar_sesiones_activas()
-        return jsonify(sesiones)
+        return jsonify({'ok': True, 'cerradas': session_manager.cerrar_sesiones_usuario(user_id)})
     except redis.ConnectionError:
         return jsonify({'error': 'No se puede conectar a Redis'}), 503
     except Exception as e:
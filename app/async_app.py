@@ -0,0 +1,185 @@
+"""
+API JSON asíncrona de gestión de sesiones (Quart + redis.asyncio)
+Cada petición en espera de Redis libera el event loop, por lo que un
+solo proceso atiende miles de validaciones concurrentes
+
+Ejecución:
+    hypercorn async_app:app --bind 0.0.0.0:5001
+"""
+
+import json
+import os
+
+import redis
+from quart import Quart, request, jsonify, Response
+
+from async_redis_operations import AsyncRedisSessionManager
+
+app = Quart(__name__)
+
+# Configurar Redis
+redis_host = os.getenv('REDIS_HOST', 'localhost')
+redis_port = int(os.getenv('REDIS_PORT', 6379))
+redis_max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', 500))
+
+session_manager = AsyncRedisSessionManager(
+    host=redis_host,
+    port=redis_port,
+    max_connections=redis_max_connections,
+    sliding_expiration=os.getenv('SESSION_SLIDING_EXPIRATION', '1') == '1',
+    refresh_interval=int(os.getenv('SESSION_REFRESH_INTERVAL', 60)),
+    codec=os.getenv('SESSION_CODEC', 'hash'),
+    max_sessions_per_user=int(os.getenv('MAX_SESSIONS_PER_USER', 0)),
+    token_secrets=[s for s in os.getenv('SESSION_TOKEN_SECRETS', '').split(',') if s],
+    token_max_age=int(os.getenv('SESSION_TOKEN_MAX_AGE', 86400)),
+    accept_unsigned_tokens=os.getenv('SESSION_ACCEPT_UNSIGNED', '1') == '1',
+    side_effects=os.getenv('SESSION_SIDE_EFFECTS', 'inline')
+)
+
+# Tamaño máximo de lote aceptado por las APIs /api/sesiones/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 1000))
+
+@app.after_serving
+async def cerrar_pool():
+    await session_manager.cerrar()
+
+@app.errorhandler(redis.ConnectionError)
+async def redis_no_disponible(error):
+    return jsonify({'error': 'No se puede conectar a Redis'}), 503
+
+@app.route('/api/health')
+async def health_check():
+    """Endpoint para verificar el estado del sistema"""
+    try:
+        await session_manager.redis_client.ping()
+        redis_status = {'connected': True, 'message': 'Redis conectado correctamente'}
+    except redis.RedisError as e:
+        redis_status = {'connected': False, 'message': f'Error de conexión: {str(e)}'}
+    return jsonify({
+        'status': 'ok' if redis_status['connected'] else 'error',
+        'redis': redis_status,
+        'host': redis_host,
+        'port': redis_port
+    })
+
+@app.route('/api/sesiones', methods=['POST'])
+async def api_crear_sesion():
+    """Crear una sesión: {"user_id", "username", "email"}"""
+    cuerpo = await request.get_json(silent=True) or {}
+    user_id, username, email = cuerpo.get('user_id'), cuerpo.get('username'), cuerpo.get('email')
+    if not all([user_id, username, email]):
+        return jsonify({'error': 'Todos los campos son obligatorios'}), 400
+        
+    token = await session_manager.crear_sesion(user_id, username, email)
+    return jsonify({'token': token}), 201
+
+@app.route('/api/sesiones/<token>')
+async def api_obtener_sesion(token):
+    """Validar un token y obtener los datos de su sesión"""
+    session_data = await session_manager.obtener_sesion(token)
+    if not session_data:
+        return jsonify({'error': 'Sesión no encontrada o expirada'}), 404
+    return jsonify(session_data)
+
+@app.route('/api/sesiones/<token>', methods=['DELETE'])
+async def api_cerrar_sesion(token):
+    """Cerrar una sesión"""
+    if not await session_manager.cerrar_sesion(token):
+        return jsonify({'error': 'Sesión no encontrada'}), 404
+    return jsonify({'ok': True})
+
+@app.route('/api/usuarios/<user_id>/sesiones', methods=['DELETE'])
+async def api_cerrar_sesiones_usuario(user_id):
+    """Cerrar todas las sesiones de un usuario"""
+    return jsonify({'ok': True, 'cerradas': await session_manager.cerrar_sesiones_usuario(user_id)})
+
+@app.route('/api/estadisticas')
+async def api_estadisticas():
+    """API endpoint para obtener estadísticas en tiempo real"""
+    return jsonify(await session_manager.obtener_estadisticas())
+
+@app.route('/api/sesiones_activas')
+async def api_sesiones_activas():
+    """API endpoint para listar sesiones activas paginadas (limit, cursor)"""
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+        pagina = await session_manager.listar_sesiones_paginado(limit=limit, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Parámetros limit o cursor inválidos'}), 400
+    return jsonify(pagina)
+
+@app.route('/api/sesiones_activas/export')
+async def api_exportar_sesiones():
+    """Exportar todas las sesiones activas como NDJSON"""
+    try:
+        batch_size = min(max(int(request.args.get('batch_size', 500)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': 'Parámetro batch_size inválido'}), 400
+        
+    async def generar():
+        async for sesion in session_manager.iterar_sesiones_activas(batch_size=batch_size):
+            yield (json.dumps(sesion, ensure_ascii=False) + '\n').encode('utf-8')
+            
+    return Response(
+        generar(),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=sesiones_activas.ndjson'}
+    )
+
+async def leer_lista_json(campo):
+    """Leer una lista del cuerpo JSON de la petición, validando su tamaño"""
+    cuerpo = await request.get_json(silent=True)
+    if not isinstance(cuerpo, dict) or not isinstance(cuerpo.get(campo), list):
+        return None, (jsonify({'error': f"Se esperaba un objeto JSON con la lista '{campo}'"}), 400)
+    if len(cuerpo[campo]) > MAX_BATCH_SIZE:
+        return None, (jsonify({'error': f'El lote excede el máximo de {MAX_BATCH_SIZE} elementos'}), 400)
+    return cuerpo[campo], None
+
+@app.route('/api/sesiones/batch', methods=['POST'])
+async def api_crear_sesiones():
+    """API endpoint para crear sesiones por lotes: {"sesiones": [...]}"""
+    sesiones, error = await leer_lista_json('sesiones')
+    if error:
+        return error
+    return jsonify({'resultados': await session_manager.crear_sesiones(sesiones)})
+
+@app.route('/api/sesiones/batch/obtener', methods=['POST'])
+async def api_obtener_sesiones():
+    """API endpoint para consultar sesiones por lotes: {"tokens": [...]}"""
+    tokens, error = await leer_lista_json('tokens')
+    if error:
+        return error
+        
+    validos = [token for token in tokens if isinstance(token, str) and token]
+    sesiones = dict(zip(validos, await session_manager.obtener_sesiones(validos)))
+    resultados = []
+    for token in tokens:
+        if not isinstance(token, str) or not token:
+            resultados.append({'ok': False, 'token': token, 'error': 'Token inválido'})
+        elif sesiones[token]:
+            resultados.append({'ok': True, 'token': token, 'sesion': sesiones[token]})
+        else:
+            resultados.append({'ok': False, 'token': token, 'error': 'Sesión no encontrada o expirada'})
+    return jsonify({'resultados': resultados})
+
+@app.route('/api/sesiones/batch/cerrar', methods=['POST'])
+async def api_cerrar_sesiones():
+    """API endpoint para cerrar sesiones por lotes: {"tokens": [...]}"""
+    tokens, error = await leer_lista_json('tokens')
+    if error:
+        return error
+        
+    validos = [token for token in tokens if isinstance(token, str) and token]
+    cerradas = iter(await session_manager.cerrar_sesiones(validos))
+    resultados = []
+    for token in tokens:
+        if not isinstance(token, str) or not token:
+            resultados.append({'ok': False, 'token': token, 'error': 'Token inválido'})
+        elif next(cerradas):
+            resultados.append({'ok': True, 'token': token})
+        else:
+            resultados.append({'ok': False, 'token': token, 'error': 'Sesión no encontrada'})
+    return jsonify({'resultados': resultados})
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5001)
@@ -0,0 +1,236 @@
+import time
+
+import redis.asyncio as aioredis
+
+import lua_scripts
+from near_cache import CANAL_INVALIDACION
+from session_codec import ERRORES_CODIFICACION, obtener_codec, decodificar_sesion
+from redis_operations import (
+    SESSION_TTL, BATCH_CHUNK_SIZE, CLAVES_RECONCILIAR, CLAVES_ELIMINAR_EXPIRADAS,
+    _hash_desde_lista, _en_bloques, _args_crear_sesion, _crear_validador, _validar_sesiones,
+    _args_obtener_sesion, _claves_cerrar_sesiones, _claves_cerrar_sesiones_usuario, _resumen_reconciliacion,
+    _parsear_cursor, _construir_pagina
+)
+
+class AsyncRedisSessionManager:
+    """
+    Versión asyncio de RedisSessionManager sobre redis.asyncio
+    Usa los mismos scripts Lua y patrones de clave; todas las corrutinas
+    comparten un único pool de conexiones
+    """
+    def __init__(self, host='redis', port=6379, db=0, max_connections=500,
+                 sliding_expiration=True, refresh_interval=60, codec='hash',
+                 max_sessions_per_user=0, token_secrets=None, token_max_age=86400,
+                 accept_unsigned_tokens=True, side_effects='inline'):
+        """
+        Inicializar el pool de conexiones a Redis
+        max_connections limita las conexiones simultáneas; las corrutinas que
+        no obtienen conexión esperan en el pool en lugar de abrir más
+        max_sessions_per_user > 0 cierra la sesión más antigua del usuario
+        al superar el límite
+        token_secrets, token_max_age y accept_unsigned_tokens como en
+        RedisSessionManager (sin filtro de revocados: no hay suscripción)
+        side_effects='stream' difiere perfil, ranking y analítica al worker
+        de eventos, como en RedisSessionManager
+        """
+        if side_effects not in ('inline', 'stream'):
+            raise ValueError(f"Modo de efectos secundarios desconocido: {side_effects}")
+        self.pool = aioredis.BlockingConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            max_connections=max_connections,
+            decode_responses=True,
+            encoding_errors=ERRORES_CODIFICACION
+        )
+        self.redis_client = aioredis.Redis(connection_pool=self.pool)
+        self.sliding_expiration = sliding_expiration
+        self.refresh_interval = refresh_interval
+        self.codec = obtener_codec(codec)
+        self.max_sessions_per_user = max_sessions_per_user
+        self._stream = lua_scripts.STREAM_EVENTOS if side_effects == 'stream' else ''
+        self.validador = _crear_validador(token_secrets, token_max_age, accept_unsigned_tokens, 0)
+        
+        self._script_crear_sesion = self.redis_client.register_script(lua_scripts.CREAR_SESION)
+        self._script_cerrar_sesiones = self.redis_client.register_script(lua_scripts.CERRAR_SESIONES)
+        self._script_cerrar_sesiones_usuario = self.redis_client.register_script(lua_scripts.CERRAR_SESIONES_USUARIO)
+        self._script_obtener_sesion = self.redis_client.register_script(lua_scripts.OBTENER_SESION)
+        self._script_listar_pagina = self.redis_client.register_script(lua_scripts.LISTAR_PAGINA)
+        self._script_reconciliar = self.redis_client.register_script(lua_scripts.RECONCILIAR_CONTADOR)
+        self._script_eliminar_expiradas = self.redis_client.register_script(lua_scripts.ELIMINAR_EXPIRADAS)
+        
+    async def cerrar(self):
+        """Cerrar el pool de conexiones"""
+        await self.pool.disconnect()
+        
+    async def crear_sesion(self, user_id, username, email):
+        """
+        Crear una nueva sesión de usuario
+        Comando: EVALSHA (script Lua atómico)
+        """
+        session_token, keys, args = _args_crear_sesion(
+            user_id, username, email, codec=self.codec, max_sesiones=self.max_sessions_per_user,
+            validador=self.validador, stream=self._stream
+        )
+        await self._script_crear_sesion(keys=keys, args=args)
+        return session_token
+        
+    async def crear_sesiones(self, sesiones):
+        """
+        Crear varias sesiones por lotes
+        Comando: EVALSHA encolado en pipelines de BATCH_CHUNK_SIZE sesiones
+        """
+        resultados, validas = _validar_sesiones(sesiones)
+        
+        for bloque in _en_bloques(validas):
+            pipe = self.redis_client.pipeline(transaction=False)
+            tokens = []
+            for i in bloque:
+                session_token, keys, args = _args_crear_sesion(
+                    sesiones[i]['user_id'], sesiones[i]['username'], sesiones[i]['email'],
+                    codec=self.codec, max_sesiones=self.max_sessions_per_user, validador=self.validador,
+                    stream=self._stream
+                )
+                await self._script_crear_sesion(keys=keys, args=args, client=pipe)
+                tokens.append(session_token)
+            respuestas = await pipe.execute(raise_on_error=False)
+            
+            for indice, token, respuesta in zip(bloque, tokens, respuestas):
+                if isinstance(respuesta, Exception):
+                    resultados[indice] = {'ok': False, 'error': str(respuesta)}
+                else:
+                    resultados[indice] = {'ok': True, 'token': token}
+                    
+        return resultados
+        
+    async def obtener_sesion(self, session_token):
+        """
+        Obtener información de una sesión
+        Comando: EVALSHA (HGETALL y renovación de actividad)
+        """
+        if self.validador and not self.validador.aceptar(session_token):
+            return None
+        datos = await self._script_obtener_sesion(
+            **_args_obtener_sesion(session_token, self.refresh_interval, self.sliding_expiration, self._stream)
+        )
+        return decodificar_sesion(_hash_desde_lista(datos))
+        
+    async def obtener_sesiones(self, session_tokens):
+        """
+        Obtener varias sesiones por lotes
+        Retorna una lista con el hash de cada sesión o None si no existe
+        """
+        aceptados = self._tokens_aceptados(session_tokens)
+        resultados = [None] * len(session_tokens)
+        for bloque in _en_bloques(aceptados):
+            pipe = self.redis_client.pipeline(transaction=False)
+            for i in bloque:
+                await self._script_obtener_sesion(
+                    client=pipe, **_args_obtener_sesion(session_tokens[i], self.refresh_interval, self.sliding_expiration, self._stream)
+                )
+            for i, datos in zip(bloque, await pipe.execute()):
+                resultados[i] = decodificar_sesion(_hash_desde_lista(datos))
+        return resultados
+        
+    def _tokens_aceptados(self, session_tokens):
+        """Índices de los tokens que superan la validación local"""
+        if self.validador is None:
+            return list(range(len(session_tokens)))
+        return [i for i, token in enumerate(session_tokens) if self.validador.aceptar(token)]
+        
+    async def cerrar_sesion(self, session_token):
+        """
+        Cerrar sesión eliminando el token
+        Retorna True si la sesión existía
+        """
+        return (await self.cerrar_sesiones([session_token]))[0]
+        
+    async def cerrar_sesiones(self, session_tokens):
+        """
+        Cerrar varias sesiones, BATCH_CHUNK_SIZE por script
+        Retorna una lista de booleanos, uno por token
+        """
+        resultados = [False] * len(session_tokens)
+        for bloque in _en_bloques(self._tokens_aceptados(session_tokens)):
+            cerradas = await self._script_cerrar_sesiones(
+                keys=_claves_cerrar_sesiones([session_tokens[i] for i in bloque]), args=[CANAL_INVALIDACION, self._stream]
+            )
+            for i, cerrada in zip(bloque, cerradas):
+                resultados[i] = bool(cerrada)
+        return resultados
+        
+    async def cerrar_sesiones_usuario(self, user_id):
+        """
+        Cerrar todas las sesiones de un usuario
+        Comando: EVALSHA sobre user:{user_id}:sessions
+        Retorna el número de sesiones cerradas
+        """
+        return await self._script_cerrar_sesiones_usuario(
+            keys=_claves_cerrar_sesiones_usuario(user_id), args=[CANAL_INVALIDACION, self._stream]
+        )
+        
+    async def obtener_estadisticas(self):
+        """
+        Obtener estadísticas del sistema
+        Comandos: ZCOUNT, ZCARD, ZRANGE (un solo pipeline)
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zcount('index:sessions:expiry', f"({time.time()}", '+inf')
+        pipe.zcard('ranking:active_users')
+        pipe.zrange('ranking:active_users', -5, -1, withscores=True)
+        sesiones_activas, usuarios_en_ranking, usuarios_recientes = await pipe.execute()
+        
+        return {
+            'sesiones_activas': sesiones_activas,
+            'usuarios_en_ranking': usuarios_en_ranking,
+            'usuarios_recientes': usuarios_recientes
+        }
+        
+    async def reconciliar_contador(self, max_items=1000):
+        """Corregir la deriva de stats:active_sessions de forma incremental"""
+        respuesta = await self._script_reconciliar(keys=CLAVES_RECONCILIAR, args=[time.time(), max_items])
+        return _resumen_reconciliacion(*respuesta)
+        
+    async def listar_sesiones_paginado(self, limit=100, cursor=None):
+        """
+        Listar sesiones activas ordenadas por expiración, una página a la vez
+        Retorna {'sesiones': [...], 'cursor': siguiente cursor o None}
+        """
+        cursor_expiracion, cursor_token = _parsear_cursor(cursor)
+        entradas = await self._script_listar_pagina(
+            keys=['index:sessions:expiry'],
+            args=[time.time(), limit, cursor_expiracion, cursor_token]
+        )
+        tokens, expiraciones = entradas[::2], entradas[1::2]
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        for token in tokens:
+            pipe.hgetall(f"session:{token}")
+            pipe.ttl(f"session:{token}")
+        return _construir_pagina(tokens, expiraciones, await pipe.execute(), limit)
+        
+    async def iterar_sesiones_activas(self, batch_size=BATCH_CHUNK_SIZE):
+        """Generador asíncrono de sesiones activas leídas por lotes"""
+        cursor = None
+        while True:
+            pagina = await self.listar_sesiones_paginado(limit=batch_size, cursor=cursor)
+            for sesion in pagina['sesiones']:
+                yield sesion
+            cursor = pagina['cursor']
+            if not cursor:
+                return
+                
+    async def listar_sesiones_activas(self):
+        """Listar todas las sesiones activas"""
+        return [sesion async for sesion in self.iterar_sesiones_activas()]
+        
+    async def eliminar_sesiones_expiradas(self, max_items=BATCH_CHUNK_SIZE):
+        """
+        Limpiar hasta max_items sesiones vencidas según index:sessions:expiry
+        Retorna (sesiones eliminadas, sesiones reindexadas)
+        """
+        eliminadas, reindexadas = await self._script_eliminar_expiradas(
+            keys=CLAVES_ELIMINAR_EXPIRADAS,
+            args=[time.time(), max_items, SESSION_TTL, CANAL_INVALIDACION, self._stream]
+        )
+        return eliminadas, reindexadas
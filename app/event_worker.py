@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Worker de eventos de sesión
+Consume stream:session_events con un grupo de consumidores y aplica los
+efectos secundarios que las peticiones dejan pendientes cuando la aplicación
+corre con SESSION_SIDE_EFFECTS=stream: perfil, ranking y analítica.
+Cada lote se aplica con un script que confirma (XACK) cada evento al
+aplicarlo y salta los que ya no están pendientes, así que un reintento no
+cuenta dos veces; las entradas que un consumidor caído dejó sin confirmar se
+reclaman con XAUTOCLAIM y, tras varios intentos fallidos, se apartan a
+stream:session_events:dead, igual que las entradas malformadas
+
+Uso como proceso independiente:
+    python event_worker.py --host redis --port 6379 --workers 4
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+
+import redis
+
+import lua_scripts
+from redis_operations import RedisSessionManager, BATCH_CHUNK_SIZE
+from sharding import parsear_nodos
+
+class SessionEventWorker:
+    """Un consumidor del grupo sobre el stream de un nodo"""
+    GRUPO = 'session-side-effects'
+    STREAM_FALLIDOS = lua_scripts.STREAM_EVENTOS + ':dead'
+    CAMPOS_OBLIGATORIOS = {'type', 'token', 'user_id'}
+    TIPOS = {'created', 'accessed', 'closed', 'evicted', 'expired'}
+    
+    def __init__(self, cliente, consumidor, batch_size=BATCH_CHUNK_SIZE, block_ms=1000,
+                 min_idle_ms=30000, max_deliveries=5, retry_interval=5.0):
+        """
+        min_idle_ms: una entrada sin confirmar durante ese tiempo se reclama
+        max_deliveries: entregas tras las que una entrada se aparta como fallida
+        retry_interval: segundos entre revisiones de entradas pendientes
+        """
+        self.cliente = cliente
+        self.consumidor = consumidor
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.min_idle_ms = min_idle_ms
+        self.max_deliveries = max_deliveries
+        self.retry_interval = retry_interval
+        
+        self._script_aplicar = cliente.register_script(lua_scripts.APLICAR_EVENTOS)
+        self._cursor_reclamo = '0-0'
+        self._ultima_revision = 0.0
+        
+        self._detener = threading.Event()
+        self._hilo = None
+        self._metricas = {
+            'lotes': 0,
+            'eventos_aplicados': 0,
+            'eventos_reclamados': 0,
+            'eventos_fallidos': 0,
+            'errores': 0
+        }
+        self._lock_metricas = threading.Lock()
+        
+    def _sumar(self, **valores):
+        with self._lock_metricas:
+            for nombre, valor in valores.items():
+                self._metricas[nombre] += valor
+                
+    def asegurar_grupo(self):
+        """Crear el grupo (y el stream) si no existen; empieza por el principio del stream"""
+        try:
+            self.cliente.xgroup_create(lua_scripts.STREAM_EVENTOS, self.GRUPO, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+                
+    def _args_eventos(self, entradas):
+        """ARGV del script APLICAR_EVENTOS para una lista de (id, campos) válidos"""
+        args = [self.GRUPO]
+        for id_entrada, campos in entradas:
+            campos = dict(campos)
+            tipo, token, user_id = campos.pop('type'), campos.pop('token'), campos.pop('user_id')
+            args += [id_entrada, tipo, user_id, token, len(campos)]
+            for campo, valor in campos.items():
+                args += [campo, valor]
+        return args
+        
+    def _apartar(self, id_entrada, campos, motivo):
+        """Copiar una entrada a STREAM_FALLIDOS y confirmarla en una transacción"""
+        pipe = self.cliente.pipeline(transaction=True)
+        if campos:
+            pipe.xadd(self.STREAM_FALLIDOS, {**campos, 'id': id_entrada, 'motivo': motivo},
+                      maxlen=100000, approximate=True)
+        pipe.xack(lua_scripts.STREAM_EVENTOS, self.GRUPO, id_entrada)
+        pipe.execute()
+        
+    def _aplicar_y_confirmar(self, entradas):
+        """
+        Aplicar los eventos con un script que confirma cada uno al aplicarlo;
+        si el script falla, el evento que falló y los siguientes quedan pendientes
+        """
+        return self._script_aplicar(
+            keys=['ranking:active_users', lua_scripts.STREAM_EVENTOS], args=self._args_eventos(entradas)
+        )
+        
+    def _aplicar(self, entradas):
+        """
+        Aplicar un lote; si el script falla se reintenta evento a evento para
+        que una entrada defectuosa no bloquee al resto (queda pendiente y acaba
+        apartada tras max_deliveries). Los eventos que el lote fallido ya
+        aplicó están confirmados y el script los salta
+        """
+        validas, malformadas = [], 0
+        for id_entrada, campos in entradas:
+            if not campos:
+                # Las entradas recortadas del stream llegan sin campos: solo se confirman
+                self.cliente.xack(lua_scripts.STREAM_EVENTOS, self.GRUPO, id_entrada)
+            elif not self.CAMPOS_OBLIGATORIOS <= campos.keys() or campos['type'] not in self.TIPOS:
+                self._apartar(id_entrada, campos, 'malformado')
+                malformadas += 1
+            else:
+                validas.append((id_entrada, campos))
+        aplicados = 0
+        if validas:
+            try:
+                aplicados = self._aplicar_y_confirmar(validas)
+            except redis.ResponseError:
+                # Cada evento acaba aplicado, por el lote o por su reintento, salvo los que fallan
+                aplicados = len(validas)
+                for entrada in validas:
+                    try:
+                        self._aplicar_y_confirmar([entrada])
+                    except redis.ResponseError as e:
+                        aplicados -= 1
+                        print(f"❌ Evento {entrada[0]} no aplicado: {e}")
+        self._sumar(lotes=1, eventos_aplicados=aplicados, eventos_fallidos=malformadas)
+        return aplicados
+        
+    def procesar_lote(self):
+        """Leer (bloqueando hasta block_ms) y aplicar un lote de eventos nuevos"""
+        respuesta = self.cliente.xreadgroup(
+            self.GRUPO, self.consumidor, {lua_scripts.STREAM_EVENTOS: '>'},
+            count=self.batch_size, block=self.block_ms
+        )
+        if not respuesta:
+            return 0
+        return self._aplicar(respuesta[0][1])
+        
+    def reintentar_pendientes(self):
+        """
+        Apartar las entradas que agotaron max_deliveries y reclamar (XAUTOCLAIM)
+        las que llevan más de min_idle_ms sin confirmar
+        Retorna (reclamadas, fallidas)
+        """
+        pendientes = self.cliente.xpending_range(
+            lua_scripts.STREAM_EVENTOS, self.GRUPO, '-', '+', self.batch_size
+        )
+        agotadas = [
+            p['message_id'] for p in pendientes
+            if p['times_delivered'] >= self.max_deliveries and p['time_since_delivered'] >= self.min_idle_ms
+        ]
+        for id_entrada in agotadas:
+            entradas = self.cliente.xrange(lua_scripts.STREAM_EVENTOS, id_entrada, id_entrada)
+            self._apartar(id_entrada, entradas[0][1] if entradas else None, 'reintentos')
+            
+        siguiente, reclamadas = self.cliente.xautoclaim(
+            lua_scripts.STREAM_EVENTOS, self.GRUPO, self.consumidor,
+            min_idle_time=self.min_idle_ms, start_id=self._cursor_reclamo, count=self.batch_size
+        )[:2]
+        self._cursor_reclamo = siguiente
+        self._aplicar(reclamadas)
+        self._sumar(eventos_reclamados=len(reclamadas), eventos_fallidos=len(agotadas))
+        return len(reclamadas), len(agotadas)
+        
+    def ejecutar(self):
+        """Bucle principal: lotes nuevos y, cada retry_interval, revisión de pendientes"""
+        self.asegurar_grupo()
+        while not self._detener.is_set():
+            try:
+                if time.monotonic() - self._ultima_revision >= self.retry_interval:
+                    self._ultima_revision = time.monotonic()
+                    self.reintentar_pendientes()
+                self.procesar_lote()
+            except redis.RedisError as e:
+                self._sumar(errores=1)
+                print(f"❌ Error en el worker de eventos: {e}")
+                self._detener.wait(1)
+                
+    def iniciar(self):
+        """Ejecutar el worker en un hilo de fondo"""
+        self._hilo = threading.Thread(target=self.ejecutar, name=f"event-worker-{self.consumidor}", daemon=True)
+        self._hilo.start()
+        return self._hilo
+        
+    def detener(self, timeout=None):
+        """Detener el hilo (termina tras el lote en curso)"""
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            
+    def metricas(self):
+        """Métricas acumuladas del consumidor"""
+        with self._lock_metricas:
+            return dict(self._metricas)
+
+def crear_workers(session_manager, workers=1, **opciones):
+    """Un consumidor por worker y por nodo (cada nodo tiene su propio stream)"""
+    prefijo = f"{socket.gethostname()}-{os.getpid()}"
+    return [
+        SessionEventWorker(cliente, f"{prefijo}-{i}", **opciones)
+        for cliente in session_manager.nodos.values()
+        for i in range(workers)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker de eventos de sesión')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('EVENT_WORKERS', 2)))
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('EVENT_BATCH_SIZE', BATCH_CHUNK_SIZE)))
+    parser.add_argument('--min-idle-ms', type=int, default=int(os.getenv('EVENT_MIN_IDLE_MS', 30000)))
+    parser.add_argument('--max-deliveries', type=int, default=int(os.getenv('EVENT_MAX_DELIVERIES', 5)))
+    args = parser.parse_args()
+    
+    session_manager = RedisSessionManager(
+        host=args.host,
+        port=args.port,
+        nodes=parsear_nodos(os.getenv('REDIS_NODES', ''))
+    )
+    workers = crear_workers(
+        session_manager,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        min_idle_ms=args.min_idle_ms,
+        max_deliveries=args.max_deliveries
+    )
+    print(f"📨 {len(workers)} consumidores de eventos conectados a {args.host}:{args.port}")
+    for worker in workers:
+        worker.iniciar()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for worker in workers:
+        worker.detener(timeout=5)
+    for worker in workers:
+        print(f"Métricas finales {worker.consumidor}: {worker.metricas()}")
+
+if __name__ == '__main__':
+    main()
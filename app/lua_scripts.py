@@ -0,0 +1,459 @@
+"""
+Scripts Lua ejecutados del lado del servidor Redis
+Cada script agrupa varios comandos en una sola unidad atómica,
+de modo que cada operación cuesta un único viaje de red (EVALSHA)
+"""
+
+# Cubetas de analítica: granularidad -> (segundos por cubeta, TTL en segundos)
+# Cada cubeta es stats:active_users:{granularidad}:{inicio epoch} (HyperLogLog
+# de usuarios, como mucho 12 KB) y stats:sessions_created:{granularidad}:{inicio}
+# (contador); el TTL acota la memoria sea cual sea el número de usuarios
+CUBETAS_ANALITICA = {
+    'minute': (60, 26 * 3600),
+    'hour': (3600, 8 * 86400),
+    'day': (86400, 400 * 86400)
+}
+
+# Segundos de la cubeta más fina: una lectura que cae en una cubeta distinta
+# de la última anotada vuelve a anotar al usuario (sin renovar el TTL), para
+# que cada usuario activo quede contado en todas las cubetas en que lee su
+# sesión aunque el intervalo mínimo entre renovaciones sea mayor
+CUBETA_MINIMA = min(segundos for segundos, _ in CUBETAS_ANALITICA.values())
+
+# Función común que anota un usuario activo (y, si creada, una sesión nueva)
+# en la cubeta actual de cada granularidad
+_REGISTRAR_ACTIVIDAD = """
+local CUBETA_MINIMA = %d
+local function registrar_actividad(ahora, user_id, creada)
+    ahora = math.floor(ahora)
+    for _, cubeta in ipairs({%s}) do
+        local sufijo = cubeta[1] .. ':' .. (ahora - ahora %% cubeta[2])
+        redis.call('PFADD', 'stats:active_users:' .. sufijo, user_id)
+        redis.call('EXPIRE', 'stats:active_users:' .. sufijo, cubeta[3])
+        if creada then
+            redis.call('INCR', 'stats:sessions_created:' .. sufijo)
+            redis.call('EXPIRE', 'stats:sessions_created:' .. sufijo, cubeta[3])
+        end
+    end
+end
+""" % (CUBETA_MINIMA, ', '.join(
+    f"{{'{nombre}', {segundos}, {ttl}}}" for nombre, (segundos, ttl) in CUBETAS_ANALITICA.items()
+))
+
+# Stream de eventos del ciclo de vida de las sesiones (created, accessed,
+# closed, expired). Solo se escribe con los efectos secundarios en modo
+# 'stream'; se recorta de forma aproximada a MAX_EVENTOS_STREAM entradas
+STREAM_EVENTOS = 'stream:session_events'
+MAX_EVENTOS_STREAM = 1000000
+
+# Función común que añade un evento al stream (los campos extra, en pares)
+_PUBLICAR_EVENTO = """
+local function publicar_evento(stream, tipo, token, user_id, ...)
+    redis.call('XADD', stream, 'MAXLEN', '~', %d, '*', 'type', tipo, 'token', token, 'user_id', user_id, ...)
+end
+""" % MAX_EVENTOS_STREAM
+
+# Función común de los scripts que cierran sesiones. Claves en el orden de
+# CERRAR_SESIONES: stats:active_sessions, ranking:active_users,
+# index:sessions:expiry, index:sessions:owner. Quita el token de los índices
+# (incluido user:{user_id}:sessions) y saca al usuario del ranking solo
+# cuando ya no le quedan sesiones; con stream ~= '' el ranking lo actualiza
+# el worker a partir del evento. Devuelve true si la sesión existía
+_CERRAR_TOKEN = _PUBLICAR_EVENTO + """
+local function cerrar_token(token, stats, ranking, expiracion, propietarios, stream, tipo)
+    local clave = 'session:' .. token
+    local existe = redis.call('EXISTS', clave) == 1
+    -- El formato compacto no guarda user_id en campo propio: se toma del índice
+    local user_id = redis.call('HGET', propietarios, token) or redis.call('HGET', clave, 'user_id')
+    redis.call('ZREM', expiracion, token)
+    redis.call('HDEL', propietarios, token)
+    if user_id then
+        local sesiones_usuario = 'user:{' .. user_id .. '}:sessions'
+        redis.call('ZREM', sesiones_usuario, token)
+        if stream ~= '' then
+            publicar_evento(stream, tipo, token, user_id)
+        elseif redis.call('EXISTS', sesiones_usuario) == 0 then
+            redis.call('ZREM', ranking, user_id)
+        end
+    end
+    if existe then
+        redis.call('DEL', clave)
+        if tonumber(redis.call('GET', stats) or '0') > 0 then
+            redis.call('DECR', stats)
+        end
+    end
+    return existe
+end
+"""
+
+# KEYS[1] = session:{token}
+# KEYS[2] = stats:active_sessions
+# KEYS[3] = user:{user_id}:profile
+# KEYS[4] = ranking:active_users
+# KEYS[5] = index:sessions:expiry
+# KEYS[6] = index:sessions:owner
+# KEYS[7] = user:{user_id}:sessions (tokens del usuario por fecha de creación)
+# ARGV[1..5] = user_id, TTL en segundos, timestamp epoch, timestamp de expiración, token
+# ARGV[6] = máximo de sesiones por usuario (0 = sin límite)
+# ARGV[7] = canal Pub/Sub de invalidación (sesiones desalojadas por el límite)
+# ARGV[8] = stream de eventos, o '' para aplicar los efectos secundarios aquí
+# ARGV[9] = número n de pares campo/valor de la sesión (según el códec)
+# ARGV[10..9+2n] = campos de la sesión
+# ARGV[10+2n..] = campos del perfil (ninguno si el códec no lo duplica)
+# Efectos secundarios: perfil, ranking y cubetas de analítica; con stream se
+# publica un evento 'created' (con el perfil) y los aplica el worker.
+# Devuelve el número de sesiones antiguas desalojadas por el límite
+CREAR_SESION = _CERRAR_TOKEN + _REGISTRAR_ACTIVIDAD + """
+local n = tonumber(ARGV[9])
+redis.call('HSET', KEYS[1], unpack(ARGV, 10, 9 + 2 * n))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('INCR', KEYS[2])
+redis.call('ZADD', KEYS[5], ARGV[4], ARGV[5])
+redis.call('HSET', KEYS[6], ARGV[5], ARGV[1])
+redis.call('ZADD', KEYS[7], ARGV[3], ARGV[5])
+if ARGV[8] ~= '' then
+    publicar_evento(ARGV[8], 'created', ARGV[5], ARGV[1], unpack(ARGV, 10 + 2 * n))
+else
+    if #ARGV > 9 + 2 * n then
+        redis.call('HSET', KEYS[3], unpack(ARGV, 10 + 2 * n))
+    end
+    redis.call('ZADD', KEYS[4], ARGV[3], ARGV[1])
+    registrar_actividad(tonumber(ARGV[3]), ARGV[1], true)
+end
+
+local maximo = tonumber(ARGV[6])
+local desalojados = {}
+if maximo > 0 then
+    while redis.call('ZCARD', KEYS[7]) > maximo do
+        local token = redis.call('ZRANGE', KEYS[7], 0, 0)[1]
+        if cerrar_token(token, KEYS[2], KEYS[4], KEYS[5], KEYS[6], ARGV[8], 'evicted') then
+            desalojados[#desalojados + 1] = token
+        end
+    end
+end
+if #desalojados > 0 then
+    redis.call('PUBLISH', ARGV[7], table.concat(desalojados, ' '))
+end
+return #desalojados
+"""
+
+# KEYS[1] = stats:active_sessions
+# KEYS[2] = ranking:active_users
+# KEYS[3] = index:sessions:expiry
+# KEYS[4] = index:sessions:owner
+# KEYS[5..n] = session:{token} de cada sesión a cerrar
+# ARGV[1] = canal Pub/Sub donde se publican los tokens cerrados (invalidación de cachés)
+# ARGV[2] = stream de eventos ('closed'), o '' para actualizar el ranking aquí
+# Devuelve una lista con 1 (cerrada) o 0 (no existía) por cada sesión
+CERRAR_SESIONES = _CERRAR_TOKEN + """
+local resultado = {}
+local cerrados = {}
+for i = 5, #KEYS do
+    -- El token es la clave sin el prefijo 'session:'
+    local token = string.sub(KEYS[i], 9)
+    if cerrar_token(token, KEYS[1], KEYS[2], KEYS[3], KEYS[4], ARGV[2], 'closed') then
+        cerrados[#cerrados + 1] = token
+        resultado[#resultado + 1] = 1
+    else
+        resultado[#resultado + 1] = 0
+    end
+end
+if #cerrados > 0 then
+    redis.call('PUBLISH', ARGV[1], table.concat(cerrados, ' '))
+end
+return resultado
+"""
+
+# KEYS[1..4] = como en CERRAR_SESIONES
+# KEYS[5] = user:{user_id}:sessions
+# ARGV[1] = canal Pub/Sub de invalidación
+# ARGV[2] = stream de eventos, o ''
+# Cierra todas las sesiones del usuario ("cerrar sesión en todos los
+# dispositivos"). Devuelve el número de sesiones cerradas
+CERRAR_SESIONES_USUARIO = _CERRAR_TOKEN + """
+local cerrados = {}
+for _, token in ipairs(redis.call('ZRANGE', KEYS[5], 0, -1)) do
+    if cerrar_token(token, KEYS[1], KEYS[2], KEYS[3], KEYS[4], ARGV[2], 'closed') then
+        cerrados[#cerrados + 1] = token
+    end
+end
+redis.call('DEL', KEYS[5])
+if #cerrados > 0 then
+    redis.call('PUBLISH', ARGV[1], table.concat(cerrados, ' '))
+end
+return #cerrados
+"""
+
+# KEYS[1] = session:{token}
+# KEYS[2] = index:sessions:expiry
+# ARGV[1] = fecha ISO actual
+# ARGV[2] = timestamp epoch actual
+# ARGV[3] = intervalo mínimo en segundos entre actualizaciones de actividad
+# ARGV[4] = nuevo TTL en segundos (expiración deslizante) o 0 para no extenderlo
+# ARGV[5] = token
+# ARGV[6] = stream de eventos ('accessed'), o '' para anotar la analítica aquí
+# Devuelve el hash de la sesión (lista plana campo/valor) o una lista vacía.
+# Solo escribe si la sesión existe (no crea hashes sin TTL), de modo que la
+# mayoría de lecturas no generan escrituras:
+# - como mucho una vez por intervalo renueva la actividad, el TTL y la
+#   expiración del índice. La actividad se escribe en el formato de la propia
+#   sesión: last_activity y last_activity_ts (formato hash) o 'a' en segundos
+#   epoch (formato compacto)
+# - como mucho una vez por cubeta de CUBETA_MINIMA segundos anota al usuario
+#   en la analítica y guarda la cubeta anotada (activity_bucket o 'b'), sin
+#   tocar el TTL ni el índice
+OBTENER_SESION = _REGISTRAR_ACTIVIDAD + _PUBLICAR_EVENTO + """
+local datos = redis.call('HGETALL', KEYS[1])
+if #datos == 0 then
+    return datos
+end
+local ultima = 0
+local anotada = false
+local compacta = false
+local user_id = false
+for i = 1, #datos, 2 do
+    if datos[i] == 'last_activity_ts' or datos[i] == 'a' then
+        ultima = tonumber(datos[i + 1]) or 0
+    elseif datos[i] == 'activity_bucket' or datos[i] == 'b' then
+        anotada = tonumber(datos[i + 1])
+    elseif datos[i] == 'd' then
+        compacta = true
+    elseif datos[i] == 'user_id' then
+        user_id = datos[i + 1]
+    end
+end
+local ahora = tonumber(ARGV[2])
+local cubeta = math.floor(ahora / CUBETA_MINIMA)
+-- Sin cubeta anotada, la de la última actividad (la creación anota la suya)
+local anotar = cubeta ~= (anotada or math.floor(ultima / CUBETA_MINIMA))
+if ahora - ultima >= tonumber(ARGV[3]) then
+    if compacta then
+        redis.call('HSET', KEYS[1], 'a', math.floor(ahora))
+    else
+        redis.call('HSET', KEYS[1], 'last_activity', ARGV[1], 'last_activity_ts', ARGV[2])
+    end
+    local ttl = tonumber(ARGV[4])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[1], ttl)
+        redis.call('ZADD', KEYS[2], ahora + ttl, ARGV[5])
+    end
+end
+if anotar then
+    redis.call('HSET', KEYS[1], compacta and 'b' or 'activity_bucket', cubeta)
+    -- El formato compacto no guarda user_id en campo propio: se toma del índice
+    user_id = user_id or redis.call('HGET', 'index:sessions:owner', ARGV[5])
+    if user_id and ARGV[6] ~= '' then
+        publicar_evento(ARGV[6], 'accessed', ARGV[5], user_id)
+    elseif user_id then
+        registrar_actividad(ahora, user_id, false)
+    end
+end
+return datos
+"""
+
+# KEYS[1] = index:sessions:expiry
+# ARGV[1] = timestamp actual (las entradas con expiración anterior se omiten)
+# ARGV[2] = tamaño de página
+# ARGV[3], ARGV[4] = cursor (expiración y token de la última entrada devuelta),
+#                    vacíos para la primera página
+# La posición del cursor es la del par (expiración, token): si el token se
+# renovó o cerró entre páginas su rango actual ya no sirve y se continúa
+# desde su expiración anterior
+# Devuelve una lista plana token/expiración ordenada por expiración
+LISTAR_PAGINA = """
+local inicio = redis.call('ZCOUNT', KEYS[1], '-inf', ARGV[1])
+if ARGV[4] ~= '' then
+    local rango
+    if tonumber(redis.call('ZSCORE', KEYS[1], ARGV[4])) == tonumber(ARGV[3]) then
+        rango = redis.call('ZRANK', KEYS[1], ARGV[4])
+    else
+        -- La última entrada ya no está donde estaba: continuar desde su expiración
+        rango = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. ARGV[3]) - 1
+    end
+    inicio = math.max(inicio, rango + 1)
+end
+return redis.call('ZRANGE', KEYS[1], inicio, inicio + tonumber(ARGV[2]) - 1, 'WITHSCORES')
+"""
+
+# KEYS[1] = index:sessions:expiry
+# KEYS[2] = stats:active_sessions
+# KEYS[3] = stats:reconcile_cursor (posición de ZSCAN entre llamadas)
+# ARGV[1] = timestamp actual
+# ARGV[2] = entradas del índice a revisar en esta llamada
+# Revisa un tramo del índice, elimina entradas vivas cuya sesión ya no existe
+# (borrada fuera de los scripts o desalojada por maxmemory) y fija el contador
+# al número exacto de sesiones vivas.
+# Devuelve {sesiones vivas, valor anterior del contador, huérfanas eliminadas, cursor}
+RECONCILIAR_CONTADOR = """
+local ahora = tonumber(ARGV[1])
+local cursor = redis.call('GET', KEYS[3]) or '0'
+local tramo = redis.call('ZSCAN', KEYS[1], cursor, 'COUNT', ARGV[2])
+local huerfanas = 0
+for i = 1, #tramo[2], 2 do
+    local token = tramo[2][i]
+    if tonumber(tramo[2][i + 1]) > ahora and redis.call('EXISTS', 'session:' .. token) == 0 then
+        redis.call('ZREM', KEYS[1], token)
+        huerfanas = huerfanas + 1
+    end
+end
+redis.call('SET', KEYS[3], tramo[1])
+local vivas = redis.call('ZCOUNT', KEYS[1], '(' .. ARGV[1], '+inf')
+local anterior = tonumber(redis.call('GET', KEYS[2]) or '0')
+redis.call('SET', KEYS[2], vivas)
+return {vivas, anterior, huerfanas, tramo[1]}
+"""
+
+# KEYS[1] = index:sessions:expiry
+# KEYS[2] = index:sessions:owner
+# KEYS[3] = stats:active_sessions
+# KEYS[4] = ranking:active_users
+# ARGV[1] = timestamp actual
+# ARGV[2] = máximo de entradas vencidas a procesar
+# ARGV[3] = TTL en segundos para sesiones sin expiración
+# ARGV[4] = canal Pub/Sub de invalidación
+# ARGV[5] = stream de eventos ('expired'), o '' para actualizar el ranking aquí
+# Limpia sesiones cuya expiración ya pasó: entrada del índice, propietario,
+# índice del usuario, contador y ranking (si al usuario no le quedan
+# sesiones). Si la clave sigue viva (reloj desfasado o sesión sin TTL)
+# solo se reindexa con su expiración real.
+# Devuelve {sesiones eliminadas, sesiones reindexadas}
+ELIMINAR_EXPIRADAS = _PUBLICAR_EVENTO + """
+local ahora = tonumber(ARGV[1])
+local vencidas = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local eliminadas = {}
+local reindexadas = 0
+for _, token in ipairs(vencidas) do
+    local clave = 'session:' .. token
+    local ttl = redis.call('TTL', clave)
+    if ttl == -1 then
+        redis.call('EXPIRE', clave, ARGV[3])
+        ttl = tonumber(ARGV[3])
+    end
+    if ttl > 0 then
+        redis.call('ZADD', KEYS[1], ahora + ttl, token)
+        reindexadas = reindexadas + 1
+    else
+        redis.call('ZREM', KEYS[1], token)
+        local user_id = redis.call('HGET', KEYS[2], token)
+        redis.call('HDEL', KEYS[2], token)
+        if tonumber(redis.call('GET', KEYS[3]) or '0') > 0 then
+            redis.call('DECR', KEYS[3])
+        end
+        if user_id then
+            local sesiones_usuario = 'user:{' .. user_id .. '}:sessions'
+            redis.call('ZREM', sesiones_usuario, token)
+            if ARGV[5] ~= '' then
+                publicar_evento(ARGV[5], 'expired', token, user_id)
+            elseif redis.call('EXISTS', sesiones_usuario) == 0 then
+                redis.call('ZREM', KEYS[4], user_id)
+            end
+        end
+        eliminadas[#eliminadas + 1] = token
+    end
+end
+if #eliminadas > 0 then
+    redis.call('PUBLISH', ARGV[4], table.concat(eliminadas, ' '))
+end
+return {#eliminadas, reindexadas}
+"""
+
+# KEYS[1] = ranking:active_users
+# KEYS[2] = stream de eventos
+# ARGV[1] = grupo de consumidores
+# ARGV[2..] = por cada evento del stream: ID, tipo, user_id, token, número n
+#             de pares del perfil y los n pares
+# Aplica los efectos secundarios diferidos de un lote de eventos:
+# - created: perfil, ranking (si la sesión sigue viva) y analítica
+# - accessed: analítica
+# - closed, evicted, expired: saca al usuario del ranking si ya no tiene sesiones
+# Cada evento se confirma (XACK) justo después de aplicarse, y los que ya no
+# están pendientes en el grupo se saltan: si el script falla a mitad de lote,
+# los eventos anteriores quedan aplicados y confirmados (Redis no deshace sus
+# escrituras) y el que falló sigue pendiente, de modo que reintentar el lote
+# no vuelve a contar ninguno
+# Devuelve el número de eventos aplicados
+APLICAR_EVENTOS = _REGISTRAR_ACTIVIDAD + """
+local i = 2
+local aplicados = 0
+while i <= #ARGV do
+    local id, tipo, user_id, token = ARGV[i], ARGV[i + 1], ARGV[i + 2], ARGV[i + 3]
+    local n = tonumber(ARGV[i + 4])
+    if #redis.call('XPENDING', KEYS[2], ARGV[1], id, id, 1) > 0 then
+        local ahora = tonumber(string.match(id, '^%d+')) / 1000
+        if tipo == 'created' then
+            if n > 0 then
+                redis.call('HSET', 'user:{' .. user_id .. '}:profile', unpack(ARGV, i + 5, i + 4 + 2 * n))
+            end
+            if redis.call('EXISTS', 'session:' .. token) == 1 then
+                redis.call('ZADD', KEYS[1], 'GT', ahora, user_id)
+            end
+            registrar_actividad(ahora, user_id, true)
+        elseif tipo == 'accessed' then
+            registrar_actividad(ahora, user_id, false)
+        elseif redis.call('EXISTS', 'user:{' .. user_id .. '}:sessions') == 0 then
+            redis.call('ZREM', KEYS[1], user_id)
+        end
+        redis.call('XACK', KEYS[2], ARGV[1], id)
+        aplicados = aplicados + 1
+    end
+    i = i + 5 + 2 * n
+end
+return aplicados
+"""
+
+# KEYS[1] = clave del lock
+# ARGV[1] = identificador del dueño
+# ARGV[2] = duración del lock en milisegundos
+# Adquiere el lock si está libre o lo renueva si ya es nuestro. Devuelve 1 o 0
+ADQUIRIR_LOCK = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS[1] = clave del lock
+# ARGV[1] = identificador del dueño
+# Libera el lock solo si pertenece a quien lo solicita
+LIBERAR_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] = ratelimit:{endpoint}:{cliente} (hash con tokens y ts en milisegundos)
+# ARGV[1] = capacidad de la cubeta (ráfaga máxima)
+# ARGV[2] = tokens repuestos por segundo
+# ARGV[3] = coste de la petición en tokens
+# Cubeta de tokens: repone los tokens del tiempo transcurrido, descuenta el
+# coste si alcanzan y expira la clave cuando la cubeta volvería a estar llena.
+# El reloj es el del servidor (TIME) para que todos los procesos compartan
+# el mismo aunque sus relojes difieran.
+# Devuelve {1 permitida o 0 limitada, tokens restantes, milisegundos de espera}
+LIMITAR_PETICIONES = """
+local reloj = redis.call('TIME')
+local ahora = tonumber(reloj[1]) * 1000 + math.floor(tonumber(reloj[2]) / 1000)
+local capacidad = tonumber(ARGV[1])
+local por_ms = tonumber(ARGV[2]) / 1000
+local coste = tonumber(ARGV[3])
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(estado[1]) or capacidad
+local ultima = tonumber(estado[2]) or ahora
+tokens = math.min(capacidad, tokens + math.max(ahora - ultima, 0) * por_ms)
+local permitida = 0
+local espera = 0
+if tokens >= coste then
+    tokens = tokens - coste
+    permitida = 1
+else
+    espera = math.ceil((coste - tokens) / por_ms)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', ahora)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacidad - tokens) / por_ms) + 1000)
+return {permitida, math.floor(tokens), espera}
+"""
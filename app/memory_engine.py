@@ -0,0 +1,570 @@
+"""
+Motor de almacenamiento en proceso
+Guarda registros campo -> valor (como los hashes de Redis) con expiración
+opcional, sin servidor. Se usa como backend de MemorySessionManager o como
+caché local (nivel L1) delante de Redis
+
+- Registros en ranuras: cada registro ocupa una posición de listas
+  paralelas (clave, esquema, valores, expiración) que se reutilizan al
+  borrar. Los nombres de campo se guardan una sola vez por esquema (la
+  tupla de campos compartida por todas las sesiones) y cada registro solo
+  guarda la tupla de valores
+- Expiración con una rueda de temporizadores jerárquica: programar y
+  cancelar son O(1) y cada tick solo visita los registros que vencen
+- Persistencia opcional en un archivo de solo anexado (AOF, una operación
+  JSON por línea) que se reproduce al arrancar y se compacta al crecer
+- Conjunto ordenado (lista de saltos) para los índices que se recorren en
+  orden, como el de expiración de MemorySessionManager
+"""
+
+import json
+import math
+import os
+import random
+import threading
+import time
+
+class RuedaTemporal:
+    """
+    Rueda de temporizadores jerárquica (niveles de `ranuras` posiciones)
+    El nivel 0 tiene una ranura por tick; cada nivel superior cubre
+    `ranuras` veces más tiempo y sus ranuras se redistribuyen (cascada)
+    hacia los niveles inferiores al llegar su turno. Con 4 niveles de 64
+    ranuras y ticks de 1 segundo cubre unos 194 días; los vencimientos más
+    lejanos esperan en la última ranura y se reprograman al llegar a ella
+    """
+    def __init__(self, resolucion=1.0, niveles=4, ranuras=64, ahora=None):
+        if ranuras & (ranuras - 1):
+            raise ValueError('El número de ranuras debe ser potencia de 2')
+        self.resolucion = resolucion
+        self._bits = ranuras.bit_length() - 1
+        self._mascara = ranuras - 1
+        self._niveles = [[set() for _ in range(ranuras)] for _ in range(niveles)]
+        self._tick = self._a_tick(time.time() if ahora is None else ahora)
+        self._vence = {}        # id -> tick de vencimiento
+        self._posicion = {}     # id -> (nivel, ranura)
+        
+    def _a_tick(self, instante):
+        return math.ceil(instante / self.resolucion)
+        
+    def _insertar(self, ident, tick):
+        delta = max(tick - self._tick, 1)
+        for nivel in range(len(self._niveles)):
+            if delta < 1 << (self._bits * (nivel + 1)):
+                break
+        else:
+            # Más allá del alcance de la rueda: última ranura alcanzable
+            tick = self._tick + (1 << (self._bits * len(self._niveles))) - 1
+        ranura = (max(tick, self._tick + 1) >> (self._bits * nivel)) & self._mascara
+        self._niveles[nivel][ranura].add(ident)
+        self._posicion[ident] = (nivel, ranura)
+        
+    def programar(self, ident, instante):
+        """Programar (o reprogramar) el vencimiento de ident en el instante epoch indicado"""
+        self.cancelar(ident)
+        tick = self._a_tick(instante)
+        self._vence[ident] = tick
+        self._insertar(ident, tick)
+        
+    def cancelar(self, ident):
+        posicion = self._posicion.pop(ident, None)
+        if posicion is not None:
+            nivel, ranura = posicion
+            self._niveles[nivel][ranura].discard(ident)
+            del self._vence[ident]
+            
+    def avanzar(self, ahora=None):
+        """Avanzar hasta ahora y retornar los ids vencidos"""
+        objetivo = self._a_tick(time.time() if ahora is None else ahora)
+        vencidos = []
+        if not self._vence:
+            self._tick = max(self._tick, objetivo)
+        while self._tick < objetivo:
+            self._tick += 1
+            # Cascada de los niveles superiores cuyo turno empieza en este tick
+            # (de mayor a menor: un nivel puede caer en la ranura del siguiente)
+            nivel = 0
+            while nivel + 1 < len(self._niveles) and self._tick & ((1 << (self._bits * (nivel + 1))) - 1) == 0:
+                nivel += 1
+            for superior in range(nivel, -1, -1):
+                ranura = (self._tick >> (self._bits * superior)) & self._mascara
+                entradas, self._niveles[superior][ranura] = self._niveles[superior][ranura], set()
+                for ident in entradas:
+                    if self._vence[ident] <= self._tick:
+                        del self._vence[ident]
+                        del self._posicion[ident]
+                        vencidos.append(ident)
+                    else:
+                        # Baja de nivel (o sigue aparcado si vence más allá del alcance)
+                        self._insertar(ident, self._vence[ident])
+        return vencidos
+        
+    def __len__(self):
+        return len(self._vence)
+
+class ListaSaltos:
+    """
+    Conjunto ordenado sobre una lista de saltos (skip list): agregar y
+    descartar cuestan O(log n) esperado y el recorrido en orden puede empezar
+    en cualquier valor (ZADD/ZREM/ZRANGEBYSCORE de un Sorted Set). Cada nodo
+    es [valor, siguientes] con un siguiente por nivel
+    """
+    MAX_NIVELES = 32
+    
+    def __init__(self, probabilidad=0.25):
+        self._cabeza = [None, [None] * self.MAX_NIVELES]
+        self._niveles = 1
+        self._longitud = 0
+        self._probabilidad = probabilidad
+        
+    def _previos(self, valor, incluido=False):
+        """Último nodo menor que valor (o igual, si incluido) en cada nivel"""
+        previos = [self._cabeza] * self._niveles
+        nodo = self._cabeza
+        for nivel in range(self._niveles - 1, -1, -1):
+            siguiente = nodo[1][nivel]
+            while siguiente is not None and (siguiente[0] <= valor if incluido else siguiente[0] < valor):
+                nodo, siguiente = siguiente, siguiente[1][nivel]
+            previos[nivel] = nodo
+        return previos
+        
+    def agregar(self, valor):
+        previos = self._previos(valor)
+        siguiente = previos[0][1][0]
+        if siguiente is not None and siguiente[0] == valor:
+            return
+        nivel = 1
+        while nivel < self.MAX_NIVELES and random.random() < self._probabilidad:
+            nivel += 1
+        if nivel > self._niveles:
+            previos += [self._cabeza] * (nivel - self._niveles)
+            self._niveles = nivel
+        nodo = [valor, [None] * nivel]
+        for i in range(nivel):
+            nodo[1][i], previos[i][1][i] = previos[i][1][i], nodo
+        self._longitud += 1
+        
+    def descartar(self, valor):
+        """Quitar valor; retorna False si no estaba"""
+        previos = self._previos(valor)
+        nodo = previos[0][1][0]
+        if nodo is None or nodo[0] != valor:
+            return False
+        for i in range(len(nodo[1])):
+            previos[i][1][i] = nodo[1][i]
+        while self._niveles > 1 and self._cabeza[1][self._niveles - 1] is None:
+            self._niveles -= 1
+        self._longitud -= 1
+        return True
+        
+    def mayores_que(self, valor):
+        """Generador de los valores mayores que valor, en orden"""
+        nodo = self._previos(valor, incluido=True)[0][1][0]
+        while nodo is not None:
+            yield nodo[0]
+            nodo = nodo[1][0]
+            
+    def __iter__(self):
+        nodo = self._cabeza[1][0]
+        while nodo is not None:
+            yield nodo[0]
+            nodo = nodo[1][0]
+            
+    def __len__(self):
+        return self._longitud
+
+class ArchivoAOF:
+    """
+    Registro de operaciones de solo anexado, una lista JSON por línea:
+        ["S", clave, {campos}, expiracion]   guardar (reemplaza)
+        ["H", clave, {campos}]               actualizar campos
+        ["E", clave, expiracion]             fijar la expiración (0 = sin expiración)
+        ["D", clave]                         borrar
+    fsync: 'always' (cada operación), 'everysec' (como mucho una vez por
+    segundo) o 'no' (lo decide el sistema operativo)
+    """
+    def __init__(self, ruta, fsync='everysec'):
+        if fsync not in ('always', 'everysec', 'no'):
+            raise ValueError(f"Política de fsync desconocida: {fsync}")
+        self.ruta = ruta
+        self.fsync = fsync
+        self._archivo = open(ruta, 'a', encoding='utf-8')
+        self._ultimo_fsync = time.monotonic()
+        self._pendiente = False
+        self.operaciones = 0
+        
+    def leer(self):
+        """
+        Generador de las operaciones guardadas. Una línea incompleta o ilegible
+        (escritura cortada por una caída) marca el final fiable del archivo: se
+        trunca ahí para que las nuevas operaciones no se anexen a ella
+        """
+        if not os.path.exists(self.ruta):
+            return
+        valido = 0
+        with open(self.ruta, 'rb') as archivo:
+            for linea in archivo:
+                try:
+                    operacion = json.loads(linea) if linea.endswith(b'\n') else None
+                except ValueError:
+                    operacion = None
+                if operacion is None:
+                    break
+                valido += len(linea)
+                yield operacion
+        if valido < os.path.getsize(self.ruta):
+            self._archivo.flush()
+            os.truncate(self.ruta, valido)
+            
+    def escribir(self, *operacion):
+        self._archivo.write(json.dumps(operacion, separators=(',', ':')) + '\n')
+        self.operaciones += 1
+        self._pendiente = True
+        if self.fsync == 'always':
+            self.sincronizar()
+        else:
+            self.sincronizar_si_toca()
+            
+    def sincronizar(self):
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self._ultimo_fsync = time.monotonic()
+        self._pendiente = False
+        
+    def sincronizar_si_toca(self):
+        """Con 'everysec', fsync si hay escrituras pendientes y pasó un segundo desde el último"""
+        if self.fsync == 'everysec' and self._pendiente and time.monotonic() - self._ultimo_fsync >= 1:
+            self.sincronizar()
+            
+    def reescribir(self, operaciones):
+        """Sustituir el archivo por las operaciones indicadas (compactación atómica)"""
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            cuenta = 0
+            for operacion in operaciones:
+                archivo.write(json.dumps(operacion, separators=(',', ':')) + '\n')
+                cuenta += 1
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        self._archivo.close()
+        os.replace(temporal, self.ruta)
+        self._archivo = open(self.ruta, 'a', encoding='utf-8')
+        self.operaciones = cuenta
+        
+    def cerrar(self):
+        if not self._archivo.closed:
+            self.sincronizar()
+            self._archivo.close()
+
+class MotorMemoria:
+    """
+    Almacén clave -> registro (campos de texto) con expiración
+    Los métodos son atómicos; `lock` (reentrante) permite agrupar varias
+    operaciones en una sola sección atómica, como un script Lua en Redis.
+    al_expirar(clave, datos) se invoca (con el lock tomado) por cada
+    registro que vence, para que el dueño limpie sus índices
+    max_registros > 0 limita el tamaño: al superarlo se desaloja con el
+    algoritmo del reloj (segunda oportunidad), una aproximación de LRU que
+    solo necesita un bit por ranura
+    """
+    def __init__(self, resolucion=1.0, max_registros=0, aof_path=None, aof_fsync='everysec',
+                 aof_rewrite_min=10000, al_expirar=None):
+        self.lock = threading.RLock()
+        self.max_registros = max_registros
+        self.aof_rewrite_min = aof_rewrite_min
+        self.al_expirar = al_expirar
+        
+        self._ranura = {}           # clave -> ranura
+        self._claves = []           # ranura -> clave (None si está libre)
+        self._esquema = []          # ranura -> índice en _esquemas
+        self._valores = []          # ranura -> tupla de valores
+        self._expira = []           # ranura -> expiración epoch (0 = sin expiración)
+        self._referenciada = bytearray()
+        self._libres = []
+        self._esquemas = []         # tuplas de nombres de campo compartidas
+        self._indice_esquemas = {}  # tupla de campos -> índice
+        self._manecilla = 0
+        self._rueda = RuedaTemporal(resolucion)
+        
+        self.expirados = 0
+        self.desalojados = 0
+        
+        self._aof = None
+        if aof_path:
+            self._aof = ArchivoAOF(aof_path, aof_fsync)
+            self._reproducir()
+            
+    def _id_esquema(self, campos):
+        esquema = tuple(campos)
+        indice = self._indice_esquemas.get(esquema)
+        if indice is None:
+            indice = len(self._esquemas)
+            self._esquemas.append(esquema)
+            self._indice_esquemas[esquema] = indice
+        return indice
+        
+    def _ocupar(self, clave):
+        if self._libres:
+            ranura = self._libres.pop()
+            self._claves[ranura] = clave
+        else:
+            ranura = len(self._claves)
+            self._claves.append(clave)
+            self._esquema.append(0)
+            self._valores.append(())
+            self._expira.append(0)
+            self._referenciada.append(0)
+        self._ranura[clave] = ranura
+        return ranura
+        
+    def _liberar(self, ranura):
+        self._rueda.cancelar(ranura)
+        del self._ranura[self._claves[ranura]]
+        self._claves[ranura] = None
+        self._valores[ranura] = ()
+        self._expira[ranura] = 0
+        self._referenciada[ranura] = 0
+        self._libres.append(ranura)
+        
+    def _datos(self, ranura):
+        return dict(zip(self._esquemas[self._esquema[ranura]], self._valores[ranura]))
+        
+    def _escribir(self, ranura, datos):
+        self._esquema[ranura] = self._id_esquema(datos)
+        self._valores[ranura] = tuple(datos.values())
+        
+    def _fijar_expiracion(self, ranura, expiracion):
+        self._expira[ranura] = expiracion
+        if expiracion:
+            self._rueda.programar(ranura, expiracion)
+        else:
+            self._rueda.cancelar(ranura)
+            
+    def _vigente(self, clave):
+        """Ranura del registro si existe y no ha vencido (los vencidos se eliminan al tocarlos)"""
+        ranura = self._ranura.get(clave)
+        if ranura is None:
+            return None
+        expiracion = self._expira[ranura]
+        if expiracion and expiracion <= time.time():
+            self._expirar(ranura)
+            return None
+        return ranura
+        
+    def _expirar(self, ranura):
+        clave, datos = self._claves[ranura], self._datos(ranura)
+        self._liberar(ranura)
+        self.expirados += 1
+        if self._aof:
+            self._aof.escribir('D', clave)
+        if self.al_expirar:
+            self.al_expirar(clave, datos)
+            
+    def _desalojar(self):
+        """Reloj: avanzar la manecilla quitando bits de referencia hasta un registro no usado"""
+        while len(self._ranura) > self.max_registros:
+            ranura = self._manecilla
+            self._manecilla = (self._manecilla + 1) % len(self._claves)
+            if self._claves[ranura] is None:
+                continue
+            if self._referenciada[ranura]:
+                self._referenciada[ranura] = 0
+                continue
+            clave = self._claves[ranura]
+            self._liberar(ranura)
+            self.desalojados += 1
+            if self._aof:
+                self._aof.escribir('D', clave)
+                
+    def guardar(self, clave, campos, ttl=None):
+        """Crear o reemplazar un registro; ttl en segundos (None = sin expiración)"""
+        with self.lock:
+            datos = {campo: str(valor) for campo, valor in campos.items()}
+            ranura = self._ranura.get(clave)
+            if ranura is None:
+                ranura = self._ocupar(clave)
+            self._escribir(ranura, datos)
+            expiracion = time.time() + ttl if ttl else 0
+            self._fijar_expiracion(ranura, expiracion)
+            if self._aof:
+                self._aof.escribir('S', clave, datos, expiracion)
+                self._compactar_si_toca()
+            if self.max_registros:
+                self._desalojar()
+                
+    def actualizar(self, clave, campos):
+        """Añadir o cambiar campos de un registro (lo crea si no existe, sin expiración)"""
+        with self.lock:
+            cambios = {campo: str(valor) for campo, valor in campos.items()}
+            ranura = self._vigente(clave)
+            if ranura is None:
+                ranura = self._ocupar(clave)
+                datos = cambios
+            else:
+                datos = self._datos(ranura)
+                datos.update(cambios)
+            self._escribir(ranura, datos)
+            if self._aof:
+                self._aof.escribir('H', clave, cambios)
+                self._compactar_si_toca()
+            if self.max_registros:
+                self._desalojar()
+                
+    def leer(self, clave):
+        """Campos del registro o None si no existe"""
+        with self.lock:
+            ranura = self._vigente(clave)
+            if ranura is None:
+                return None
+            self._referenciada[ranura] = 1
+            return self._datos(ranura)
+            
+    def existe(self, clave):
+        with self.lock:
+            return self._vigente(clave) is not None
+            
+    def expirar(self, clave, ttl):
+        """Fijar el TTL en segundos (None o 0 = sin expiración); retorna False si no existe"""
+        with self.lock:
+            ranura = self._vigente(clave)
+            if ranura is None:
+                return False
+            expiracion = time.time() + ttl if ttl else 0
+            self._fijar_expiracion(ranura, expiracion)
+            if self._aof:
+                self._aof.escribir('E', clave, expiracion)
+            return True
+            
+    def ttl(self, clave):
+        """Segundos restantes como el comando TTL: -2 si no existe, -1 si no expira"""
+        with self.lock:
+            ranura = self._vigente(clave)
+            if ranura is None:
+                return -2
+            if not self._expira[ranura]:
+                return -1
+            return max(int(self._expira[ranura] - time.time()), 0)
+            
+    def expiracion(self, clave):
+        """Instante epoch de expiración, 0 si no expira o None si no existe"""
+        with self.lock:
+            ranura = self._vigente(clave)
+            return None if ranura is None else self._expira[ranura]
+            
+    def eliminar(self, *claves):
+        """Borrar registros; retorna cuántos existían"""
+        with self.lock:
+            borrados = 0
+            for clave in claves:
+                ranura = self._vigente(clave)
+                if ranura is not None:
+                    self._liberar(ranura)
+                    borrados += 1
+                    if self._aof:
+                        self._aof.escribir('D', clave)
+            return borrados
+            
+    def avanzar(self, ahora=None):
+        """
+        Procesar los vencimientos pendientes de la rueda (y el fsync diferido
+        del AOF); retorna cuántos registros vencieron
+        """
+        with self.lock:
+            vencidos = 0
+            instante = time.time() if ahora is None else ahora
+            for ranura in self._rueda.avanzar(instante):
+                # La rueda trabaja con ticks enteros: se confirma el instante exacto
+                if self._claves[ranura] is None:
+                    continue
+                if self._expira[ranura] and self._expira[ranura] <= instante:
+                    self._expirar(ranura)
+                    vencidos += 1
+                elif self._expira[ranura]:
+                    self._rueda.programar(ranura, self._expira[ranura])
+            if self._aof:
+                self._aof.sincronizar_si_toca()
+            return vencidos
+            
+    def claves(self, prefijo=''):
+        """Lista de claves vigentes que empiezan por prefijo"""
+        with self.lock:
+            ahora = time.time()
+            return [
+                clave for clave, ranura in self._ranura.items()
+                if clave.startswith(prefijo) and not (self._expira[ranura] and self._expira[ranura] <= ahora)
+            ]
+            
+    def vaciar(self):
+        with self.lock:
+            for ranura in list(self._ranura.values()):
+                self._liberar(ranura)
+            if self._aof:
+                self._aof.reescribir([])
+                
+    def __len__(self):
+        return len(self._ranura)
+        
+    def _reproducir(self):
+        """Reconstruir el estado a partir del AOF (sin volver a escribirlo)"""
+        aof, self._aof = self._aof, None
+        ahora = time.time()
+        operaciones = 0
+        for operacion in aof.leer():
+            operaciones += 1
+            tipo, clave = operacion[0], operacion[1]
+            if tipo == 'S':
+                ranura = self._ranura.get(clave)
+                if ranura is None:
+                    ranura = self._ocupar(clave)
+                self._escribir(ranura, operacion[2])
+                self._fijar_expiracion(ranura, operacion[3])
+            elif tipo == 'H':
+                ranura = self._ranura.get(clave)
+                if ranura is None:
+                    ranura = self._ocupar(clave)
+                    self._escribir(ranura, operacion[2])
+                else:
+                    self._escribir(ranura, {**self._datos(ranura), **operacion[2]})
+            elif tipo == 'E' and clave in self._ranura:
+                self._fijar_expiracion(self._ranura[clave], operacion[2])
+            elif tipo == 'D' and clave in self._ranura:
+                self._liberar(self._ranura[clave])
+        # Lo que venció mientras el proceso estaba parado no se recupera
+        for clave, ranura in list(self._ranura.items()):
+            if self._expira[ranura] and self._expira[ranura] <= ahora:
+                self._liberar(ranura)
+        aof.operaciones = operaciones
+        self._aof = aof
+        self._compactar_si_toca()
+        
+    def _compactar_si_toca(self):
+        if self._aof.operaciones > max(self.aof_rewrite_min, 2 * len(self._ranura)):
+            self.reescribir_aof()
+            
+    def reescribir_aof(self):
+        """Compactar el AOF a una operación 'S' por registro vigente"""
+        with self.lock:
+            if self._aof:
+                self._aof.reescribir(
+                    ['S', clave, self._datos(ranura), self._expira[ranura]]
+                    for clave, ranura in self._ranura.items()
+                )
+                
+    def cerrar(self):
+        """Sincronizar y cerrar el AOF"""
+        with self.lock:
+            if self._aof:
+                self._aof.cerrar()
+                
+    def estadisticas(self):
+        with self.lock:
+            return {
+                'registros': len(self._ranura),
+                'ranuras': len(self._claves),
+                'ranuras_libres': len(self._libres),
+                'esquemas': len(self._esquemas),
+                'temporizadores': len(self._rueda),
+                'expirados': self.expirados,
+                'desalojados': self.desalojados,
+                'aof_operaciones': self._aof.operaciones if self._aof else None
+            }
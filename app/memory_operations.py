@@ -0,0 +1,409 @@
+import heapq
+import itertools
+import time
+import uuid
+from datetime import datetime
+
+import lua_scripts
+import metricas
+from memory_engine import ListaSaltos, MotorMemoria
+from redis_operations import (
+    SESSION_TTL, BATCH_CHUNK_SIZE, _validar_sesiones, _crear_validador, _parsear_cursor, _cubetas_analitica,
+    _escrituras_actividad
+)
+from session_codec import CODECS, obtener_codec, decodificar_sesion, formato_sesion
+
+class MemorySessionManager:
+    """
+    Gestor de sesiones sobre el motor en proceso (MotorMemoria), sin Redis
+    Expone los mismos métodos públicos que RedisSessionManager, de modo que
+    la aplicación elige el backend con SESSION_BACKEND sin más cambios.
+    Los datos (sesiones y perfiles) viven en el motor; los índices
+    (propietario, sesiones por usuario, expiración, ranking y analítica) se
+    derivan de ellos y se reconstruyen al arrancar desde el AOF.
+    El estado es del proceso: con varios procesos cada uno tendría el suyo
+    """
+    def __init__(self, sliding_expiration=True, refresh_interval=60, codec='hash', max_sessions_per_user=0,
+                 token_secrets=None, token_max_age=86400, accept_unsigned_tokens=True, revoked_filter_size=0,
+                 aof_path=None, aof_fsync='everysec'):
+        """
+        aof_path activa la persistencia en un archivo de solo anexado
+        (aof_fsync: 'always', 'everysec' o 'no'); sin él las sesiones se
+        pierden al reiniciar el proceso. El resto de parámetros tienen el
+        mismo significado que en RedisSessionManager
+        """
+        self.sliding_expiration = sliding_expiration
+        self.refresh_interval = refresh_interval
+        self.codec = obtener_codec(codec)
+        self.max_sessions_per_user = max_sessions_per_user
+        self.validador = _crear_validador(token_secrets, token_max_age, accept_unsigned_tokens, revoked_filter_size)
+        
+        self._propietarios = {}         # token -> user_id
+        self._sesiones_usuario = {}     # user_id -> {token: creación}, en orden de creación
+        self._ranking = {}              # user_id -> última creación de sesión
+        self._indice_expiracion = ListaSaltos()     # (expiración, token) en orden
+        self._expiraciones = {}                     # token -> expiración
+        self._cubetas = {nombre: {} for nombre in lua_scripts.CUBETAS_ANALITICA}
+        
+        self.motor = MotorMemoria(aof_path=aof_path, aof_fsync=aof_fsync, al_expirar=self._al_expirar)
+        self.lock = self.motor.lock
+        self._reconstruir_indices()
+        
+    def _reconstruir_indices(self):
+        """Derivar los índices de las sesiones del motor (tras reproducir el AOF)"""
+        with self.lock:
+            sesiones = []
+            for clave in self.motor.claves('session:'):
+                datos = decodificar_sesion(self.motor.leer(clave))
+                if datos:
+                    creada = datetime.fromisoformat(datos['created_at']).timestamp()
+                    sesiones.append((creada, clave[len('session:'):], datos['user_id']))
+            for creada, token, user_id in sorted(sesiones):
+                expiracion = self.motor.expiracion(f"session:{token}")
+                if not expiracion:
+                    # Sesión sin expiración (0): recibe el TTL normal, como al crearla
+                    # y como hace ELIMINAR_EXPIRADAS con las claves sin TTL en Redis
+                    self.motor.expirar(f"session:{token}", SESSION_TTL)
+                    expiracion = self.motor.expiracion(f"session:{token}")
+                self._indexar(token, user_id, creada, expiracion)
+                
+    def _indexar(self, token, user_id, creada, expiracion):
+        self._propietarios[token] = user_id
+        self._sesiones_usuario.setdefault(user_id, {})[token] = creada
+        self._ranking[user_id] = max(self._ranking.get(user_id, 0), creada)
+        self._fijar_expiracion(token, expiracion)
+        
+    def _fijar_expiracion(self, token, expiracion):
+        anterior = self._expiraciones.pop(token, None)
+        if anterior is not None:
+            self._indice_expiracion.descartar((anterior, token))
+        if expiracion is not None:
+            self._expiraciones[token] = expiracion
+            self._indice_expiracion.agregar((expiracion, token))
+            
+    def _desindexar(self, token):
+        """Quitar el token de los índices; el usuario sale del ranking si no le quedan sesiones"""
+        self._fijar_expiracion(token, None)
+        user_id = self._propietarios.pop(token, None)
+        if user_id is not None:
+            sesiones = self._sesiones_usuario.get(user_id, {})
+            sesiones.pop(token, None)
+            if not sesiones:
+                self._sesiones_usuario.pop(user_id, None)
+                self._ranking.pop(user_id, None)
+                
+    def _al_expirar(self, clave, datos):
+        """Callback del motor (con el lock tomado) por cada registro vencido"""
+        if clave.startswith('session:'):
+            token = clave[len('session:'):]
+            self._desindexar(token)
+            if self.validador:
+                self.validador.revocar(token)
+                
+    def _cerrar_token(self, token):
+        """Borrar la sesión y sus índices; retorna True si existía"""
+        existia = self.motor.eliminar(f"session:{token}") > 0
+        self._desindexar(token)
+        return existia
+        
+    def _registrar_actividad(self, ahora, user_id, creada):
+        """Anotar al usuario (y la sesión creada) en la cubeta actual de cada granularidad"""
+        ahora = int(ahora)
+        for nombre, (segundos, retencion) in lua_scripts.CUBETAS_ANALITICA.items():
+            cubetas = self._cubetas[nombre]
+            # Las cubetas se crean en orden: las vencidas están al principio
+            while cubetas and next(iter(cubetas)) + retencion <= ahora:
+                del cubetas[next(iter(cubetas))]
+            cubeta = cubetas.setdefault(ahora - ahora % segundos, [set(), 0])
+            cubeta[0].add(user_id)
+            if creada:
+                cubeta[1] += 1
+                
+    def _tokens_aceptados(self, session_tokens):
+        """Índices de los tokens que merecen una consulta al motor"""
+        if self.validador is None:
+            return list(range(len(session_tokens)))
+        return [i for i, token in enumerate(session_tokens) if self.validador.aceptar(token)]
+        
+    def ping(self):
+        """El motor está siempre disponible en el propio proceso"""
+        return True
+        
+    def estadisticas_cache(self):
+        """Sin caché local: los datos ya están en el proceso"""
+        return None
+        
+    def estadisticas_replicas(self):
+        return None
+        
+    def estadisticas_tokens(self):
+        """Tokens rechazados sin consultar el motor (por motivo) o None si no hay validación"""
+        return self.validador.estadisticas() if self.validador else None
+        
+    def estadisticas_motor(self):
+        """Registros, ranuras, temporizadores y operaciones del AOF del motor"""
+        return self.motor.estadisticas()
+        
+    def cerrar(self):
+        """Sincronizar y cerrar el AOF"""
+        self.motor.cerrar()
+        
+    @metricas.medir
+    def crear_sesion(self, user_id, username, email):
+        """
+        Crear una nueva sesión de usuario
+        Patrón de clave: session:{token} (registro con TTL en el motor)
+        Guarda también el perfil, los índices, el ranking y la analítica en
+        una sola sección atómica
+        """
+        session_token = str(uuid.uuid4())
+        if self.validador:
+            session_token = self.validador.generar(session_token)
+        ahora = datetime.now()
+        campos = self.codec.campos(user_id, username, email, ahora)
+        sesion = {
+            campo: valor.decode('utf-8', 'surrogateescape') if isinstance(valor, bytes) else valor
+            for campo, valor in zip(campos[::2], campos[1::2])
+        }
+        user_id = str(user_id)
+        
+        with self.lock:
+            self.motor.avanzar()
+            self.motor.guardar(f"session:{session_token}", sesion, ttl=SESSION_TTL)
+            if self.codec.duplica_perfil:
+                self.motor.actualizar(f"user:{{{user_id}}}:profile", {
+                    'user_id': user_id, 'username': username, 'email': email, 'updated_at': ahora.isoformat()
+                })
+            self._indexar(session_token, user_id, ahora.timestamp(), ahora.timestamp() + SESSION_TTL)
+            self._registrar_actividad(ahora.timestamp(), user_id, True)
+            
+            desalojados = []
+            if self.max_sessions_per_user > 0:
+                sesiones = self._sesiones_usuario[user_id]
+                while len(sesiones) > self.max_sessions_per_user:
+                    token = next(iter(sesiones))
+                    if self._cerrar_token(token):
+                        desalojados.append(token)
+        if desalojados and self.validador:
+            self.validador.revocar(*desalojados)
+        return session_token
+        
+    @metricas.medir
+    def crear_sesiones(self, sesiones):
+        """
+        Crear varias sesiones por lotes
+        Cada elemento es un dict con user_id, username y email
+        Retorna una lista de resultados, uno por elemento:
+        {'ok': True, 'token': ...} o {'ok': False, 'error': ...}
+        """
+        resultados, validas = _validar_sesiones(sesiones)
+        for i in validas:
+            token = self.crear_sesion(sesiones[i]['user_id'], sesiones[i]['username'], sesiones[i]['email'])
+            resultados[i] = {'ok': True, 'token': token}
+        return resultados
+        
+    @metricas.medir
+    def obtener_sesion(self, session_token, use_primary=False):
+        """
+        Obtener información de una sesión
+        Como mucho una vez por refresh_interval actualiza last_activity y
+        renueva el TTL (expiración deslizante)
+        """
+        return self.obtener_sesiones([session_token])[0]
+        
+    @metricas.medir
+    def obtener_sesiones(self, session_tokens, use_primary=False):
+        """
+        Obtener varias sesiones
+        Retorna una lista con los datos de cada sesión o None si no existe
+        """
+        resultados = [None] * len(session_tokens)
+        with self.lock:
+            self.motor.avanzar()
+            for i in self._tokens_aceptados(session_tokens):
+                resultados[i] = self._leer_sesion(session_tokens[i])
+        return resultados
+        
+    def _leer_sesion(self, session_token):
+        """Misma lógica que el script OBTENER_SESION"""
+        clave = f"session:{session_token}"
+        datos = self.motor.leer(clave)
+        if datos is None:
+            return None
+        ahora = datetime.now()
+        renovar, anotar = _escrituras_actividad(datos, ahora.timestamp(), self.refresh_interval)
+        if renovar:
+            if 'd' in datos:
+                self.motor.actualizar(clave, {'a': int(ahora.timestamp())})
+            else:
+                self.motor.actualizar(clave, {'last_activity': ahora.isoformat(), 'last_activity_ts': ahora.timestamp()})
+            if self.sliding_expiration:
+                self.motor.expirar(clave, SESSION_TTL)
+                self._fijar_expiracion(session_token, ahora.timestamp() + SESSION_TTL)
+        if anotar:
+            campo = CODECS[formato_sesion(datos)].campo_cubeta
+            self.motor.actualizar(clave, {campo: int(ahora.timestamp() // lua_scripts.CUBETA_MINIMA)})
+            user_id = self._propietarios.get(session_token)
+            if user_id is not None:
+                self._registrar_actividad(ahora.timestamp(), user_id, False)
+        return decodificar_sesion(datos)
+        
+    @metricas.medir
+    def actualizar_perfil_usuario(self, user_id, username, email):
+        """
+        Actualizar perfil de usuario
+        Patrón: user:{user_id}:profile
+        """
+        self.motor.actualizar(f"user:{{{user_id}}}:profile", {
+            'user_id': user_id,
+            'username': username,
+            'email': email,
+            'updated_at': datetime.now().isoformat()
+        })
+        
+    @metricas.medir
+    def cerrar_sesion(self, session_token):
+        """
+        Cerrar sesión eliminando el token
+        Retorna True si la sesión existía
+        """
+        return self.cerrar_sesiones([session_token])[0]
+        
+    @metricas.medir
+    def cerrar_sesiones(self, session_tokens):
+        """
+        Cerrar varias sesiones en una sola llamada
+        Retorna una lista de booleanos, uno por token, en el mismo orden
+        """
+        resultados = [False] * len(session_tokens)
+        aceptados = self._tokens_aceptados(session_tokens)
+        with self.lock:
+            for i in aceptados:
+                resultados[i] = self._cerrar_token(session_tokens[i])
+        if self.validador:
+            self.validador.revocar(*[session_tokens[i] for i in aceptados])
+        return resultados
+        
+    @metricas.medir
+    def cerrar_sesiones_usuario(self, user_id):
+        """
+        Cerrar todas las sesiones de un usuario
+        Retorna el número de sesiones cerradas
+        """
+        with self.lock:
+            tokens = list(self._sesiones_usuario.get(str(user_id), {}))
+            cerradas = sum(self._cerrar_token(token) for token in tokens)
+        if self.validador:
+            self.validador.revocar(*tokens)
+        return cerradas
+        
+    @metricas.medir
+    def obtener_estadisticas(self, use_primary=False):
+        """Obtener estadísticas del sistema (mismo formato que RedisSessionManager)"""
+        with self.lock:
+            # Tras avanzar la rueda, todas las sesiones indexadas están vivas
+            self.motor.avanzar()
+            vivas = len(self._expiraciones)
+            recientes = heapq.nlargest(5, self._ranking.items(), key=lambda usuario: usuario[1])
+            return {
+                'sesiones_activas': vivas,
+                'usuarios_en_ranking': len(self._ranking),
+                'usuarios_recientes': recientes[::-1]
+            }
+            
+    @metricas.medir
+    def obtener_analitica(self, ventana=3600, granularidad=None, use_primary=False):
+        """
+        Usuarios únicos activos y sesiones creadas en los últimos `ventana`
+        segundos, en total y por cubeta. En memoria las cuentas son exactas
+        (un conjunto de usuarios por cubeta en lugar de un HyperLogLog)
+        """
+        granularidad, inicios = _cubetas_analitica(ventana, granularidad, time.time())
+        with self.lock:
+            cubetas = [self._cubetas[granularidad].get(inicio, (set(), 0)) for inicio in inicios]
+            return {
+                'ventana': ventana,
+                'granularidad': granularidad,
+                'usuarios_unicos': len(set().union(*(usuarios for usuarios, _ in cubetas))),
+                'sesiones_creadas': sum(creadas for _, creadas in cubetas),
+                'serie': [
+                    {'inicio': inicio, 'usuarios_unicos': len(usuarios), 'sesiones_creadas': creadas}
+                    for inicio, (usuarios, creadas) in zip(inicios, cubetas)
+                ]
+            }
+            
+    @metricas.medir
+    def reconciliar_contador(self, max_items=1000):
+        """El contador se deriva del índice, así que nunca tiene deriva"""
+        vivas = self.obtener_estadisticas()['sesiones_activas']
+        return {'sesiones_activas': vivas, 'deriva': 0, 'huerfanas_eliminadas': 0, 'vuelta_completa': True}
+        
+    @metricas.medir
+    def listar_sesiones_activas(self, use_primary=False):
+        """Listar todas las sesiones activas"""
+        return list(self.iterar_sesiones_activas())
+        
+    def iterar_sesiones_activas(self, batch_size=BATCH_CHUNK_SIZE, use_primary=False):
+        """Generador de sesiones activas leídas por páginas de batch_size"""
+        cursor = None
+        while True:
+            pagina = self.listar_sesiones_paginado(limit=batch_size, cursor=cursor)
+            yield from pagina['sesiones']
+            cursor = pagina['cursor']
+            if not cursor:
+                return
+                
+    @metricas.medir
+    def listar_sesiones_paginado(self, limit=100, cursor=None, use_primary=False):
+        """
+        Listar sesiones activas ordenadas por expiración, una página a la vez
+        Mismo cursor que RedisSessionManager ('expiración:token')
+        Retorna {'sesiones': [...], 'cursor': siguiente cursor o None}
+        """
+        cursor_expiracion, cursor_token = _parsear_cursor(cursor)
+        with self.lock:
+            self.motor.avanzar()
+            inicio = (time.time(), '\uffff')
+            if cursor_token:
+                inicio = max(inicio, (float(cursor_expiracion), cursor_token))
+            entradas = list(itertools.islice(self._indice_expiracion.mayores_que(inicio), limit))
+            sesiones = []
+            for expiracion, token in entradas:
+                datos = decodificar_sesion(self.motor.leer(f"session:{token}"))
+                if datos:
+                    datos['token'] = token
+                    datos['ttl'] = self.motor.ttl(f"session:{token}")
+                    sesiones.append(datos)
+                    
+        siguiente = None
+        if len(entradas) == limit:
+            siguiente = f"{entradas[-1][0]}:{entradas[-1][1]}"
+        return {'sesiones': sesiones, 'cursor': siguiente}
+        
+    def reconstruir_indice_expiracion(self):
+        """Los índices se derivan al arrancar: no hay nada que migrar"""
+        return 0
+        
+    def reconstruir_indices_usuario(self):
+        return 0
+        
+    @metricas.medir
+    def eliminar_sesiones_expiradas(self, max_items=BATCH_CHUNK_SIZE):
+        """
+        Procesar los vencimientos pendientes de la rueda de temporizadores
+        (normalmente ya los procesa cualquier operación)
+        Retorna (sesiones eliminadas, sesiones reindexadas)
+        """
+        return self.motor.avanzar(), 0
+        
+    @metricas.medir
+    def contar_sesiones_vencidas(self):
+        """Sesiones vencidas que la rueda aún no ha procesado"""
+        with self.lock:
+            ahora = time.time()
+            return sum(1 for _ in itertools.takewhile(lambda entrada: entrada[0] <= ahora, self._indice_expiracion))
+            
+    @metricas.medir
+    def limpiar_sesiones_expiradas(self, max_items=1000):
+        """Retorna el número de sesiones eliminadas"""
+        return self.motor.avanzar()
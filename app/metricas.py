@@ -0,0 +1,212 @@
+"""
+Métricas Prometheus del servicio de sesiones
+- Latencia y errores por comando Redis (cliente instrumentado)
+- Latencia y errores por método de RedisSessionManager
+- Conexiones en uso/libres de cada pool
+- Viajes de red a Redis y latencia por petición HTTP
+- Registro de llamadas lentas (logger 'sesiones.lentas')
+- Decisiones del control de admisión y peticiones en curso
+La instrumentación solo se activa con activar(); sin prometheus_client
+todo queda desactivado y los clientes son redis.Redis normales
+"""
+
+import contextvars
+import functools
+import hashlib
+import logging
+import time
+
+import redis
+from redis.client import Pipeline
+
+import lua_scripts
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+except ImportError:
+    Histogram = None
+
+DISPONIBLE = Histogram is not None
+
+log_lentas = logging.getLogger('sesiones.lentas')
+
+_activo = False
+_umbral_lento = 0.1
+
+# Nombre de cada script Lua por su SHA1, para etiquetar EVALSHA
+_NOMBRES_SCRIPTS = {
+    hashlib.sha1(texto.encode('utf-8')).hexdigest(): nombre
+    for nombre, texto in vars(lua_scripts).items()
+    if nombre.isupper() and isinstance(texto, str)
+}
+
+# Contador de viajes a Redis de la petición en curso
+_viajes = contextvars.ContextVar('viajes_redis', default=None)
+
+if DISPONIBLE:
+    _BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+    
+    COMANDO_DURACION = Histogram(
+        'redis_command_duration_seconds', 'Latencia de cada viaje a Redis por comando',
+        ['command'], buckets=_BUCKETS
+    )
+    COMANDO_ERRORES = Counter(
+        'redis_command_errors_total', 'Errores de comandos Redis', ['command', 'error']
+    )
+    METODO_DURACION = Histogram(
+        'session_manager_method_duration_seconds', 'Latencia de los métodos de RedisSessionManager',
+        ['method'], buckets=_BUCKETS
+    )
+    METODO_ERRORES = Counter(
+        'session_manager_method_errors_total', 'Excepciones en métodos de RedisSessionManager',
+        ['method', 'error']
+    )
+    POOL_CONEXIONES = Gauge(
+        'redis_pool_connections', 'Conexiones del pool por nodo y estado', ['node', 'state']
+    )
+    PETICION_DURACION = Histogram(
+        'http_request_duration_seconds', 'Latencia de las peticiones HTTP',
+        ['endpoint', 'status'], buckets=_BUCKETS
+    )
+    PETICION_VIAJES = Histogram(
+        'http_request_redis_round_trips', 'Viajes de red a Redis por petición HTTP',
+        ['endpoint'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+    )
+    LIMITADOR_DECISIONES = Counter(
+        'rate_limiter_decisions_total', 'Decisiones del control de admisión por endpoint',
+        ['endpoint', 'decision']
+    )
+    PETICIONES_EN_CURSO = Gauge(
+        'http_requests_in_flight', 'Peticiones admitidas que aún no han terminado'
+    )
+
+def activar(umbral_lento_ms=100):
+    """Activar la instrumentación (clientes y métodos) y fijar el umbral de llamada lenta"""
+    global _activo, _umbral_lento
+    if not DISPONIBLE:
+        raise RuntimeError('Las métricas requieren el paquete prometheus_client')
+    _activo = True
+    _umbral_lento = umbral_lento_ms / 1000
+
+def activo():
+    return _activo
+
+def _nombre_comando(args):
+    comando = str(args[0]).upper() if args else '?'
+    if comando == 'EVALSHA' and len(args) > 1:
+        return f"EVALSHA {_NOMBRES_SCRIPTS.get(args[1], 'desconocido')}"
+    return comando
+
+def _registrar_comando(comando, duracion, error):
+    """Registrar un viaje a Redis (comando suelto o pipeline completo)"""
+    COMANDO_DURACION.labels(comando).observe(duracion)
+    if error:
+        COMANDO_ERRORES.labels(comando, error).inc()
+    viajes = _viajes.get()
+    if viajes is not None:
+        viajes[0] += 1
+    if duracion >= _umbral_lento:
+        # Solo el comando: los argumentos incluyen tokens de sesión
+        log_lentas.warning("Comando Redis lento: %s %.1f ms", comando, duracion * 1000)
+
+class PipelineInstrumentado(Pipeline):
+    """Pipeline que mide cada execute() como un único viaje de red"""
+    def execute(self, raise_on_error=True):
+        if not self.command_stack:
+            return super().execute(raise_on_error)
+        inicio = time.perf_counter()
+        error = None
+        try:
+            return super().execute(raise_on_error)
+        except redis.RedisError as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _registrar_comando('PIPELINE', time.perf_counter() - inicio, error)
+            
+    def immediate_execute_command(self, *args, **options):
+        # SCRIPT EXISTS/LOAD que redis-py envía antes de un pipeline con scripts
+        inicio = time.perf_counter()
+        error = None
+        try:
+            return super().immediate_execute_command(*args, **options)
+        except redis.RedisError as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _registrar_comando(_nombre_comando(args), time.perf_counter() - inicio, error)
+
+class RedisInstrumentado(redis.Redis):
+    """Cliente Redis que mide la latencia y los errores de cada comando"""
+    def execute_command(self, *args, **options):
+        inicio = time.perf_counter()
+        error = None
+        try:
+            return super().execute_command(*args, **options)
+        except redis.RedisError as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _registrar_comando(_nombre_comando(args), time.perf_counter() - inicio, error)
+            
+    def pipeline(self, transaction=True, shard_hint=None):
+        return PipelineInstrumentado(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+def clase_cliente():
+    """Clase de cliente Redis a usar: instrumentada si las métricas están activas"""
+    return RedisInstrumentado if _activo else redis.Redis
+
+def registrar_pool(nodo, pool):
+    """Publicar las conexiones en uso y libres de un pool"""
+    if not _activo:
+        return
+    POOL_CONEXIONES.labels(nodo, 'in_use').set_function(lambda: len(pool._in_use_connections))
+    POOL_CONEXIONES.labels(nodo, 'available').set_function(lambda: len(pool._available_connections))
+
+def medir(metodo):
+    """Decorador: latencia, errores y registro lento de un método del manager"""
+    nombre = metodo.__name__
+    
+    @functools.wraps(metodo)
+    def envoltura(*args, **kwargs):
+        if not _activo:
+            return metodo(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args, **kwargs)
+        except Exception as e:
+            METODO_ERRORES.labels(nombre, type(e).__name__).inc()
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            METODO_DURACION.labels(nombre).observe(duracion)
+            if duracion >= _umbral_lento:
+                log_lentas.warning("Llamada lenta: %s %.1f ms", nombre, duracion * 1000)
+    return envoltura
+
+def iniciar_peticion():
+    """Empezar a contar los viajes a Redis de una petición; retorna el estado a cerrar"""
+    viajes = [0]
+    return viajes, _viajes.set(viajes), time.perf_counter()
+
+def finalizar_peticion(estado, endpoint, status):
+    """Registrar latencia y viajes a Redis de la petición iniciada con iniciar_peticion"""
+    viajes, token, inicio = estado
+    _viajes.reset(token)
+    endpoint = endpoint or 'desconocido'
+    PETICION_DURACION.labels(endpoint, str(status)).observe(time.perf_counter() - inicio)
+    PETICION_VIAJES.labels(endpoint).observe(viajes[0])
+
+def registrar_decision(endpoint, decision):
+    """Contar una decisión del limitador ('permitida', 'limitada', 'saturada' o 'error')"""
+    if _activo:
+        LIMITADOR_DECISIONES.labels(endpoint or 'desconocido', decision).inc()
+
+def registrar_en_curso(funcion):
+    """Publicar las peticiones en curso leyendo funcion() en cada exportación"""
+    if _activo:
+        PETICIONES_EN_CURSO.set_function(funcion)
+
+def exportar():
+    """(cuerpo, content-type) en formato de texto de Prometheus"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+
+from memory_engine import MotorMemoria
+
+# Canal Pub/Sub por el que se anuncian los tokens de sesiones cerradas
+CANAL_INVALIDACION = 'sessions:invalidate'
+
+class NearCache:
+    """
+    Caché en proceso (LRU + TTL) para datos de sesión
+    Evita un HGETALL por cada validación de tokens muy consultados
+    """
+    def __init__(self, max_entries=10000, ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # token -> (instante de expiración, datos)
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación; permite descartar lecturas
+        # de Redis que compitieron con un cierre de sesión
+        self.version = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        
+    def obtener(self, token):
+        """Retorna una copia de los datos cacheados o None"""
+        with self._lock:
+            entrada = self._entradas.get(token)
+            if entrada is None:
+                self.misses += 1
+                return None
+                
+            expira, datos = entrada
+            if expira <= time.monotonic():
+                del self._entradas[token]
+                self.expirations += 1
+                self.misses += 1
+                return None
+                
+            self._entradas.move_to_end(token)
+            self.hits += 1
+            return dict(datos)
+            
+    def guardar(self, token, datos, version=None):
+        """
+        Guardar datos de sesión, desalojando la entrada menos usada si está lleno
+        Si se indica version y hubo invalidaciones desde entonces, no se guarda
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entradas[token] = (time.monotonic() + self.ttl, dict(datos))
+            self._entradas.move_to_end(token)
+            while len(self._entradas) > self.max_entries:
+                self._entradas.popitem(last=False)
+                self.evictions += 1
+                
+    def invalidar(self, *tokens):
+        """Eliminar tokens de la caché (p. ej. al cerrar sesión)"""
+        with self._lock:
+            self.version += 1
+            for token in tokens:
+                if self._entradas.pop(token, None) is not None:
+                    self.invalidations += 1
+                    
+    def limpiar(self):
+        """Vaciar la caché (p. ej. si se pierde la suscripción de invalidación)"""
+        with self._lock:
+            self.version += 1
+            self.invalidations += len(self._entradas)
+            self._entradas.clear()
+            
+    def estadisticas(self):
+        """Contadores de la caché"""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+class NearCacheMotor:
+    """
+    Caché en proceso con la misma interfaz que NearCache sobre MotorMemoria
+    (nivel L1 delante de Redis): la expiración la hace la rueda de
+    temporizadores en lugar de comprobarse en cada lectura y el desalojo
+    usa el algoritmo del reloj sobre registros compactos en ranuras
+    """
+    def __init__(self, max_entries=10000, ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._motor = MotorMemoria(resolucion=min(ttl, 1.0), max_registros=max_entries)
+        self._lock = self._motor.lock
+        self.version = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        
+    def obtener(self, token):
+        """Retorna una copia de los datos cacheados o None"""
+        with self._lock:
+            self._motor.avanzar()
+            datos = self._motor.leer(token)
+            if datos is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return datos
+            
+    def guardar(self, token, datos, version=None):
+        """Guardar datos de sesión; si hubo invalidaciones desde version, no se guarda"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._motor.guardar(token, datos, ttl=self.ttl)
+            
+    def invalidar(self, *tokens):
+        """Eliminar tokens de la caché (p. ej. al cerrar sesión)"""
+        with self._lock:
+            self.version += 1
+            self.invalidations += self._motor.eliminar(*tokens)
+            
+    def limpiar(self):
+        """Vaciar la caché (p. ej. si se pierde la suscripción de invalidación)"""
+        with self._lock:
+            self.version += 1
+            self.invalidations += len(self._motor)
+            self._motor.vaciar()
+            
+    def estadisticas(self):
+        """Contadores de la caché"""
+        with self._lock:
+            return {
+                'entradas': len(self._motor),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self._motor.desalojados,
+                'expirations': self._motor.expirados,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,151 @@
+"""
+Control de admisión y límite de peticiones por cliente
+- Límite por cliente y endpoint con una cubeta de tokens evaluada en Redis
+  por el script LIMITAR_PETICIONES: una comprobación es un único viaje de
+  red y todos los procesos comparten el mismo límite. Sin cliente Redis
+  (backend en memoria) las cubetas se llevan en el propio proceso
+- Límite global de peticiones concurrentes por proceso: las que lo superan
+  se rechazan sin llegar a Redis, antes de que se acumulen en el pool
+- Contadores de cada decisión por endpoint (también en Prometheus)
+"""
+
+import collections
+import math
+import threading
+import time
+
+import redis
+
+import lua_scripts
+import metricas
+
+# Cubetas llevadas en el proceso como máximo (sin Redis)
+MAX_CUBETAS_LOCALES = 100000
+
+def parsear_cuotas(texto):
+    """
+    Convertir 'endpoint=peticiones/segundos,...' en {endpoint: (capacidad, tokens por segundo)}
+    p. ej. 'crear_sesion=30/60' admite ráfagas de 30 y repone 30 cada 60 segundos
+    """
+    cuotas = {}
+    for elemento in filter(None, (parte.strip() for parte in texto.split(','))):
+        endpoint, _, cuota = elemento.partition('=')
+        peticiones, _, segundos = cuota.partition('/')
+        try:
+            capacidad, periodo = int(peticiones), float(segundos or 1)
+        except ValueError:
+            raise ValueError(f"Cuota inválida: '{elemento}' (formato endpoint=peticiones/segundos)")
+        if not endpoint or capacidad <= 0 or periodo <= 0:
+            raise ValueError(f"Cuota inválida: '{elemento}' (formato endpoint=peticiones/segundos)")
+        cuotas[endpoint.strip()] = (capacidad, capacidad / periodo)
+    return cuotas
+
+class LimitadorPeticiones:
+    """
+    Decisiones: 'permitida', 'limitada' (cuota del cliente agotada, 429),
+    'saturada' (límite de concurrencia, 503) y 'error' (Redis no respondió:
+    se deja pasar la petición para que el limitador no provoque una caída)
+    """
+    def __init__(self, cliente=None, cuotas=None, max_concurrentes=0):
+        """
+        cliente: cliente Redis donde viven las cubetas, o None para llevarlas en el proceso
+        cuotas: {endpoint: (capacidad, tokens por segundo)} (ver parsear_cuotas)
+        max_concurrentes: peticiones simultáneas admitidas por proceso (0 = sin límite)
+        """
+        self.cliente = cliente
+        self.cuotas = cuotas or {}
+        self.max_concurrentes = max_concurrentes
+        self._script = cliente.register_script(lua_scripts.LIMITAR_PETICIONES) if cliente is not None else None
+        
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self._cubetas = collections.OrderedDict()  # clave -> (tokens, instante, llena en), por uso
+        self._decisiones = {}   # endpoint -> {decisión: cuenta}
+        metricas.registrar_en_curso(lambda: self._en_curso)
+        
+    def _contar(self, endpoint, decision):
+        with self._lock:
+            cuentas = self._decisiones.setdefault(endpoint, {})
+            cuentas[decision] = cuentas.get(decision, 0) + 1
+        metricas.registrar_decision(endpoint, decision)
+        
+    def admitir(self, endpoint):
+        """
+        Reservar un hueco de concurrencia; retorna False si el proceso ya
+        atiende max_concurrentes peticiones (hay que responder 503)
+        Cada admisión debe cerrarse con liberar()
+        """
+        with self._lock:
+            if self.max_concurrentes and self._en_curso >= self.max_concurrentes:
+                saturado = True
+            else:
+                saturado = False
+                self._en_curso += 1
+        if saturado:
+            self._contar(endpoint, 'saturada')
+        return not saturado
+        
+    def liberar(self):
+        with self._lock:
+            self._en_curso -= 1
+            
+    def comprobar(self, endpoint, cliente, coste=1):
+        """
+        Consumir coste tokens de la cubeta (endpoint, cliente)
+        Patrón de clave: ratelimit:{endpoint}:{cliente}
+        Comando: EVALSHA (script LIMITAR_PETICIONES)
+        Retorna (permitida, tokens restantes, segundos hasta poder repetir);
+        los endpoints sin cuota siempre se permiten y un coste mayor que la
+        capacidad nunca cabe (segundos None)
+        """
+        if endpoint not in self.cuotas:
+            return True, None, 0
+        capacidad, por_segundo = self.cuotas[endpoint]
+        if coste > capacidad:
+            self._contar(endpoint, 'limitada')
+            return False, None, None
+        clave = f"ratelimit:{endpoint}:{cliente}"
+        if self._script is None:
+            permitida, restantes, espera_ms = self._comprobar_local(clave, capacidad, por_segundo, coste)
+        else:
+            try:
+                permitida, restantes, espera_ms = self._script(keys=[clave], args=[capacidad, por_segundo, coste])
+            except redis.RedisError:
+                self._contar(endpoint, 'error')
+                return True, None, 0
+        self._contar(endpoint, 'permitida' if permitida else 'limitada')
+        return bool(permitida), restantes, espera_ms / 1000
+        
+    def _comprobar_local(self, clave, capacidad, por_segundo, coste):
+        """Misma cubeta que LIMITAR_PETICIONES, en memoria del proceso"""
+        with self._lock:
+            ahora = time.monotonic()
+            tokens, ultima, _ = self._cubetas.pop(clave, None) or (capacidad, ahora, ahora)
+            tokens = min(capacidad, tokens + (ahora - ultima) * por_segundo)
+            permitida = tokens >= coste
+            if permitida:
+                tokens -= coste
+            self._cubetas[clave] = (tokens, ahora, ahora + (capacidad - tokens) / por_segundo)
+            # Las cubetas menos recientes que ya se habrían llenado equivalen a no
+            # tenerlas (como el PEXPIRE del script); por encima de MAX_CUBETAS_LOCALES
+            # se descartan aunque no lo estén. Coste amortizado O(1) por llamada
+            while self._cubetas:
+                _, _, llena_en = next(iter(self._cubetas.values()))
+                if llena_en > ahora and len(self._cubetas) <= MAX_CUBETAS_LOCALES:
+                    break
+                self._cubetas.popitem(last=False)
+            espera_ms = 0 if permitida else math.ceil((coste - tokens) / por_segundo * 1000)
+            return int(permitida), math.floor(tokens), espera_ms
+            
+    def metricas(self):
+        """Estado del limitador para /api/health"""
+        with self._lock:
+            return {
+                'en_curso': self._en_curso,
+                'max_concurrentes': self.max_concurrentes,
+                'cuotas': {
+                    endpoint: {'capacidad': capacidad, 'por_segundo': por_segundo}
+                    for endpoint, (capacidad, por_segundo) in self.cuotas.items()
+                },
+                'decisiones': {endpoint: dict(cuentas) for endpoint, cuentas in self._decisiones.items()}
+            }
@@ -1,144 +1,1081 @@
 import redis
+import base64
+import contextvars
+import itertools
 import json
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import lua_scripts
+import metricas
+from near_cache import NearCache, NearCacheMotor, CANAL_INVALIDACION
+from session_codec import ERRORES_CODIFICACION, obtener_codec, decodificar_sesion
+from session_tokens import FirmadorTokens, FiltroRevocados, ValidadorTokens
+from sharding import HashRing, prefijo_token
+
+# Tiempo de vida de una sesión en segundos (1 hora)
+SESSION_TTL = 3600
+
+# Número de operaciones enviadas por pipeline en las APIs por lotes
+BATCH_CHUNK_SIZE = 100
+
+def _hash_desde_lista(valores):
+    """Convertir la respuesta plana de HGETALL en un script Lua a diccionario"""
+    return dict(zip(valores[::2], valores[1::2]))
+
+def _conectar(host, port, db, timeout=None):
+    """
+    Cliente Redis con respuestas decodificadas; los valores binarios del
+    códec compacto se conservan gracias a ERRORES_CODIFICACION
+    timeout (segundos) acota la conexión y cada lectura del socket
+    """
+    return metricas.clase_cliente()(
+        host=host, port=port, db=db, decode_responses=True, encoding_errors=ERRORES_CODIFICACION,
+        socket_connect_timeout=timeout, socket_timeout=timeout
+    )
+
+def _en_bloques(elementos, tamano=BATCH_CHUNK_SIZE):
+    """Dividir una lista en bloques de tamaño fijo"""
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
+# Las funciones siguientes construyen claves y argumentos de los scripts Lua;
+# las comparten RedisSessionManager y AsyncRedisSessionManager
+
+def _clave_sesiones_usuario(user_id):
+    """Índice de tokens del usuario (ZSET token -> fecha de creación)"""
+    return f"user:{{{user_id}}}:sessions"
+
+def _args_crear_sesion(user_id, username, email, prefijo='', codec=None, max_sesiones=0, validador=None,
+                       stream=''):
+    """
+    Retorna (token, keys, args) del script CREAR_SESION
+    prefijo es el prefijo de ruteo del token en modo shards; codec decide
+    los campos de la sesión y si se duplican en el perfil; max_sesiones > 0
+    desaloja las sesiones más antiguas del usuario que superen el límite;
+    validador (ValidadorTokens) firma el token si hay secretos configurados;
+    stream (no vacío) difiere perfil, ranking y analítica al worker de eventos
+    """
+    codec = codec or obtener_codec('hash')
+    session_token = f"{prefijo}.{uuid.uuid4()}" if prefijo else str(uuid.uuid4())
+    if validador:
+        session_token = validador.generar(session_token)
+    ahora = datetime.now()
+    keys = [
+        f"session:{session_token}",
+        'stats:active_sessions',
+        f"user:{{{user_id}}}:profile",
+        'ranking:active_users',
+        'index:sessions:expiry',
+        'index:sessions:owner',
+        _clave_sesiones_usuario(user_id)
+    ]
+    campos = codec.campos(user_id, username, email, ahora)
+    args = [
+        user_id, SESSION_TTL, ahora.timestamp(), ahora.timestamp() + SESSION_TTL, session_token,
+        max_sesiones, CANAL_INVALIDACION, stream, len(campos) // 2, *campos
+    ]
+    if codec.duplica_perfil:
+        args += ['user_id', user_id, 'username', username, 'email', email, 'updated_at', ahora.isoformat()]
+    return session_token, keys, args
+
+def _validar_sesiones(sesiones):
+    """
+    Validar los elementos de un lote de creación
+    Retorna (resultados con los errores ya rellenados, índices válidos)
+    """
+    resultados = [None] * len(sesiones)
+    validas = []
+    for indice, sesion in enumerate(sesiones):
+        if not isinstance(sesion, dict):
+            resultados[indice] = {'ok': False, 'error': 'Formato inválido'}
+        elif not all(sesion.get(campo) for campo in ('user_id', 'username', 'email')):
+            resultados[indice] = {'ok': False, 'error': 'Todos los campos son obligatorios'}
+        else:
+            validas.append(indice)
+    return resultados, validas
+
+def _escrituras_actividad(datos, ahora, refresh_interval):
+    """
+    Mismas condiciones que el script OBTENER_SESION sobre el hash de la sesión
+    sin decodificar (cualquier formato). Retorna (renovar, anotar): renovar la
+    actividad, el TTL y el índice (como mucho una vez por refresh_interval) y
+    anotar al usuario en la analítica (una vez por cubeta de CUBETA_MINIMA)
+    """
+    ultima = float(datos.get('last_activity_ts') or datos.get('a') or 0)
+    anotada = datos.get('activity_bucket') or datos.get('b')
+    anotada = int(anotada) if anotada else ultima // lua_scripts.CUBETA_MINIMA
+    return ahora - ultima >= refresh_interval, ahora // lua_scripts.CUBETA_MINIMA != anotada
+
+def _args_obtener_sesion(session_token, refresh_interval, sliding_expiration, stream=''):
+    """Claves y argumentos del script de lectura con renovación de actividad"""
+    ahora = datetime.now()
+    return {
+        'keys': [f"session:{session_token}", 'index:sessions:expiry'],
+        'args': [
+            ahora.isoformat(),
+            ahora.timestamp(),
+            refresh_interval,
+            SESSION_TTL if sliding_expiration else 0,
+            session_token,
+            stream
+        ]
+    }
+
+def _crear_validador(token_secrets, token_max_age, accept_unsigned_tokens, revoked_filter_size):
+    """ValidadorTokens según la configuración, o None si no hay nada que validar"""
+    firmador = FirmadorTokens(token_secrets, token_max_age) if token_secrets else None
+    filtro = FiltroRevocados(capacidad=revoked_filter_size, ventana=token_max_age) if revoked_filter_size > 0 else None
+    if not firmador and not filtro:
+        return None
+    return ValidadorTokens(firmador, filtro, accept_unsigned_tokens)
+
+def _claves_cerrar_sesiones(session_tokens):
+    """Claves del script CERRAR_SESIONES"""
+    return ['stats:active_sessions', 'ranking:active_users', 'index:sessions:expiry', 'index:sessions:owner'] + \
+           [f"session:{token}" for token in session_tokens]
+
+def _claves_cerrar_sesiones_usuario(user_id):
+    """Claves del script CERRAR_SESIONES_USUARIO"""
+    return _claves_cerrar_sesiones([])[:4] + [_clave_sesiones_usuario(user_id)]
+
+CLAVES_RECONCILIAR = ['index:sessions:expiry', 'stats:active_sessions', 'stats:reconcile_cursor']
+CLAVES_ELIMINAR_EXPIRADAS = ['index:sessions:expiry', 'index:sessions:owner', 'stats:active_sessions', 'ranking:active_users']
+
+def _resumen_reconciliacion(vivas, anterior, huerfanas, cursor):
+    return {
+        'sesiones_activas': vivas,
+        'deriva': anterior - vivas,
+        'huerfanas_eliminadas': huerfanas,
+        'vuelta_completa': cursor == '0'
+    }
+
+def _parsear_cursor(cursor):
+    """Retorna (expiración, token) del cursor de paginación; ValueError si no es válido"""
+    if not cursor:
+        return '', ''
+    cursor_expiracion, _, cursor_token = cursor.partition(':')
+    float(cursor_expiracion)
+    return cursor_expiracion, cursor_token
+
+def _construir_pagina(tokens, expiraciones, respuestas, limit):
+    """Combinar la página del índice con las respuestas HGETALL/TTL del pipeline"""
+    sesiones = []
+    for i, token in enumerate(tokens):
+        session_data, ttl = decodificar_sesion(respuestas[2 * i]), respuestas[2 * i + 1]
+        if session_data:
+            session_data['token'] = token
+            session_data['ttl'] = ttl
+            sesiones.append(session_data)
+            
+    siguiente = None
+    if len(tokens) == limit:
+        siguiente = f"{expiraciones[-1]}:{tokens[-1]}"
+    return {'sesiones': sesiones, 'cursor': siguiente}
+
+# Número máximo de cubetas por consulta de analítica
+MAX_CUBETAS_ANALITICA = 1500
+
+def _cubetas_analitica(ventana, granularidad, ahora):
+    """
+    Granularidad e inicios de las cubetas que cubren los últimos `ventana`
+    segundos (la más antigua puede empezar antes de la ventana)
+    Sin granularidad se elige por minutos hasta 3 horas, por horas hasta
+    7 días y por días a partir de ahí
+    """
+    if ventana <= 0:
+        raise ValueError('La ventana debe ser positiva')
+    if granularidad is None:
+        granularidad = 'minute' if ventana <= 3 * 3600 else 'hour' if ventana <= 7 * 86400 else 'day'
+    if granularidad not in lua_scripts.CUBETAS_ANALITICA:
+        raise ValueError(f"Granularidad desconocida: {granularidad}")
+    segundos, retencion = lua_scripts.CUBETAS_ANALITICA[granularidad]
+    if ventana > retencion:
+        raise ValueError(f"Las cubetas '{granularidad}' solo se conservan {retencion} segundos")
+    ultima = int(ahora) - int(ahora) % segundos
+    primera = int(ahora - ventana) - int(ahora - ventana) % segundos
+    inicios = list(range(primera, ultima + 1, segundos))
+    if len(inicios) > MAX_CUBETAS_ANALITICA:
+        raise ValueError(f"Demasiadas cubetas ({len(inicios)}); usa una granularidad mayor")
+    return granularidad, inicios
+
+def _codificar_cursor_shards(posiciones):
+    """Cursor compuesto {nodo: cursor del nodo} en base64 URL-safe"""
+    return base64.urlsafe_b64encode(json.dumps(posiciones).encode('utf-8')).decode('ascii')
+
+def _decodificar_cursor_shards(cursor):
+    """Inverso de _codificar_cursor_shards; ValueError si el cursor no es válido"""
+    if not cursor:
+        return {}
+    try:
+        posiciones = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Cursor inválido')
+    if not isinstance(posiciones, dict):
+        raise ValueError('Cursor inválido')
+    return posiciones
+
 class RedisSessionManager:
-    def __init__(self, host='redis', port=6379, db=0):
-        """Inicializar conexión a Redis"""
-        self.redis_client = redis.Redis(
-            host=host, 
-            port=port, 
-            db=db, 
-            decode_responses=True
-        )
+    def __init__(self, host='redis', port=6379, db=0, cache_size=0, cache_ttl=5.0,
+                 sliding_expiration=True, refresh_interval=60, nodes=None, previous_nodes=None,
+                 replicas=None, replica_selection='round_robin', max_replica_lag=1024 * 1024,
+                 replica_check_interval=1.0, replica_timeout=0.5, codec='hash', max_sessions_per_user=0,
+                 token_secrets=None, token_max_age=86400, accept_unsigned_tokens=True,
+                 revoked_filter_size=0, side_effects='inline', cache_backend='lru'):
+        """
+        Inicializar conexión a Redis
+        cache_size > 0 activa una caché local de sesiones (LRU + TTL de cache_ttl
+        segundos) invalidada en todos los procesos vía Pub/Sub;
+        cache_backend='engine' la guarda en el motor en proceso (MotorMemoria)
+        sliding_expiration renueva el TTL de las sesiones usadas; last_activity
+        (y el TTL) se actualizan como mucho una vez cada refresh_interval segundos
+        nodes, una lista de (host, puerto), activa el modo shards: las claves se
+        reparten entre los nodos con hashing consistente. previous_nodes es la
+        lista anterior mientras se rebalancea (las lecturas que fallan en el nodo
+        nuevo se reintentan en el anterior)
+        replicas, una lista de (host, puerto), recibe las lecturas (selección
+        'round_robin' o 'latency'); una réplica cuyo offset de replicación
+        va más de max_replica_lag bytes por detrás del primario (revisado cada
+        replica_check_interval segundos en un hilo de fondo) deja de usarse
+        hasta alcanzarlo. replica_timeout (segundos) acota la conexión y las
+        lecturas en las réplicas, para que una réplica que no responde no
+        bloquee las peticiones; una sesión que no está en la réplica (retraso
+        de replicación) se busca en el primario
+        codec es el formato de las sesiones nuevas ('hash' o 'packed', ver
+        session_codec); las sesiones existentes se leen en cualquier formato
+        max_sessions_per_user > 0 limita las sesiones abiertas por usuario: al
+        crear una sesión que supera el límite se cierra la más antigua
+        token_secrets (lista de secretos; el primero firma) emite tokens
+        firmados con HMAC que caducan a los token_max_age segundos y se
+        verifican sin consultar Redis; accept_unsigned_tokens sigue aceptando
+        los tokens uuid anteriores. revoked_filter_size > 0 mantiene un filtro
+        de Bloom de esa capacidad con los tokens cerrados recientemente,
+        alimentado por el canal de invalidación
+        side_effects='stream' deja en la petición solo la escritura de la
+        sesión y sus índices: perfil, ranking y analítica se publican como
+        eventos en STREAM_EVENTOS y los aplica event_worker.py
+        """
+        if nodes and replicas:
+            raise ValueError('Las réplicas de lectura no se combinan con el modo shards')
+        if side_effects not in ('inline', 'stream'):
+            raise ValueError(f"Modo de efectos secundarios desconocido: {side_effects}")
+        if cache_backend not in ('lru', 'engine'):
+            raise ValueError(f"Caché local desconocida: {cache_backend}")
+        if replica_selection not in ('round_robin', 'latency'):
+            raise ValueError(f"Selección de réplica desconocida: {replica_selection}")
+        if not nodes:
+            nodes = [(host, port)]
+        self.nodos = {
+            f"{h}:{p}": _conectar(h, p, db)
+            for h, p in nodes
+        }
+        self.redis_client = next(iter(self.nodos.values()))
+        self.ring = HashRing(list(self.nodos)) if len(self.nodos) > 1 else None
+        
+        self.ring_anterior = None
+        if previous_nodes:
+            for h, p in previous_nodes:
+                self.nodos.setdefault(f"{h}:{p}", _conectar(h, p, db))
+            self.ring_anterior = HashRing([f"{h}:{p}" for h, p in previous_nodes])
+            
+        self.sliding_expiration = sliding_expiration
+        self.refresh_interval = refresh_interval
+        self.codec = obtener_codec(codec)
+        self.max_sessions_per_user = max_sessions_per_user
+        self._stream = lua_scripts.STREAM_EVENTOS if side_effects == 'stream' else ''
+        self.validador = _crear_validador(token_secrets, token_max_age, accept_unsigned_tokens, revoked_filter_size)
+        
+        self.replicas = {
+            f"{h}:{p}": _conectar(h, p, db, timeout=replica_timeout)
+            for h, p in replicas or []
+        }
+        self.replica_selection = replica_selection
+        self.max_replica_lag = max_replica_lag
+        self.replica_check_interval = replica_check_interval
+        self._estado_replicas = {
+            nombre: {'disponible': False, 'retraso_bytes': None, 'latencia_ms': None, 'lecturas': 0}
+            for nombre in self.replicas
+        }
+        self._lock_replicas = threading.Lock()
+        self._turno_replicas = itertools.count()
+        self._turno_limpieza = itertools.count()
+        if self.replicas:
+            self._iniciar_revision_replicas()
+            
+        # Operaciones que abarcan varios nodos se envían en paralelo
+        self._ejecutor = ThreadPoolExecutor(max_workers=len(self.nodos)) if len(self.nodos) > 1 else None
+        
+        # Registrar scripts Lua (se envían con EVALSHA, un solo viaje de red)
+        self._script_crear_sesion = self.redis_client.register_script(lua_scripts.CREAR_SESION)
+        self._script_cerrar_sesiones = self.redis_client.register_script(lua_scripts.CERRAR_SESIONES)
+        self._script_cerrar_sesiones_usuario = self.redis_client.register_script(lua_scripts.CERRAR_SESIONES_USUARIO)
+        self._script_obtener_sesion = self.redis_client.register_script(lua_scripts.OBTENER_SESION)
+        self._script_listar_pagina = self.redis_client.register_script(lua_scripts.LISTAR_PAGINA)
+        self._script_reconciliar = self.redis_client.register_script(lua_scripts.RECONCILIAR_CONTADOR)
+        self._script_eliminar_expiradas = self.redis_client.register_script(lua_scripts.ELIMINAR_EXPIRADAS)
+        
+        for nombre, cliente in {**self.nodos, **self.replicas}.items():
+            metricas.registrar_pool(nombre, cliente.connection_pool)
+            
+        self.cache = None
+        if cache_size > 0:
+            clase_cache = NearCacheMotor if cache_backend == 'engine' else NearCache
+            self.cache = clase_cache(max_entries=cache_size, ttl=cache_ttl)
+        if self.cache or (self.validador and self.validador.filtro):
+            self._iniciar_invalidacion()
+            
+    def _nodo_sesion(self, session_token):
+        """Nombre del nodo que almacena session:{token}"""
+        return self.ring.nodo_para_token(session_token) if self.ring else next(iter(self.nodos))
+        
+    def _nodo_usuario(self, user_id):
+        """Nombre del nodo que almacena user:{user_id}:* (y las sesiones del usuario)"""
+        return self.ring.nodo_para_usuario(user_id) if self.ring else next(iter(self.nodos))
         
+    def _nodos_activos(self):
+        """Nodos del anillo actual (excluye los que solo están en el anillo anterior)"""
+        return self.ring.nodos if self.ring else [next(iter(self.nodos))]
+        
+    def _en_paralelo(self, funcion, grupos):
+        """
+        Ejecutar funcion(nodo, elementos) para cada grupo {nodo: elementos}
+        En paralelo si hay varios nodos; retorna {nodo: resultado}
+        """
+        if len(grupos) <= 1 or self._ejecutor is None:
+            return {nodo: funcion(nodo, elementos) for nodo, elementos in grupos.items()}
+        # Cada tarea conserva el contexto (contador de viajes de la petición)
+        futuros = {
+            nodo: self._ejecutor.submit(contextvars.copy_context().run, funcion, nodo, elementos)
+            for nodo, elementos in grupos.items()
+        }
+        return {nodo: futuro.result() for nodo, futuro in futuros.items()}
+        
+    def _agrupar(self, indices, nodo_de):
+        """Agrupar índices por nodo conservando el orden"""
+        grupos = {}
+        for indice in indices:
+            grupos.setdefault(nodo_de(indice), []).append(indice)
+        return grupos
+        
+    def _iniciar_invalidacion(self):
+        """
+        Suscribirse al canal de invalidación de cada nodo en hilos de fondo
+        Cada mensaje contiene los tokens cerrados separados por espacios; se
+        quitan de la caché y se añaden al filtro de revocados
+        """
+        def al_recibir(mensaje):
+            tokens = mensaje['data'].split()
+            if self.cache:
+                self.cache.invalidar(*tokens)
+            if self.validador:
+                self.validador.revocar(*tokens)
+                
+        def al_fallar(error, pubsub, hilo):
+            # Mientras no haya suscripción se pueden perder invalidaciones; al
+            # filtro solo le faltarán revocaciones (se consultará Redis)
+            if self.cache:
+                self.cache.limpiar()
+            time.sleep(1)
+            
+        self._hilos_invalidacion = []
+        for cliente in self.nodos.values():
+            pubsub = cliente.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{CANAL_INVALIDACION: al_recibir})
+            self._hilos_invalidacion.append(
+                pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=al_fallar)
+            )
+            
+    def _iniciar_revision_replicas(self):
+        """
+        Revisar las réplicas cada replica_check_interval segundos en un hilo
+        de fondo; hasta la primera revisión las lecturas van al primario
+        """
+        def revisar():
+            while True:
+                self._revisar_replicas()
+                time.sleep(self.replica_check_interval)
+                
+        threading.Thread(target=revisar, name='revision-replicas', daemon=True).start()
+        
+    def _revisar_replicas(self):
+        """
+        Actualizar el estado (disponible, retraso, latencia) de las réplicas
+        Comando: INFO replication (primario y cada réplica)
+        """
+        with self._lock_replicas:
+            try:
+                offset_primario = self.redis_client.info('replication').get('master_repl_offset', 0)
+            except redis.RedisError:
+                offset_primario = None
+                
+            for nombre, cliente in self.replicas.items():
+                estado = self._estado_replicas[nombre]
+                try:
+                    inicio = time.perf_counter()
+                    info = cliente.info('replication')
+                    latencia = (time.perf_counter() - inicio) * 1000
+                except redis.RedisError:
+                    estado.update(disponible=False, retraso_bytes=None)
+                    continue
+                    
+                retraso = None
+                if offset_primario is not None and 'slave_repl_offset' in info:
+                    retraso = max(offset_primario - info['slave_repl_offset'], 0)
+                # Media móvil para que un pico aislado no cambie la selección
+                if estado['latencia_ms'] is not None:
+                    latencia = 0.8 * estado['latencia_ms'] + 0.2 * latencia
+                estado.update(
+                    disponible=(info.get('master_link_status') == 'up'
+                                and retraso is not None and retraso <= self.max_replica_lag),
+                    retraso_bytes=retraso,
+                    latencia_ms=latencia
+                )
+                
+    def _elegir_replica(self):
+        """Nombre de la réplica que atiende la siguiente lectura, o None (usar el primario)"""
+        disponibles = [nombre for nombre, estado in self._estado_replicas.items() if estado['disponible']]
+        if not disponibles:
+            return None
+        if self.replica_selection == 'latency':
+            return min(disponibles, key=lambda nombre: self._estado_replicas[nombre]['latencia_ms'])
+        return disponibles[next(self._turno_replicas) % len(disponibles)]
+        
+    def _leer(self, nodo, funcion, use_primary=False):
+        """
+        Ejecutar funcion(cliente) de solo lectura en una réplica si las hay
+        (y use_primary es False) o en el nodo indicado
+        Si la réplica falla se marca como no disponible y se lee del primario
+        """
+        replica = None if use_primary or not self.replicas else self._elegir_replica()
+        if replica is not None:
+            try:
+                resultado = funcion(self.replicas[replica])
+                self._estado_replicas[replica]['lecturas'] += 1
+                return resultado
+            except (redis.ConnectionError, redis.TimeoutError):
+                self._estado_replicas[replica]['disponible'] = False
+        return funcion(self.nodos[nodo])
+        
+    def estadisticas_replicas(self):
+        """Estado de cada réplica (disponible, retraso, latencia, lecturas) o None si no hay"""
+        if not self.replicas:
+            return None
+        return {nombre: dict(estado) for nombre, estado in self._estado_replicas.items()}
+        
+    def ping(self):
+        """Comprobar la conexión con el nodo principal (PING)"""
+        return self.redis_client.ping()
+        
+    def estadisticas_cache(self):
+        """Contadores de la caché local (hits, misses, evictions...) o None si está desactivada"""
+        return self.cache.estadisticas() if self.cache else None
+        
+    def estadisticas_tokens(self):
+        """Tokens rechazados sin consultar Redis (por motivo) o None si no hay validación"""
+        return self.validador.estadisticas() if self.validador else None
+        
+    @metricas.medir
     def crear_sesion(self, user_id, username, email):
         """
         Crear una nueva sesión de usuario
         Patrón de clave: session:{token}
         Tipo de dato: Hash
+        Comando: EVALSHA (script Lua atómico)
         """
-        session_token = str(uuid.uuid4())
-        session_key = f"session:{session_token}"
-        
-        # Datos de la sesión como hash
-        session_data = {
-            'user_id': user_id,
-            'username': username,
-            'email': email,
-            'created_at': datetime.now().isoformat(),
-            'last_activity': datetime.now().isoformat()
-        }
+        return self._crear_sesion_en(self.nodos[self._nodo_usuario(user_id)], user_id, username, email)
         
-        # Almacenar sesión con expiración de 1 hora
-        self.redis_client.hset(session_key, mapping=session_data)
-        self.redis_client.expire(session_key, 3600)  # 1 hora TTL
+    def _crear_sesion_en(self, cliente, user_id, username, email):
+        """
+        Encolar el script de creación en un cliente o pipeline
+        Retorna el token generado
+        """
+        # En modo shards el token lleva la posición del usuario en el anillo,
+        # de modo que la sesión vive en el mismo nodo que user:{user_id}:*
+        prefijo = prefijo_token(user_id) if self.ring else ''
+        session_token, keys, args = _args_crear_sesion(
+            user_id, username, email, prefijo, self.codec, self.max_sessions_per_user, self.validador, self._stream
+        )
         
-        # Incrementar contador de sesiones activas
-        self.redis_client.incr('stats:active_sessions')
+        # Sesión (hash + TTL), contador, perfil, ranking e índice del usuario
+        # (con el desalojo por límite) en un solo script atómico: una única
+        # ida y vuelta a Redis
+        self._script_crear_sesion(keys=keys, args=args, client=cliente)
         
-        # Actualizar perfil de usuario
-        self.actualizar_perfil_usuario(user_id, username, email)
+        return session_token
         
-        # Agregar a ranking de usuarios activos
-        self.redis_client.zadd('ranking:active_users', {user_id: time.time()})
+    @metricas.medir
+    def crear_sesiones(self, sesiones):
+        """
+        Crear varias sesiones por lotes
+        Cada elemento es un dict con user_id, username y email
+        Comando: EVALSHA encolado en pipelines de BATCH_CHUNK_SIZE sesiones
+        (un pipeline por nodo, en paralelo)
+        Retorna una lista de resultados, uno por elemento:
+        {'ok': True, 'token': ...} o {'ok': False, 'error': ...}
+        """
+        resultados, validas = _validar_sesiones(sesiones)
         
-        return session_token
+        def crear_en_nodo(nodo, indices):
+            parciales = []
+            for bloque in _en_bloques(indices):
+                pipe = self.nodos[nodo].pipeline(transaction=False)
+                tokens = [
+                    self._crear_sesion_en(pipe, sesiones[i]['user_id'], sesiones[i]['username'], sesiones[i]['email'])
+                    for i in bloque
+                ]
+                respuestas = pipe.execute(raise_on_error=False)
+                parciales.extend(zip(bloque, tokens, respuestas))
+            return parciales
+            
+        grupos = self._agrupar(validas, lambda i: self._nodo_usuario(sesiones[i]['user_id']))
+        for parciales in self._en_paralelo(crear_en_nodo, grupos).values():
+            for indice, token, respuesta in parciales:
+                if isinstance(respuesta, Exception):
+                    resultados[indice] = {'ok': False, 'error': str(respuesta)}
+                else:
+                    resultados[indice] = {'ok': True, 'token': token}
+                    
+        return resultados
         
-    def obtener_sesion(self, session_token):
+    @metricas.medir
+    def obtener_sesion(self, session_token, use_primary=False):
         """
         Obtener información de una sesión
-        Comando: HGETALL
+        Comando: EVALSHA (HGETALL y, como mucho una vez por refresh_interval,
+        actualización de last_activity y renovación del TTL)
+        Con réplicas, la sesión se lee de una réplica (HGETALL) y solo se va
+        al primario cuando toca renovar la actividad; use_primary=True lee
+        siempre del primario (p. ej. justo después de crear_sesion)
         """
-        session_key = f"session:{session_token}"
-        session_data = self.redis_client.hgetall(session_key)
+        return self.obtener_sesiones([session_token], use_primary=use_primary)[0]
         
-        if session_data:
-            # Actualizar última actividad
-            self.redis_client.hset(session_key, 'last_activity', datetime.now().isoformat())
-            return session_data
-        return None
+    @metricas.medir
+    def obtener_sesiones(self, session_tokens, use_primary=False):
+        """
+        Obtener varias sesiones por lotes
+        Comando: EVALSHA encolado en pipelines de BATCH_CHUNK_SIZE tokens
+        Retorna una lista con el hash de cada sesión o None si no existe
+        Los tokens que no superan la validación local (firma, expiración o
+        revocación) dan None sin consultar Redis
+        """
+        aceptados = self._tokens_aceptados(session_tokens)
+        if len(aceptados) < len(session_tokens):
+            resultados = [None] * len(session_tokens)
+            leidas = self._obtener_sesiones_cache([session_tokens[i] for i in aceptados], use_primary)
+            for i, datos in zip(aceptados, leidas):
+                resultados[i] = datos
+            return resultados
+        return self._obtener_sesiones_cache(session_tokens, use_primary)
+        
+    def _tokens_aceptados(self, session_tokens):
+        """Índices de los tokens que merecen una consulta a Redis"""
+        if self.validador is None:
+            return list(range(len(session_tokens)))
+        return [i for i, token in enumerate(session_tokens) if self.validador.aceptar(token)]
+        
+    def _obtener_sesiones_cache(self, session_tokens, use_primary=False):
+        """Leer sesiones de la caché local y, las que falten, de Redis"""
+        if not session_tokens:
+            return []
+        if self.cache is None or use_primary:
+            return self._obtener_sesiones_redis(session_tokens, use_primary)
+            
+        resultados = [self.cache.obtener(token) for token in session_tokens]
+        pendientes = [i for i, datos in enumerate(resultados) if datos is None]
+        if pendientes:
+            version = self.cache.version
+            leidas = self._obtener_sesiones_redis([session_tokens[i] for i in pendientes])
+            for i, datos in zip(pendientes, leidas):
+                if datos:
+                    self.cache.guardar(session_tokens[i], datos, version)
+                resultados[i] = datos
+        return resultados
         
+    def _obtener_sesiones_redis(self, session_tokens, use_primary=False):
+        """Leer sesiones de Redis: un script por token, en pipelines por bloques y nodo"""
+        if self.replicas and not use_primary:
+            return self._obtener_sesiones_replica(session_tokens)
+            
+        resultados = self._obtener_sesiones_por_nodo(session_tokens, self._nodo_sesion)
+        
+        # Durante un rebalanceo, las sesiones aún no migradas siguen en su nodo anterior
+        if self.ring_anterior:
+            def nodo_anterior(token):
+                return self.ring_anterior.nodo_para_token(token)
+                
+            faltantes = [
+                i for i, datos in enumerate(resultados)
+                if datos is None and nodo_anterior(session_tokens[i]) != self._nodo_sesion(session_tokens[i])
+            ]
+            if faltantes:
+                anteriores = self._obtener_sesiones_por_nodo([session_tokens[i] for i in faltantes], nodo_anterior)
+                for i, datos in zip(faltantes, anteriores):
+                    resultados[i] = datos
+        return resultados
+        
+    def _obtener_sesiones_replica(self, session_tokens):
+        """
+        Leer sesiones con HGETALL en una réplica; las que deben renovar su
+        actividad, las que la réplica aún no tiene (una sesión recién creada
+        puede no haberse replicado) o todas si no hay réplica disponible se
+        leen con el script en el primario
+        """
+        def leer(cliente):
+            leidas = []
+            for bloque in _en_bloques(session_tokens):
+                pipe = cliente.pipeline(transaction=False)
+                for token in bloque:
+                    pipe.hgetall(f"session:{token}")
+                leidas.extend(pipe.execute())
+            return leidas
+            
+        replica = self._elegir_replica()
+        if replica is None:
+            return self._obtener_sesiones_por_nodo(session_tokens, self._nodo_sesion)
+        try:
+            resultados = leer(self.replicas[replica])
+        except (redis.ConnectionError, redis.TimeoutError):
+            self._estado_replicas[replica]['disponible'] = False
+            return self._obtener_sesiones_por_nodo(session_tokens, self._nodo_sesion)
+        self._estado_replicas[replica]['lecturas'] += 1
+        
+        ahora = time.time()
+        renovar = [
+            i for i, datos in enumerate(resultados)
+            if not datos or any(_escrituras_actividad(datos, ahora, self.refresh_interval))
+        ]
+        resultados = [decodificar_sesion(datos) for datos in resultados]
+        if renovar:
+            leidas = self._obtener_sesiones_por_nodo([session_tokens[i] for i in renovar], self._nodo_sesion)
+            for i, datos in zip(renovar, leidas):
+                resultados[i] = datos
+        return resultados
+        
+    def _obtener_sesiones_por_nodo(self, session_tokens, nodo_de):
+        if len(session_tokens) == 1:
+            datos = self._script_obtener_sesion(
+                client=self.nodos[nodo_de(session_tokens[0])],
+                **_args_obtener_sesion(session_tokens[0], self.refresh_interval, self.sliding_expiration, self._stream)
+            )
+            return [decodificar_sesion(_hash_desde_lista(datos))]
+            
+        def leer_en_nodo(nodo, indices):
+            leidas = []
+            for bloque in _en_bloques(indices):
+                pipe = self.nodos[nodo].pipeline(transaction=False)
+                for i in bloque:
+                    self._script_obtener_sesion(
+                        client=pipe,
+                        **_args_obtener_sesion(session_tokens[i], self.refresh_interval, self.sliding_expiration, self._stream)
+                    )
+                leidas.extend(zip(bloque, pipe.execute()))
+            return leidas
+            
+        resultados = [None] * len(session_tokens)
+        grupos = self._agrupar(range(len(session_tokens)), lambda i: nodo_de(session_tokens[i]))
+        for leidas in self._en_paralelo(leer_en_nodo, grupos).values():
+            for i, datos in leidas:
+                resultados[i] = decodificar_sesion(_hash_desde_lista(datos))
+        return resultados
+        
+    @metricas.medir
     def actualizar_perfil_usuario(self, user_id, username, email):
         """
         Actualizar perfil de usuario
-        Patrón: user:{user_id}:profile
+        Patrón: user:{user_id}:profile (etiqueta hash: vive en el nodo del usuario)
         Tipo: Hash
         """
-        profile_key = f"user:{user_id}:profile"
+        profile_key = f"user:{{{user_id}}}:profile"
         profile_data = {
             'user_id': user_id,
             'username': username,
             'email': email,
             'updated_at': datetime.now().isoformat()
         }
-        self.redis_client.hset(profile_key, mapping=profile_data)
+        self.nodos[self._nodo_usuario(user_id)].hset(profile_key, mapping=profile_data)
         
+    @metricas.medir
     def cerrar_sesion(self, session_token):
         """
         Cerrar sesión eliminando el token
-        Comando: DEL
+        Comando: EVALSHA (DEL, DECR y ZREM atómicos en el servidor)
+        Retorna True si la sesión existía
         """
-        session_key = f"session:{session_token}"
+        return self.cerrar_sesiones([session_token])[0]
         
-        # Verificar si existe antes de eliminar
-        if self.redis_client.exists(session_key):
-            # Obtener user_id antes de eliminar
-            user_id = self.redis_client.hget(session_key, 'user_id')
+    @metricas.medir
+    def cerrar_sesiones(self, session_tokens):
+        """
+        Cerrar varias sesiones en una sola llamada (p. ej. cierre masivo
+        durante un incidente)
+        Comando: EVALSHA con bloques de BATCH_CHUNK_SIZE claves session:{token}
+        (por nodo, en paralelo)
+        Retorna una lista de booleanos, uno por token, en el mismo orden
+        """
+        if not session_tokens:
+            return []
             
-            # Eliminar sesión
-            self.redis_client.delete(session_key)
+        # Invalidación local inmediata; el resto de procesos la recibe por Pub/Sub
+        if self.cache:
+            self.cache.invalidar(*session_tokens)
             
-            # Decrementar contador
-            current_sessions = self.redis_client.get('stats:active_sessions')
-            if current_sessions and int(current_sessions) > 0:
-                self.redis_client.decr('stats:active_sessions')
-                
-            # Remover del ranking
-            if user_id:
-                self.redis_client.zrem('ranking:active_users', user_id)
+        # Los tokens rechazados localmente no pueden tener sesión en Redis
+        aceptados = self._tokens_aceptados(session_tokens)
+        tokens = [session_tokens[i] for i in aceptados]
+        
+        cerradas = self._cerrar_sesiones_por_nodo(tokens, self._nodo_sesion)
+        if self.ring_anterior:
+            pendientes = [i for i, cerrada in enumerate(cerradas) if not cerrada]
+            anteriores = self._cerrar_sesiones_por_nodo(
+                [tokens[i] for i in pendientes], self.ring_anterior.nodo_para_token
+            )
+            for i, cerrada in zip(pendientes, anteriores):
+                cerradas[i] = cerrada
                 
-            return True
-        return False
+        # Solo tras un cierre sin errores: si el script falla la sesión sigue
+        # viva en Redis y el filtro la rechazaría en este proceso para siempre
+        if self.validador:
+            self.validador.revocar(*tokens)
+            
+        resultados = [False] * len(session_tokens)
+        for i, cerrada in zip(aceptados, cerradas):
+            resultados[i] = cerrada
+        return resultados
+        
+    @metricas.medir
+    def cerrar_sesiones_usuario(self, user_id):
+        """
+        Cerrar todas las sesiones de un usuario ("cerrar sesión en todos los
+        dispositivos") sin recorrer el índice global
+        Patrón de clave: user:{user_id}:sessions
+        Comando: EVALSHA (ZRANGE del índice del usuario y cierre atómico)
+        Retorna el número de sesiones cerradas
+        """
+        nodos = [self._nodo_usuario(user_id)]
+        if self.ring_anterior and self.ring_anterior.nodo_para_usuario(user_id) not in nodos:
+            nodos.append(self.ring_anterior.nodo_para_usuario(user_id))
+        # Cada nodo publica los tokens cerrados y las cachés los invalidan
+        return sum(
+            self._script_cerrar_sesiones_usuario(
+                keys=_claves_cerrar_sesiones_usuario(user_id),
+                args=[CANAL_INVALIDACION, self._stream],
+                client=self.nodos[nodo]
+            )
+            for nodo in nodos
+        )
+        
+    def _cerrar_sesiones_por_nodo(self, session_tokens, nodo_de):
+        def cerrar_en_nodo(nodo, indices):
+            cerradas = []
+            for bloque in _en_bloques(indices):
+                respuesta = self._script_cerrar_sesiones(
+                    keys=_claves_cerrar_sesiones([session_tokens[i] for i in bloque]),
+                    args=[CANAL_INVALIDACION, self._stream],
+                    client=self.nodos[nodo]
+                )
+                cerradas.extend(zip(bloque, respuesta))
+            return cerradas
+            
+        resultados = [False] * len(session_tokens)
+        grupos = self._agrupar(range(len(session_tokens)), lambda i: nodo_de(session_tokens[i]))
+        for cerradas in self._en_paralelo(cerrar_en_nodo, grupos).values():
+            for i, cerrada in cerradas:
+                resultados[i] = bool(cerrada)
+        return resultados
         
-    def obtener_estadisticas(self):
+    @metricas.medir
+    def obtener_estadisticas(self, use_primary=False):
         """
         Obtener estadísticas del sistema
-        Comandos: GET, ZCARD, ZRANGE
+        Comandos: ZCOUNT, ZCARD, ZRANGE (un solo pipeline por nodo, o en una
+        réplica si las hay)
+        sesiones_activas se cuenta sobre index:sessions:expiry, por lo que
+        excluye las sesiones que expiraron por TTL sin cerrarse
         """
+        ahora = time.time()
+        
+        def estadisticas_cliente(cliente):
+            pipe = cliente.pipeline(transaction=False)
+            pipe.zcount('index:sessions:expiry', f"({ahora}", '+inf')
+            pipe.zcard('ranking:active_users')
+            pipe.zrange('ranking:active_users', -5, -1, withscores=True)
+            return pipe.execute()
+            
+        def estadisticas_nodo(nodo, _):
+            return self._leer(nodo, estadisticas_cliente, use_primary)
+            
+        parciales = self._en_paralelo(estadisticas_nodo, {nodo: None for nodo in self._nodos_activos()}).values()
+        
+        # Cada usuario vive en un único nodo, así que los totales se suman
+        recientes = sorted((u for _, _, r in parciales for u in r), key=lambda usuario: usuario[1])
         stats = {
-            'sesiones_activas': self.redis_client.get('stats:active_sessions') or '0',
-            'usuarios_en_ranking': self.redis_client.zcard('ranking:active_users'),
-            'usuarios_recientes': self.redis_client.zrange('ranking:active_users', -5, -1, withscores=True)
+            'sesiones_activas': sum(p[0] for p in parciales),
+            'usuarios_en_ranking': sum(p[1] for p in parciales),
+            'usuarios_recientes': recientes[-5:]
         }
         return stats
         
-    def listar_sesiones_activas(self):
+    @metricas.medir
+    def obtener_analitica(self, ventana=3600, granularidad=None, use_primary=False):
+        """
+        Usuarios únicos activos y sesiones creadas en los últimos `ventana`
+        segundos, en total y por cubeta ('minute', 'hour' o 'day')
+        Patrones de clave: stats:active_users:{granularidad}:{inicio} (HyperLogLog)
+        y stats:sessions_created:{granularidad}:{inicio} (contador)
+        Comandos: PFCOUNT (unión de las cubetas en el servidor) y MGET, en un
+        pipeline por nodo
+        """
+        granularidad, inicios = _cubetas_analitica(ventana, granularidad, time.time())
+        claves_usuarios = [f"stats:active_users:{granularidad}:{inicio}" for inicio in inicios]
+        claves_creadas = [f"stats:sessions_created:{granularidad}:{inicio}" for inicio in inicios]
+        
+        def analitica_cliente(cliente):
+            pipe = cliente.pipeline(transaction=False)
+            pipe.pfcount(*claves_usuarios)
+            for clave in claves_usuarios:
+                pipe.pfcount(clave)
+            pipe.mget(claves_creadas)
+            respuestas = pipe.execute()
+            return respuestas[0], respuestas[1:-1], [int(valor or 0) for valor in respuestas[-1]]
+            
+        def analitica_nodo(nodo, _):
+            return self._leer(nodo, analitica_cliente, use_primary)
+            
+        parciales = self._en_paralelo(analitica_nodo, {nodo: None for nodo in self._nodos_activos()}).values()
+        
+        # Cada usuario anota su actividad en su propio nodo: las cuentas
+        # aproximadas de cada nodo se suman
+        return {
+            'ventana': ventana,
+            'granularidad': granularidad,
+            'usuarios_unicos': sum(p[0] for p in parciales),
+            'sesiones_creadas': sum(sum(p[2]) for p in parciales),
+            'serie': [
+                {
+                    'inicio': inicio,
+                    'usuarios_unicos': sum(p[1][i] for p in parciales),
+                    'sesiones_creadas': sum(p[2][i] for p in parciales)
+                }
+                for i, inicio in enumerate(inicios)
+            ]
+        }
+        
+    @metricas.medir
+    def reconciliar_contador(self, max_items=1000):
+        """
+        Corregir la deriva de stats:active_sessions de forma incremental
+        Cada llamada revisa hasta max_items entradas del índice de expiración
+        de cada nodo (ZSCAN, sin recorrer el keyspace) y fija el contador al
+        valor exacto
+        Retorna un resumen de la reconciliación
+        """
+        def reconciliar_nodo(nodo, _):
+            respuesta = self._script_reconciliar(
+                keys=CLAVES_RECONCILIAR, args=[time.time(), max_items], client=self.nodos[nodo]
+            )
+            return _resumen_reconciliacion(*respuesta)
+            
+        parciales = self._en_paralelo(reconciliar_nodo, {nodo: None for nodo in self._nodos_activos()}).values()
+        return {
+            'sesiones_activas': sum(p['sesiones_activas'] for p in parciales),
+            'deriva': sum(p['deriva'] for p in parciales),
+            'huerfanas_eliminadas': sum(p['huerfanas_eliminadas'] for p in parciales),
+            'vuelta_completa': all(p['vuelta_completa'] for p in parciales)
+        }
+        
+    @metricas.medir
+    def listar_sesiones_activas(self, use_primary=False):
         """
         Listar todas las sesiones activas
-        Comando: SCAN con patrón
+        Recorre el índice de expiración página a página (sin SCAN)
+        """
+        return list(self.iterar_sesiones_activas(use_primary=use_primary))
+        
+    def iterar_sesiones_activas(self, batch_size=BATCH_CHUNK_SIZE, use_primary=False):
+        """
+        Generador de sesiones activas leídas por lotes de batch_size
+        Solo mantiene en memoria una página a la vez
+        """
+        cursor = None
+        while True:
+            pagina = self.listar_sesiones_paginado(limit=batch_size, cursor=cursor, use_primary=use_primary)
+            yield from pagina['sesiones']
+            cursor = pagina['cursor']
+            if not cursor:
+                return
+                
+    @metricas.medir
+    def listar_sesiones_paginado(self, limit=100, cursor=None, use_primary=False):
+        """
+        Listar sesiones activas ordenadas por expiración, una página a la vez
+        Patrón de clave: index:sessions:expiry (Sorted Set token -> expiración)
+        Comandos: EVALSHA (ZSCORE, ZRANK, ZRANGE) y un pipeline HGETALL/TTL por página
+        Retorna {'sesiones': [...], 'cursor': siguiente cursor o None}
         """
+        if self.ring:
+            return self._listar_paginado_shards(limit, cursor)
+            
+        def leer(cliente):
+            tokens, expiraciones = self._pagina_indice(cliente, limit, cursor)
+            return _construir_pagina(tokens, expiraciones, self._leer_pagina(cliente, tokens), limit)
+            
+        return self._leer(next(iter(self.nodos)), leer, use_primary)
+        
+    def _pagina_indice(self, cliente, limit, cursor):
+        """Retorna (tokens, expiraciones) de una página del índice de un nodo"""
+        cursor_expiracion, cursor_token = _parsear_cursor(cursor)
+        entradas = self._script_listar_pagina(
+            keys=['index:sessions:expiry'],
+            args=[time.time(), limit, cursor_expiracion, cursor_token],
+            client=cliente
+        )
+        return entradas[::2], entradas[1::2]
+        
+    def _leer_pagina(self, cliente, tokens):
+        """HGETALL y TTL de cada token en un solo pipeline"""
+        pipe = cliente.pipeline(transaction=False)
+        for token in tokens:
+            pipe.hgetall(f"session:{token}")
+            pipe.ttl(f"session:{token}")
+        return pipe.execute()
+        
+    def _listar_paginado_shards(self, limit, cursor):
+        """
+        Paginación sobre varios nodos: se pide una página a cada nodo en
+        paralelo, se mezclan por expiración y se toman las primeras `limit`
+        El cursor guarda la posición de cada nodo ('' = nodo agotado)
+        """
+        posiciones = _decodificar_cursor_shards(cursor)
+        pendientes = {nodo: posiciones.get(nodo) for nodo in self._nodos_activos() if posiciones.get(nodo) != ''}
+        
+        paginas = self._en_paralelo(
+            lambda nodo, posicion: self._pagina_indice(self.nodos[nodo], limit, posicion), pendientes
+        )
+        candidatos = sorted(
+            (float(expiracion), token, nodo, expiracion)
+            for nodo, (tokens, expiraciones) in paginas.items()
+            for token, expiracion in zip(tokens, expiraciones)
+        )[:limit]
+        
+        elegidos = {}
+        for _, token, nodo, expiracion in candidatos:
+            elegidos.setdefault(nodo, []).append((token, expiracion))
+            
+        siguientes = dict(posiciones)
+        for nodo, (tokens, _) in paginas.items():
+            consumidos = elegidos.get(nodo, [])
+            if consumidos:
+                ultimo_token, ultima_expiracion = consumidos[-1]
+                siguientes[nodo] = f"{ultima_expiracion}:{ultimo_token}"
+            if len(tokens) < limit and len(consumidos) == len(tokens):
+                siguientes[nodo] = ''
+                
+        datos = self._en_paralelo(
+            lambda nodo, entradas: self._leer_pagina(self.nodos[nodo], [token for token, _ in entradas]),
+            elegidos
+        )
         sesiones = []
-        for key in self.redis_client.scan_iter(match="session:*"):
-            session_data = self.redis_client.hgetall(key)
-            if session_data:
-                session_data['token'] = key.split(':')[1]
-                session_data['ttl'] = self.redis_client.ttl(key)
-                sesiones.append(session_data)
-        return sesiones
+        for nodo, entradas in elegidos.items():
+            tokens = [token for token, _ in entradas]
+            sesiones.extend(_construir_pagina(tokens, [e for _, e in entradas], datos[nodo], None)['sesiones'])
+        sesiones.sort(key=lambda sesion: sesion['ttl'])
+        
+        siguiente = None
+        if any(siguientes.get(nodo) != '' for nodo in self._nodos_activos()):
+            siguiente = _codificar_cursor_shards(siguientes)
+        return {'sesiones': sesiones, 'cursor': siguiente}
+        
+    @metricas.medir
+    def reconstruir_indice_expiracion(self):
+        """
+        Indexar sesiones creadas antes de existir index:sessions:expiry
+        Migración de una sola vez: recorre session:* con SCAN en cada nodo
+        Retorna el número de sesiones indexadas
+        """
+        count = 0
+        ahora = time.time()
+        for nodo in self._nodos_activos():
+            cliente = self.nodos[nodo]
+            for key in cliente.scan_iter(match="session:*", count=1000):
+                ttl = cliente.ttl(key)
+                if ttl > 0:
+                    cliente.zadd('index:sessions:expiry', {key.split(':', 1)[1]: ahora + ttl})
+                    count += 1
+        return count
+        
+    @metricas.medir
+    def reconstruir_indices_usuario(self):
+        """
+        Crear user:{user_id}:sessions para sesiones anteriores a ese índice
+        Migración de una sola vez: recorre index:sessions:owner con HSCAN en
+        cada nodo. El orden de creación se aproxima con la expiración
+        indexada menos SESSION_TTL
+        Retorna el número de sesiones indexadas
+        """
+        count = 0
+        for nodo in self._nodos_activos():
+            cliente = self.nodos[nodo]
+            for bloque in _en_bloques(list(cliente.hscan_iter('index:sessions:owner', count=1000))):
+                pipe = cliente.pipeline(transaction=False)
+                for token, _ in bloque:
+                    pipe.zscore('index:sessions:expiry', token)
+                expiraciones = pipe.execute()
+                for (token, user_id), expiracion in zip(bloque, expiraciones):
+                    if expiracion is not None:
+                        pipe.zadd(_clave_sesiones_usuario(user_id), {token: expiracion - SESSION_TTL}, nx=True)
+                count += sum(pipe.execute())
+        return count
+        
+    @metricas.medir
+    def eliminar_sesiones_expiradas(self, max_items=BATCH_CHUNK_SIZE):
+        """
+        Limpiar hasta max_items sesiones vencidas según index:sessions:expiry.
+        En modo shards max_items se reparte entre los nodos (el resto, por
+        turnos) para que el total no supere el límite. Borra sus datos
+        secundarios (índice, propietario, índice del usuario, contador y ranking)
+        Comando: EVALSHA (ZRANGEBYSCORE sobre el índice, sin SCAN)
+        Retorna (sesiones eliminadas, sesiones reindexadas)
+        """
+        def eliminar_en_nodo(nodo, limite):
+            return self._script_eliminar_expiradas(
+                keys=CLAVES_ELIMINAR_EXPIRADAS,
+                args=[time.time(), limite, SESSION_TTL, CANAL_INVALIDACION, self._stream],
+                client=self.nodos[nodo]
+            )
+            
+        nodos = self._nodos_activos()
+        cuota, resto = divmod(max_items, len(nodos))
+        inicio = next(self._turno_limpieza) % len(nodos)
+        limites = {}
+        for i, nodo in enumerate(nodos[inicio:] + nodos[:inicio]):
+            if cuota + (i < resto):
+                limites[nodo] = cuota + (i < resto)
+        parciales = self._en_paralelo(eliminar_en_nodo, limites).values()
+        return sum(p[0] for p in parciales), sum(p[1] for p in parciales)
+        
+    @metricas.medir
+    def contar_sesiones_vencidas(self):
+        """Sesiones vencidas pendientes de limpieza en todos los nodos"""
+        ahora = time.time()
+        return sum(self._en_paralelo(
+            lambda nodo, _: self.nodos[nodo].zcount('index:sessions:expiry', '-inf', ahora),
+            {nodo: None for nodo in self._nodos_activos()}
+        ).values())
         
-    def limpiar_sesiones_expiradas(self):
+    @metricas.medir
+    def limpiar_sesiones_expiradas(self, max_items=1000):
         """
-        Limpiar sesiones expiradas manualmente
-        Útil para demostración
+        Limpiar sesiones expiradas manualmente (una pasada acotada)
+        La limpieza continua la realiza SessionReaper en segundo plano
+        Retorna el número de sesiones eliminadas
         """
         count = 0
-        for key in self.redis_client.scan_iter(match="session:*"):
-            ttl = self.redis_client.ttl(key)
-            if ttl == -1:  # Sin expiración
-                self.redis_client.expire(key, 3600)
-            elif ttl == -2:  # Clave no existe
-                count += 1
+        while count < max_items:
+            eliminadas, reindexadas = self.eliminar_sesiones_expiradas(min(BATCH_CHUNK_SIZE, max_items - count))
+            count += eliminadas
+            if eliminadas + reindexadas == 0:
+                break
         return count
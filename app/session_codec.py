@@ -0,0 +1,111 @@
+"""
+Códecs de almacenamiento de sesiones
+Deciden qué campos se escriben en el hash session:{token} al crear una
+sesión. La lectura reconoce todos los formatos, de modo que las sesiones
+antiguas siguen siendo válidas mientras se migra el tráfico
+"""
+
+from datetime import datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Los clientes Redis usan encoding_errors='surrogateescape': los bytes que no
+# son UTF-8 (valores msgpack) llegan como str y se recuperan sin pérdida
+ERRORES_CODIFICACION = 'surrogateescape'
+
+class HashSessionCodec:
+    """
+    Formato original: un campo por atributo y fechas ISO-8601
+    El perfil user:{user_id}:profile repite username y email
+    """
+    nombre = 'hash'
+    duplica_perfil = True
+    # Cubeta de analítica (minuto) en que se anotó la última lectura; es
+    # interno y no forma parte de la sesión decodificada
+    campo_cubeta = 'activity_bucket'
+    
+    def campos(self, user_id, username, email, ahora):
+        """Lista plana campo/valor de una sesión nueva"""
+        return [
+            'user_id', user_id,
+            'username', username,
+            'email', email,
+            'created_at', ahora.isoformat(),
+            'last_activity', ahora.isoformat(),
+            'last_activity_ts', ahora.timestamp()
+        ]
+        
+    def reconoce(self, datos):
+        return 'user_id' in datos
+        
+    def decodificar(self, datos):
+        datos.pop(self.campo_cubeta, None)
+        return datos
+
+class PackedSessionCodec:
+    """
+    Formato compacto: campo 'd' con [user_id, username, email, creación]
+    empaquetado en msgpack y campo 'a' con la última actividad, ambas fechas
+    en segundos epoch. No escribe el perfil al crear la sesión
+    """
+    nombre = 'packed'
+    duplica_perfil = False
+    campo_cubeta = 'b'
+    
+    def campos(self, user_id, username, email, ahora):
+        creada = int(ahora.timestamp())
+        return [
+            'd', msgpack.packb([str(user_id), username, email, creada]),
+            'a', creada
+        ]
+        
+    def reconoce(self, datos):
+        return 'd' in datos
+        
+    def decodificar(self, datos):
+        """Convertir al mismo diccionario que produce el formato original"""
+        if msgpack is None:
+            raise RuntimeError("Leer sesiones en formato 'packed' requiere el paquete msgpack")
+        user_id, username, email, creada = msgpack.unpackb(datos['d'].encode('utf-8', ERRORES_CODIFICACION))
+        actividad = int(datos.get('a') or creada)
+        return {
+            'user_id': user_id,
+            'username': username,
+            'email': email,
+            'created_at': datetime.fromtimestamp(creada).isoformat(),
+            'last_activity': datetime.fromtimestamp(actividad).isoformat(),
+            'last_activity_ts': str(actividad)
+        }
+
+CODECS = {
+    HashSessionCodec.nombre: HashSessionCodec(),
+    PackedSessionCodec.nombre: PackedSessionCodec()
+}
+
+def obtener_codec(nombre):
+    """Códec de escritura por nombre ('hash' o 'packed')"""
+    if nombre not in CODECS:
+        raise ValueError(f"Códec de sesión desconocido: {nombre}")
+    if nombre == PackedSessionCodec.nombre and msgpack is None:
+        raise RuntimeError("El códec 'packed' requiere el paquete msgpack")
+    return CODECS[nombre]
+
+def formato_sesion(datos):
+    """Nombre del formato de un hash de sesión leído de Redis, o None"""
+    for codec in CODECS.values():
+        if codec.reconoce(datos):
+            return codec.nombre
+    return None
+
+def decodificar_sesion(datos):
+    """
+    Decodificar un hash de sesión en cualquier formato conocido
+    Retorna None si la sesión no existe (hash vacío)
+    """
+    if not datos:
+        return None
+    formato = formato_sesion(datos)
+    return CODECS[formato].decodificar(datos) if formato else datos
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Reaper de sesiones expiradas
+Limpia en segundo plano, por tramos acotados en tiempo y cantidad, las
+sesiones vencidas de index:sessions:expiry y sus datos secundarios.
+Tras cada ciclo publica sus métricas en stats:session_reaper, donde las
+lee /api/health aunque el reaper corra como proceso independiente
+
+Uso como proceso independiente:
+    python session_reaper.py --host redis --port 6379
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+import redis
+
+import lua_scripts
+from redis_operations import RedisSessionManager, BATCH_CHUNK_SIZE
+from sharding import parsear_nodos
+
+class SessionReaper:
+    """Limpieza incremental de sesiones expiradas con un único reaper activo (lock en Redis)"""
+    LOCK_KEY = 'lock:session_reaper'
+    CLAVE_METRICAS = 'stats:session_reaper'
+    
+    def __init__(self, session_manager, interval=1.0, max_per_tick=1000, time_budget_ms=50,
+                 batch_size=BATCH_CHUNK_SIZE, reconcile_items=BATCH_CHUNK_SIZE):
+        self.session_manager = session_manager
+        self.interval = interval
+        self.max_per_tick = max_per_tick
+        self.time_budget_ms = time_budget_ms
+        self.batch_size = batch_size
+        self.reconcile_items = reconcile_items
+        
+        cliente = session_manager.redis_client
+        self._cliente = cliente
+        self._id = str(uuid.uuid4())
+        self._script_adquirir_lock = cliente.register_script(lua_scripts.ADQUIRIR_LOCK)
+        self._script_liberar_lock = cliente.register_script(lua_scripts.LIBERAR_LOCK)
+        # El lock vence solo si el reaper deja de renovarlo durante varios ciclos
+        self._lock_ms = int(max(interval * 5, 5) * 1000)
+        
+        self._detener = threading.Event()
+        self._hilo = None
+        self._metricas = {
+            'ciclos': 0,
+            'ciclos_sin_lock': 0,
+            'errores': 0,
+            'sesiones_eliminadas': 0,
+            'sesiones_reindexadas': 0,
+            'huerfanas_eliminadas': 0,
+            'pendientes': 0,
+            'duracion_ultimo_ciclo_ms': 0.0,
+            'ultimo_ciclo': None
+        }
+        self._lock_metricas = threading.Lock()
+        
+    def _adquirir_lock(self):
+        return self._script_adquirir_lock(keys=[self.LOCK_KEY], args=[self._id, self._lock_ms]) == 1
+        
+    def _liberar_lock(self):
+        self._script_liberar_lock(keys=[self.LOCK_KEY], args=[self._id])
+        
+    def _publicar_metricas(self):
+        """
+        Guardar las métricas acumuladas en CLAVE_METRICAS (JSON); caducan
+        con el lock, así que desaparecen si el reaper deja de funcionar
+        Comando: SET con PX
+        """
+        self._cliente.set(self.CLAVE_METRICAS, json.dumps({**self.metricas(), 'id': self._id}), px=self._lock_ms)
+        
+    def ejecutar_ciclo(self):
+        """
+        Ejecutar un tramo de limpieza
+        Se detiene al alcanzar max_per_tick sesiones, agotar time_budget_ms
+        o quedarse sin sesiones vencidas
+        Retorna las métricas del ciclo
+        """
+        if not self._adquirir_lock():
+            with self._lock_metricas:
+                self._metricas['ciclos_sin_lock'] += 1
+            return None
+            
+        inicio = time.perf_counter()
+        limite = inicio + self.time_budget_ms / 1000
+        eliminadas = reindexadas = 0
+        
+        while eliminadas + reindexadas < self.max_per_tick and time.perf_counter() < limite:
+            lote = min(self.batch_size, self.max_per_tick - eliminadas - reindexadas)
+            e, r = self.session_manager.eliminar_sesiones_expiradas(lote)
+            eliminadas += e
+            reindexadas += r
+            # En modo shards el lote se reparte entre nodos: uno sin vencidas
+            # no significa que los demás hayan terminado
+            if e + r == 0:
+                break
+                
+        reconciliacion = self.session_manager.reconciliar_contador(self.reconcile_items)
+        pendientes = self.session_manager.contar_sesiones_vencidas()
+        duracion = (time.perf_counter() - inicio) * 1000
+        
+        ciclo = {
+            'sesiones_eliminadas': eliminadas,
+            'sesiones_reindexadas': reindexadas,
+            'huerfanas_eliminadas': reconciliacion['huerfanas_eliminadas'],
+            'pendientes': pendientes,
+            'duracion_ms': round(duracion, 3)
+        }
+        with self._lock_metricas:
+            self._metricas['ciclos'] += 1
+            self._metricas['sesiones_eliminadas'] += eliminadas
+            self._metricas['sesiones_reindexadas'] += reindexadas
+            self._metricas['huerfanas_eliminadas'] += reconciliacion['huerfanas_eliminadas']
+            self._metricas['pendientes'] = pendientes
+            self._metricas['duracion_ultimo_ciclo_ms'] = ciclo['duracion_ms']
+            self._metricas['ultimo_ciclo'] = time.time()
+        self._publicar_metricas()
+        return ciclo
+        
+    def ejecutar(self):
+        """Bucle principal: un ciclo por intervalo hasta que se solicite detener"""
+        try:
+            while not self._detener.is_set():
+                try:
+                    ciclo = self.ejecutar_ciclo()
+                except redis.RedisError as e:
+                    ciclo = None
+                    with self._lock_metricas:
+                        self._metricas['errores'] += 1
+                    print(f"❌ Error en el reaper de sesiones: {e}")
+                # Si quedaron pendientes se continúa sin esperar
+                if not ciclo or not ciclo['pendientes']:
+                    self._detener.wait(self.interval)
+        finally:
+            try:
+                self._liberar_lock()
+            except redis.RedisError:
+                pass
+                
+    def iniciar(self):
+        """Ejecutar el reaper en un hilo de fondo"""
+        self._hilo = threading.Thread(target=self.ejecutar, name='session-reaper', daemon=True)
+        self._hilo.start()
+        return self._hilo
+        
+    def detener(self, timeout=None):
+        """Detener el hilo del reaper y liberar el lock"""
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            
+    def metricas(self):
+        """Métricas acumuladas del reaper"""
+        with self._lock_metricas:
+            return dict(self._metricas)
+
+def metricas_publicadas(cliente):
+    """Métricas que publicó el reaper activo (de cualquier proceso), o None"""
+    datos = cliente.get(SessionReaper.CLAVE_METRICAS)
+    return json.loads(datos) if datos else None
+
+def main():
+    parser = argparse.ArgumentParser(description='Reaper de sesiones expiradas')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--interval', type=float, default=float(os.getenv('REAPER_INTERVAL', 1)))
+    parser.add_argument('--max-per-tick', type=int, default=int(os.getenv('REAPER_MAX_PER_TICK', 1000)))
+    parser.add_argument('--time-budget-ms', type=float, default=float(os.getenv('REAPER_TIME_BUDGET_MS', 50)))
+    args = parser.parse_args()
+    
+    session_manager = RedisSessionManager(
+        host=args.host,
+        port=args.port,
+        nodes=parsear_nodos(os.getenv('REDIS_NODES', '')),
+        side_effects=os.getenv('SESSION_SIDE_EFFECTS', 'inline')
+    )
+    reaper = SessionReaper(
+        session_manager,
+        interval=args.interval,
+        max_per_tick=args.max_per_tick,
+        time_budget_ms=args.time_budget_ms
+    )
+    print(f"🧹 Reaper de sesiones conectado a {args.host}:{args.port}")
+    try:
+        reaper.ejecutar()
+    except KeyboardInterrupt:
+        pass
+    print(f"Métricas finales: {reaper.metricas()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Tokens de sesión firmados y filtro de tokens revocados
+Un token firmado lleva su expiración y una firma HMAC-SHA256:
+    {cuerpo}.{expiración epoch en hex}.{firma base64url}
+donde el cuerpo es el token de siempre (uuid, con prefijo de ruteo en modo
+shards). Los tokens con firma incorrecta, caducados o revocados recientemente
+se rechazan en el proceso, sin consultar Redis
+"""
+
+import base64
+import hashlib
+import hmac
+import math
+import re
+import threading
+import time
+
+# Bytes de la firma HMAC que se conservan en el token (128 bits)
+LONGITUD_FIRMA = 16
+
+# Tokens anteriores a la firma: uuid4, con o sin prefijo de ruteo
+_TOKEN_SIN_FIRMA = re.compile(
+    r'^(?:[0-9a-f]{8}\.)?[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
+)
+
+class FirmadorTokens:
+    """
+    Firma y verifica tokens con HMAC-SHA256
+    secretos es una lista: el primero firma y todos verifican, de modo que
+    una clave se puede rotar sin invalidar las sesiones abiertas
+    """
+    def __init__(self, secretos, max_age=86400):
+        if not secretos:
+            raise ValueError('Se necesita al menos un secreto para firmar tokens')
+        self._claves = [secreto.encode('utf-8') for secreto in secretos]
+        self.max_age = max_age
+        
+    def _firma(self, clave, contenido):
+        digest = hmac.new(clave, contenido.encode('utf-8'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:LONGITUD_FIRMA]).rstrip(b'=').decode('ascii')
+        
+    def firmar(self, cuerpo, ahora=None):
+        """Token firmado que caduca max_age segundos después de ahora"""
+        expira = int((ahora or time.time()) + self.max_age)
+        contenido = f"{cuerpo}.{expira:x}"
+        return f"{contenido}.{self._firma(self._claves[0], contenido)}"
+        
+    def verificar(self, token, ahora=None):
+        """
+        Retorna 'ok', 'sin_firma' (formato anterior), 'firma' (inválida)
+        o 'expirado'
+        """
+        contenido, separador, firma = token.rpartition('.')
+        cuerpo, _, expira = contenido.rpartition('.')
+        # compare_digest solo admite texto ASCII
+        if not separador or not cuerpo or not firma.isascii():
+            return 'sin_firma' if _TOKEN_SIN_FIRMA.match(token) else 'firma'
+        if not any(hmac.compare_digest(firma, self._firma(clave, contenido)) for clave in self._claves):
+            return 'sin_firma' if _TOKEN_SIN_FIRMA.match(token) else 'firma'
+        if int(expira, 16) <= (ahora or time.time()):
+            return 'expirado'
+        return 'ok'
+
+class FiltroRevocados:
+    """
+    Filtro de Bloom de tokens revocados (cerrados, desalojados o vencidos)
+    Dos generaciones: la actual recibe los tokens y la anterior se sigue
+    consultando; se rotan cada ventana segundos o al llenarse la actual.
+    Un token olvidado por la rotación solo vuelve a costar una consulta a
+    Redis; un falso positivo (probabilidad_error) rechaza un token válido
+    """
+    def __init__(self, capacidad=100000, probabilidad_error=1e-6, ventana=86400):
+        self.capacidad = capacidad
+        self.ventana = ventana
+        self._bits = max(8, math.ceil(-capacidad * math.log(probabilidad_error) / math.log(2) ** 2))
+        self._funciones = max(1, round(self._bits / capacidad * math.log(2)))
+        self._actual = bytearray((self._bits + 7) // 8)
+        self._anterior = bytearray(len(self._actual))
+        self._elementos = 0
+        self._rotada = time.monotonic()
+        self._lock = threading.Lock()
+        
+        self.agregados = 0
+        self.aciertos = 0
+        self.rotaciones = 0
+        
+    def _posiciones(self, token):
+        # Doble hashing (Kirsch-Mitzenmacher) sobre un único digest
+        digest = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self._bits for i in range(self._funciones)]
+        
+    def _rotar_si_toca(self):
+        if self._elementos >= self.capacidad or time.monotonic() - self._rotada >= self.ventana:
+            self._anterior = self._actual
+            self._actual = bytearray(len(self._anterior))
+            self._elementos = 0
+            self._rotada = time.monotonic()
+            self.rotaciones += 1
+            
+    def agregar(self, *tokens):
+        """Marcar tokens como revocados"""
+        with self._lock:
+            for token in tokens:
+                self._rotar_si_toca()
+                for posicion in self._posiciones(token):
+                    self._actual[posicion >> 3] |= 1 << (posicion & 7)
+                self._elementos += 1
+                self.agregados += 1
+                
+    def contiene(self, token):
+        """True si el token fue revocado (o es un falso positivo)"""
+        posiciones = self._posiciones(token)
+        with self._lock:
+            for bits in (self._actual, self._anterior):
+                if all(bits[posicion >> 3] & (1 << (posicion & 7)) for posicion in posiciones):
+                    self.aciertos += 1
+                    return True
+        return False
+        
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'bytes': 2 * len(self._actual),
+                'funciones_hash': self._funciones,
+                'elementos_generacion_actual': self._elementos,
+                'agregados': self.agregados,
+                'aciertos': self.aciertos,
+                'rotaciones': self.rotaciones
+            }
+
+class ValidadorTokens:
+    """
+    Filtro local previo a Redis: firma y expiración (si hay firmador) y
+    revocaciones recientes (si hay filtro). aceptar_sin_firma deja pasar
+    los tokens con formato uuid anteriores a la firma mientras se migra
+    """
+    def __init__(self, firmador=None, filtro=None, aceptar_sin_firma=True):
+        self.firmador = firmador
+        self.filtro = filtro
+        self.aceptar_sin_firma = aceptar_sin_firma
+        self._lock = threading.Lock()
+        self.rechazos = {'firma': 0, 'expirado': 0, 'sin_firma': 0, 'revocado': 0}
+        
+    def generar(self, cuerpo):
+        """Token a entregar para una sesión nueva"""
+        return self.firmador.firmar(cuerpo) if self.firmador else cuerpo
+        
+    def aceptar(self, token):
+        """True si el token merece una consulta a Redis"""
+        motivo = None
+        if self.firmador:
+            motivo = self.firmador.verificar(token)
+            if motivo == 'ok' or (motivo == 'sin_firma' and self.aceptar_sin_firma):
+                motivo = None
+        if motivo is None and self.filtro and self.filtro.contiene(token):
+            motivo = 'revocado'
+        if motivo is None:
+            return True
+        with self._lock:
+            self.rechazos[motivo] += 1
+        return False
+        
+    def revocar(self, *tokens):
+        if self.filtro:
+            self.filtro.agregar(*tokens)
+            
+    def estadisticas(self):
+        with self._lock:
+            estadisticas = {'firmados': self.firmador is not None, 'rechazos': dict(self.rechazos)}
+        if self.filtro:
+            estadisticas['filtro_revocados'] = self.filtro.estadisticas()
+        return estadisticas
@@ -0,0 +1,84 @@
+import bisect
+import hashlib
+import re
+import zlib
+
+# Contenido de la etiqueta hash {...} de una clave (misma convención que Redis Cluster)
+_ETIQUETA_HASH = re.compile(r'\{([^{}]+)\}')
+
+def hash_ruteo(texto):
+    """Posición en el anillo (entero de 32 bits) de un texto de ruteo"""
+    return zlib.crc32(texto.encode('utf-8')) & 0xffffffff
+
+def texto_ruteo(clave):
+    """
+    Texto que decide el nodo de una clave: la etiqueta hash si la tiene
+    (user:{42}:profile -> '42'), o la clave completa
+    """
+    etiqueta = _ETIQUETA_HASH.search(clave)
+    return etiqueta.group(1) if etiqueta else clave
+
+def prefijo_token(user_id):
+    """
+    Prefijo de ruteo de los tokens en modo shards: la posición en el anillo
+    del usuario en hexadecimal, para que sus sesiones vivan en su mismo nodo
+    """
+    return f"{hash_ruteo(str(user_id)):08x}"
+
+def posicion_token(session_token):
+    """Posición en el anillo de un token con prefijo de ruteo, o None si no lo tiene"""
+    prefijo, separador, _ = session_token.partition('.')
+    if separador and len(prefijo) == 8:
+        try:
+            return int(prefijo, 16)
+        except ValueError:
+            return None
+    return None
+
+class HashRing:
+    """
+    Anillo de hashing consistente con nodos virtuales
+    Al añadir un nodo solo cambia de dueño ~1/N de las claves
+    """
+    def __init__(self, nodos, vnodes=160):
+        if not nodos:
+            raise ValueError('Se necesita al menos un nodo')
+        self.nodos = list(nodos)
+        self.vnodes = vnodes
+        self._anillo = []
+        for nodo in self.nodos:
+            for i in range(vnodes):
+                digest = hashlib.md5(f"{nodo}#{i}".encode('utf-8')).digest()
+                self._anillo.append((int.from_bytes(digest[:4], 'big'), nodo))
+        self._anillo.sort()
+        self._posiciones = [posicion for posicion, _ in self._anillo]
+        
+    def nodo_para_posicion(self, posicion):
+        """Primer nodo virtual en sentido horario desde la posición"""
+        indice = bisect.bisect(self._posiciones, posicion) % len(self._anillo)
+        return self._anillo[indice][1]
+        
+    def nodo_para_clave(self, clave):
+        """Nodo dueño de una clave, respetando etiquetas hash"""
+        return self.nodo_para_posicion(hash_ruteo(texto_ruteo(clave)))
+        
+    def nodo_para_token(self, session_token):
+        """Nodo dueño de session:{token}; los tokens con prefijo siguen a su usuario"""
+        posicion = posicion_token(session_token)
+        if posicion is None:
+            return self.nodo_para_clave(f"session:{session_token}")
+        return self.nodo_para_posicion(posicion)
+        
+    def nodo_para_usuario(self, user_id):
+        """Nodo dueño de las claves user:{user_id}:*"""
+        return self.nodo_para_posicion(hash_ruteo(str(user_id)))
+
+def parsear_nodos(texto):
+    """Convertir 'host1:6379,host2:6379' en una lista de (host, puerto)"""
+    nodos = []
+    for nodo in texto.split(','):
+        nodo = nodo.strip()
+        if nodo:
+            host, _, puerto = nodo.rpartition(':')
+            nodos.append((host, int(puerto)))
+    return nodos
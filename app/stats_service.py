@@ -0,0 +1,149 @@
+"""
+Servicio de estadísticas compartidas
+Calcula obtener_estadisticas() una vez por intervalo en un hilo de fondo y
+guarda el resultado: las consultas (/api/estadisticas) y los clientes
+Server-Sent Events (/api/estadisticas/stream) leen la copia en memoria, así
+que la carga sobre Redis no depende del número de paneles abiertos
+"""
+
+import threading
+import time
+
+import redis
+
+class ServicioEstadisticas:
+    """Estadísticas cacheadas y notificadas a los suscriptores en cada cálculo"""
+    def __init__(self, session_manager, interval=2.0, idle_timeout=30.0):
+        """
+        interval: segundos entre cálculos
+        idle_timeout: sin suscriptores ni consultas durante ese tiempo el hilo
+        deja de calcular hasta la siguiente consulta
+        """
+        self.session_manager = session_manager
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        
+        self._condicion = threading.Condition()
+        # Un solo cálculo a la vez aunque lleguen muchas consultas con el valor caducado
+        self._lock_calculo = threading.Lock()
+        self._estadisticas = None
+        self._calculadas = None     # time.monotonic() del último cálculo
+        self._version = 0
+        self._suscriptores = 0
+        self._ultima_consulta = time.monotonic()
+        self._calculos = 0
+        self._errores = 0
+        self._ultimo_error = None
+        
+        self._detener = threading.Event()
+        self._despertar = threading.Event()
+        self._hilo = None
+        
+    def _con_demanda(self):
+        with self._condicion:
+            return self._suscriptores > 0 or time.monotonic() - self._ultima_consulta < self.idle_timeout
+            
+    def calcular(self):
+        """Calcular las estadísticas, guardarlas y notificar a los suscriptores"""
+        try:
+            estadisticas = self.session_manager.obtener_estadisticas()
+        except redis.RedisError as e:
+            with self._condicion:
+                self._errores += 1
+                self._ultimo_error = str(e)
+            raise
+        with self._condicion:
+            self._estadisticas = estadisticas
+            self._calculadas = time.monotonic()
+            self._version += 1
+            self._calculos += 1
+            self._ultimo_error = None
+            self._condicion.notify_all()
+        return estadisticas
+        
+    def ejecutar(self):
+        """Bucle principal: un cálculo por intervalo mientras haya demanda"""
+        while not self._detener.is_set():
+            if self._con_demanda():
+                try:
+                    with self._lock_calculo:
+                        self.calcular()
+                except redis.RedisError as e:
+                    print(f"❌ Error calculando estadísticas: {e}")
+                self._detener.wait(self.interval)
+            else:
+                # En reposo hasta que llegue una consulta o un suscriptor
+                self._despertar.wait(self.interval)
+                self._despertar.clear()
+                
+    def iniciar(self):
+        """Ejecutar el cálculo periódico en un hilo de fondo"""
+        self._hilo = threading.Thread(target=self.ejecutar, name='stats-service', daemon=True)
+        self._hilo.start()
+        return self._hilo
+        
+    def detener(self, timeout=None):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            
+    def _caducado(self, calculadas):
+        return calculadas is None or time.monotonic() - calculadas > 2 * self.interval
+        
+    def obtener(self):
+        """
+        Retorna (estadisticas, edad en segundos)
+        Si no hay valor o el hilo estaba en reposo (valor de más de dos
+        intervalos) se calcula en el momento
+        """
+        with self._condicion:
+            self._ultima_consulta = time.monotonic()
+            estadisticas, calculadas = self._estadisticas, self._calculadas
+        self._despertar.set()
+        if self._caducado(calculadas):
+            with self._lock_calculo:
+                # Otra consulta pudo calcularlas mientras se esperaba el lock
+                with self._condicion:
+                    estadisticas, calculadas = self._estadisticas, self._calculadas
+                if self._caducado(calculadas):
+                    try:
+                        return self.calcular(), 0.0
+                    except redis.RedisError:
+                        # Sin Redis se sirve el último valor conocido, si lo hay
+                        if estadisticas is None:
+                            raise
+        return estadisticas, time.monotonic() - calculadas
+        
+    def esperar(self, version, timeout=15.0):
+        """
+        Esperar un cálculo posterior a version
+        Retorna (version, estadisticas) o (version, None) si vence el timeout
+        """
+        with self._condicion:
+            if self._condicion.wait_for(lambda: self._version != version, timeout):
+                return self._version, self._estadisticas
+            return version, None
+            
+    def suscribir(self):
+        """Registrar un suscriptor (mantiene el hilo calculando)"""
+        with self._condicion:
+            self._suscriptores += 1
+            version = self._version
+        self._despertar.set()
+        return version
+        
+    def desuscribir(self):
+        with self._condicion:
+            self._suscriptores -= 1
+            
+    def metricas(self):
+        """Estado del servicio para /api/health"""
+        with self._condicion:
+            return {
+                'calculos': self._calculos,
+                'errores': self._errores,
+                'ultimo_error': self._ultimo_error,
+                'suscriptores': self._suscriptores,
+                'edad_s': round(time.monotonic() - self._calculadas, 3) if self._calculadas else None
+            }
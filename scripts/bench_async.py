@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark de validación de sesiones: cliente síncrono vs asyncio
+Simula N clientes concurrentes que validan tokens con obtener_sesion,
+usando hilos con RedisSessionManager y corrutinas con AsyncRedisSessionManager
+
+Uso:
+    redis-server --port 6379 --maxclients 10000 &
+    python scripts/bench_async.py --host localhost --concurrencia 100 1000 5000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from redis_operations import RedisSessionManager
+from async_redis_operations import AsyncRedisSessionManager
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    ordenados = sorted(valores)
+    indice = max(0, int(round(p / 100 * len(ordenados))) - 1)
+    return ordenados[indice]
+
+def resumen(modo, clientes, latencias, duracion):
+    return {
+        'modo': modo,
+        'clientes': clientes,
+        'operaciones': len(latencias),
+        'ops_por_segundo': len(latencias) / duracion,
+        'p50_ms': percentil(latencias, 50),
+        'p99_ms': percentil(latencias, 99),
+        'media_ms': statistics.mean(latencias)
+    }
+
+def bench_sync(manager, tokens, clientes, operaciones):
+    """Un hilo por cliente; cada uno valida `operaciones` tokens"""
+    def cliente(indice):
+        latencias = []
+        for i in range(operaciones):
+            token = tokens[(indice + i) % len(tokens)]
+            inicio = time.perf_counter()
+            manager.obtener_sesion(token)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        return latencias
+        
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clientes) as pool:
+        resultados = list(pool.map(cliente, range(clientes)))
+    duracion = time.perf_counter() - inicio
+    return resumen('sync', clientes, [l for r in resultados for l in r], duracion)
+
+async def bench_async(manager, tokens, clientes, operaciones):
+    """Una corrutina por cliente sobre el mismo event loop y pool de conexiones"""
+    async def cliente(indice):
+        latencias = []
+        for i in range(operaciones):
+            token = tokens[(indice + i) % len(tokens)]
+            inicio = time.perf_counter()
+            await manager.obtener_sesion(token)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        return latencias
+        
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(cliente(i) for i in range(clientes)))
+    duracion = time.perf_counter() - inicio
+    return resumen('async', clientes, [l for r in resultados for l in r], duracion)
+
+async def ejecutar_async(args, tokens):
+    manager = AsyncRedisSessionManager(
+        host=args.host, port=args.port, db=args.db, max_connections=args.max_conexiones
+    )
+    try:
+        return [await bench_async(manager, tokens, n, args.operaciones) for n in args.concurrencia]
+    finally:
+        await manager.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sync vs async de obtener_sesion')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--db', type=int, default=15, help='Base de datos dedicada al benchmark (se vacía)')
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--operaciones', type=int, default=20, help='Validaciones por cliente')
+    parser.add_argument('--sesiones', type=int, default=1000)
+    parser.add_argument('--max-conexiones', type=int, default=500, help='Tamaño del pool asyncio')
+    args = parser.parse_args()
+    
+    manager = RedisSessionManager(host=args.host, port=args.port, db=args.db)
+    manager.redis_client.flushdb()
+    resultado = manager.crear_sesiones([
+        {'user_id': f"bench_{i}", 'username': f"Usuario {i}", 'email': f"bench_{i}@ejemplo.com"}
+        for i in range(args.sesiones)
+    ])
+    tokens = [r['token'] for r in resultado if r['ok']]
+    
+    resultados = [bench_sync(manager, tokens, n, args.operaciones) for n in args.concurrencia]
+    resultados += asyncio.run(ejecutar_async(args, tokens))
+    
+    print(f"{'modo':<6} {'clientes':>8} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for r in sorted(resultados, key=lambda r: (r['clientes'], r['modo'])):
+        print(f"{r['modo']:<6} {r['clientes']:>8} {r['ops_por_segundo']:>10.0f} "
+              f"{r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f}")
+              
+    manager.redis_client.flushdb()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark de backends de sesiones
+Compara la latencia (p50/p99) y el rendimiento de crear_sesion y
+obtener_sesion con:
+- memory: MemorySessionManager (motor en proceso, sin Redis)
+- memory+aof: el mismo con persistencia AOF (fsync 'everysec')
+- redis: RedisSessionManager sin caché local
+- redis+lru / redis+engine: RedisSessionManager con caché local L1
+  (NearCache LRU o motor en proceso)
+Las lecturas siguen una distribución sesgada (el 20 % de los tokens recibe
+el 80 % de las lecturas), como un panel con usuarios muy activos
+
+Uso:
+    redis-server --port 6379 &
+    python scripts/bench_backends.py --host localhost --port 6379 -n 5000
+    python scripts/bench_backends.py --solo-memoria     # sin servidor Redis
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import redis
+
+from memory_operations import MemorySessionManager
+from redis_operations import RedisSessionManager
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    ordenados = sorted(valores)
+    indice = max(0, int(round(p / 100 * len(ordenados))) - 1)
+    return ordenados[indice]
+
+def medir(funcion, argumentos):
+    """Ejecutar funcion(*a) por cada a; retorna (latencias en ms, operaciones por segundo)"""
+    latencias = []
+    inicio_total = time.perf_counter()
+    for a in argumentos:
+        inicio = time.perf_counter()
+        funcion(*a)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias, len(argumentos) / (time.perf_counter() - inicio_total)
+
+def lecturas_sesgadas(tokens, lecturas, semilla=7):
+    """80 % de las lecturas sobre el 20 % de los tokens"""
+    aleatorio = random.Random(semilla)
+    calientes = tokens[:max(1, len(tokens) // 5)]
+    return [(aleatorio.choice(calientes if aleatorio.random() < 0.8 else tokens),) for _ in range(lecturas)]
+
+def imprimir_resultado(nombre, operacion, latencias, por_segundo):
+    print(f"{nombre:<14} {operacion:<8} p50={percentil(latencias, 50):7.3f} ms  "
+          f"p99={percentil(latencias, 99):7.3f} ms  "
+          f"media={statistics.mean(latencias):7.3f} ms  {por_segundo:9.0f} op/s")
+
+def ejecutar(nombre, manager, iteraciones, lecturas):
+    creaciones = [(f"bench_{nombre}_{i}", "Usuario Bench", "bench@ejemplo.com") for i in range(iteraciones)]
+    tokens = []
+    latencias, por_segundo = medir(lambda *a: tokens.append(manager.crear_sesion(*a)), creaciones)
+    imprimir_resultado(nombre, 'crear', latencias, por_segundo)
+    latencias, por_segundo = medir(manager.obtener_sesion, lecturas_sesgadas(tokens, lecturas))
+    imprimir_resultado(nombre, 'obtener', latencias, por_segundo)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de backends de sesiones')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--db', type=int, default=15, help='Base de datos dedicada al benchmark (se vacía)')
+    parser.add_argument('-n', '--iteraciones', type=int, default=5000, help='Sesiones creadas por backend')
+    parser.add_argument('--lecturas', type=int, default=20000, help='Lecturas por backend')
+    parser.add_argument('--cache-size', type=int, default=2000, help='Entradas de la caché L1')
+    parser.add_argument('--solo-memoria', action='store_true', help='No medir los backends con Redis')
+    args = parser.parse_args()
+    
+    print(f"Benchmark de backends: {args.iteraciones} sesiones y {args.lecturas} lecturas por backend")
+    
+    ejecutar('memory', MemorySessionManager(), args.iteraciones, args.lecturas)
+    with tempfile.TemporaryDirectory() as directorio:
+        manager = MemorySessionManager(aof_path=os.path.join(directorio, 'sesiones.aof'))
+        ejecutar('memory+aof', manager, args.iteraciones, args.lecturas)
+        manager.cerrar()
+    if args.solo_memoria:
+        return
+        
+    backends = {
+        'redis': {},
+        'redis+lru': {'cache_size': args.cache_size, 'cache_backend': 'lru'},
+        'redis+engine': {'cache_size': args.cache_size, 'cache_backend': 'engine'}
+    }
+    for nombre, opciones in backends.items():
+        manager = RedisSessionManager(host=args.host, port=args.port, db=args.db, **opciones)
+        try:
+            manager.redis_client.flushdb()
+        except redis.ConnectionError:
+            print(f"Redis no disponible en {args.host}:{args.port}; usa --solo-memoria")
+            return
+        ejecutar(nombre, manager, args.iteraciones, args.lecturas)
+        manager.redis_client.flushdb()
+
+if __name__ == '__main__':
+    main()
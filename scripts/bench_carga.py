@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga del servicio de sesiones
+Ejecuta una mezcla configurable de operaciones (crear, obtener, cerrar,
+listar, estadisticas) con N clientes concurrentes, directamente contra
+RedisSessionManager o por HTTP contra app.py, y reporta throughput,
+percentiles de latencia (histograma HDR) y comandos Redis por operación.
+Los resultados se guardan en JSON para comparar ejecuciones
+Sin --spawn usa la base de datos --db (15 por defecto) del Redis indicado
+y la vacía antes y después; en modo http, app.py debe usar la misma base
+(REDIS_DB)
+
+Uso:
+    # Redis local lanzado por el propio script
+    python scripts/bench_carga.py --spawn --concurrencia 16 --duracion 30 --salida base.json
+    # Por HTTP (con --spawn también lanza app.py contra ese Redis)
+    python scripts/bench_carga.py --modo http --spawn --concurrencia 16 --salida http.json
+    # Comparar con una ejecución anterior
+    python scripts/bench_carga.py --spawn --salida nuevo.json --comparar base.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+DIRECTORIO_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, DIRECTORIO_APP)
+
+import redis
+
+from redis_operations import RedisSessionManager
+
+try:
+    from hdrh.histogram import HdrHistogram
+except ImportError:
+    HdrHistogram = None
+
+MEZCLA_POR_DEFECTO = 'crear=10,obtener=70,cerrar=10,listar=5,estadisticas=5'
+PERCENTILES = (50, 90, 99, 99.9)
+
+class Latencias:
+    """
+    Histograma de latencias en microsegundos
+    Usa HdrHistogram (paquete hdrhistogram) si está instalado; si no,
+    guarda las muestras y calcula los percentiles exactos
+    """
+    def __init__(self):
+        self.histograma = HdrHistogram(1, 60 * 1000 * 1000, 3) if HdrHistogram else None
+        self.muestras = []
+        self.total_us = 0
+        
+    def registrar(self, microsegundos):
+        microsegundos = max(int(microsegundos), 1)
+        self.total_us += microsegundos
+        if self.histograma:
+            self.histograma.record_value(microsegundos)
+        else:
+            self.muestras.append(microsegundos)
+            
+    def contar(self):
+        return self.histograma.get_total_count() if self.histograma else len(self.muestras)
+        
+    def percentil(self, p):
+        if self.histograma:
+            return self.histograma.get_value_at_percentile(p)
+        ordenados = sorted(self.muestras)
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+        
+    def resumen(self, duracion, errores):
+        n = self.contar()
+        datos = {'operaciones': n, 'errores': errores, 'ops_por_segundo': n / duracion}
+        if n:
+            datos['media_ms'] = self.total_us / n / 1000
+            for p in PERCENTILES:
+                datos[f"p{p:g}_ms"] = self.percentil(p) / 1000
+            datos['max_ms'] = self.percentil(100) / 1000
+        return datos
+
+class ClienteDirecto:
+    """Operaciones contra RedisSessionManager en el mismo proceso"""
+    def __init__(self, manager):
+        self.manager = manager
+        
+    def crear(self, user_id):
+        return self.manager.crear_sesion(user_id, f"Usuario {user_id}", f"{user_id}@ejemplo.com")
+        
+    def obtener(self, token):
+        return self.manager.obtener_sesion(token)
+        
+    def cerrar(self, token):
+        return self.manager.cerrar_sesion(token)
+        
+    def listar(self):
+        return self.manager.listar_sesiones_paginado(limit=100)
+        
+    def estadisticas(self):
+        return self.manager.obtener_estadisticas()
+
+class ClienteHTTP:
+    """Operaciones contra las APIs JSON de app.py (una conexión por hilo)"""
+    def __init__(self, url):
+        destino = urlparse(url)
+        self.host, self.port = destino.hostname, destino.port or 80
+        self.local = threading.local()
+        
+    def _peticion(self, metodo, ruta, cuerpo=None):
+        if not hasattr(self.local, 'conexion'):
+            self.local.conexion = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        conexion = self.local.conexion
+        try:
+            conexion.request(metodo, ruta, body=json.dumps(cuerpo) if cuerpo is not None else None,
+                             headers={'Content-Type': 'application/json'})
+            respuesta = conexion.getresponse()
+            datos = respuesta.read()
+        except (http.client.HTTPException, OSError):
+            conexion.close()
+            raise
+        if respuesta.status >= 400:
+            raise RuntimeError(f"HTTP {respuesta.status} en {ruta}")
+        return json.loads(datos)
+        
+    def crear(self, user_id):
+        resultado = self._peticion('POST', '/api/sesiones/batch', {'sesiones': [
+            {'user_id': user_id, 'username': f"Usuario {user_id}", 'email': f"{user_id}@ejemplo.com"}
+        ]})['resultados'][0]
+        if not resultado['ok']:
+            raise RuntimeError(resultado['error'])
+        return resultado['token']
+        
+    def obtener(self, token):
+        return self._peticion('POST', '/api/sesiones/batch/obtener', {'tokens': [token]})
+        
+    def cerrar(self, token):
+        return self._peticion('POST', '/api/sesiones/batch/cerrar', {'tokens': [token]})
+        
+    def listar(self):
+        return self._peticion('GET', '/api/sesiones_activas?limit=100')
+        
+    def estadisticas(self):
+        return self._peticion('GET', '/api/estadisticas')
+
+def parsear_mezcla(texto):
+    """'crear=10,obtener=70' -> {'crear': 10.0, 'obtener': 70.0}"""
+    mezcla = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        if nombre.strip() not in ('crear', 'obtener', 'cerrar', 'listar', 'estadisticas'):
+            raise ValueError(f"Operación desconocida en la mezcla: {nombre}")
+        mezcla[nombre.strip()] = float(peso)
+    return mezcla
+
+def estadisticas_comandos(r):
+    """Llamadas acumuladas por comando (INFO commandstats)"""
+    return {
+        nombre.split('_', 1)[1]: datos['calls']
+        for nombre, datos in r.info('commandstats').items()
+    }
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def esperar(condicion, segundos=10):
+    limite = time.time() + segundos
+    while time.time() < limite:
+        try:
+            if condicion():
+                return
+        except Exception:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('El proceso lanzado no respondió a tiempo')
+
+def lanzar_redis():
+    """Iniciar un redis-server local sin persistencia; retorna (proceso, puerto)"""
+    ejecutable = shutil.which('redis-server')
+    if not ejecutable:
+        raise RuntimeError('No se encontró redis-server en el PATH')
+    puerto = puerto_libre()
+    proceso = subprocess.Popen(
+        [ejecutable, '--port', str(puerto), '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL
+    )
+    esperar(lambda: redis.Redis(port=puerto).ping())
+    return proceso, puerto
+
+def lanzar_app(redis_port, db):
+    """Iniciar app.py (servidor Flask con hilos) contra el Redis indicado"""
+    puerto = puerto_libre()
+    entorno = dict(os.environ, REDIS_HOST='127.0.0.1', REDIS_PORT=str(redis_port), REDIS_DB=str(db))
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(puerto), '--with-threads'],
+        cwd=DIRECTORIO_APP, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    
+    def responde():
+        conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=1)
+        conexion.request('GET', '/api/health')
+        return conexion.getresponse().status == 200
+        
+    esperar(responde)
+    return proceso, f"http://127.0.0.1:{puerto}"
+
+def ejecutar_carga(cliente, mezcla, concurrencia, duracion, tokens):
+    """
+    Lanzar `concurrencia` hilos que eligen operaciones según la mezcla
+    durante `duracion` segundos. tokens es el conjunto compartido de
+    sesiones vivas que consumen obtener y cerrar
+    Retorna {operacion: (Latencias, errores)} y la duración real
+    """
+    lock = threading.Lock()
+    operaciones = list(mezcla)
+    pesos = [mezcla[op] for op in operaciones]
+    resultados = {op: [Latencias(), 0] for op in operaciones}
+    fin = time.perf_counter() + duracion
+    
+    def trabajador(indice):
+        azar = random.Random(indice)
+        locales = {op: [Latencias(), 0] for op in operaciones}
+        contador = 0
+        while time.perf_counter() < fin:
+            op = azar.choices(operaciones, pesos)[0]
+            token = None
+            if op in ('obtener', 'cerrar'):
+                with lock:
+                    if not tokens:
+                        op = 'crear'
+                    elif op == 'cerrar':
+                        token = tokens.pop(azar.randrange(len(tokens)))
+                    else:
+                        token = tokens[azar.randrange(len(tokens))]
+            inicio = time.perf_counter()
+            try:
+                if op == 'crear':
+                    nuevo = cliente.crear(f"carga_{indice}_{contador}")
+                    contador += 1
+                    with lock:
+                        tokens.append(nuevo)
+                elif op in ('obtener', 'cerrar'):
+                    getattr(cliente, op)(token)
+                else:
+                    getattr(cliente, op)()
+            except Exception:
+                locales[op][1] += 1
+                continue
+            locales[op][0].registrar((time.perf_counter() - inicio) * 1e6)
+            
+        with lock:
+            for op, (latencias, errores) in locales.items():
+                resultados[op][1] += errores
+                if latencias.histograma:
+                    resultados[op][0].histograma.add(latencias.histograma)
+                else:
+                    resultados[op][0].muestras.extend(latencias.muestras)
+                resultados[op][0].total_us += latencias.total_us
+                
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados, time.perf_counter() - inicio
+
+def imprimir(informe):
+    print(f"\n{informe['modo']} | {informe['concurrencia']} clientes | {informe['duracion_s']:.1f} s | "
+          f"{informe['total']['ops_por_segundo']:.0f} ops/s | "
+          f"{informe['redis']['comandos_por_operacion']:.2f} comandos Redis/op")
+    print(f"{'operación':<13} {'ops':>8} {'err':>5} {'ops/s':>9} {'p50 ms':>8} {'p90 ms':>8} "
+          f"{'p99 ms':>8} {'p99.9 ms':>9} {'max ms':>8}")
+    for op, datos in informe['operaciones'].items():
+        if not datos['operaciones']:
+            continue
+        print(f"{op:<13} {datos['operaciones']:>8} {datos['errores']:>5} {datos['ops_por_segundo']:>9.0f} "
+              f"{datos['p50_ms']:>8.3f} {datos['p90_ms']:>8.3f} {datos['p99_ms']:>8.3f} "
+              f"{datos['p99.9_ms']:>9.3f} {datos['max_ms']:>8.3f}")
+
+def comparar(informe, anterior):
+    """Diferencias de throughput y p99 respecto a una ejecución anterior"""
+    print(f"\nComparación con {anterior['fecha']} ({anterior['modo']}, {anterior['concurrencia']} clientes)")
+    print(f"{'operación':<13} {'ops/s':>16} {'p99 ms':>20}")
+    for op, datos in informe['operaciones'].items():
+        previo = anterior['operaciones'].get(op)
+        if not previo or not previo['operaciones'] or not datos['operaciones']:
+            continue
+        cambio_ops = (datos['ops_por_segundo'] / previo['ops_por_segundo'] - 1) * 100
+        cambio_p99 = (datos['p99_ms'] / previo['p99_ms'] - 1) * 100
+        print(f"{op:<13} {datos['ops_por_segundo']:>9.0f} {cambio_ops:>+6.1f}% "
+              f"{datos['p99_ms']:>12.3f} {cambio_p99:>+6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del servicio de sesiones')
+    parser.add_argument('--modo', choices=['directo', 'http'], default='directo')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--db', type=int, default=15, help='Base de datos dedicada a la prueba (se vacía)')
+    parser.add_argument('--url', default='http://localhost:5000', help='URL de app.py en modo http')
+    parser.add_argument('--spawn', action='store_true',
+                        help='Lanzar un redis-server local (y app.py en modo http) para la prueba')
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--duracion', type=float, default=30, help='Segundos de carga medida')
+    parser.add_argument('--calentamiento', type=float, default=3, help='Segundos de carga no medida')
+    parser.add_argument('--mezcla', default=MEZCLA_POR_DEFECTO, help='Pesos por operación')
+    parser.add_argument('--sesiones-iniciales', type=int, default=1000)
+    parser.add_argument('--codec', default='hash', help='Códec de sesión en modo directo')
+    parser.add_argument('--salida', help='Guardar el informe JSON en este archivo')
+    parser.add_argument('--comparar', help='Informe JSON anterior con el que comparar')
+    args = parser.parse_args()
+    
+    mezcla = parsear_mezcla(args.mezcla)
+    procesos = []
+    manager = None
+    try:
+        if args.spawn:
+            proceso, args.port = lanzar_redis()
+            args.host = '127.0.0.1'
+            procesos.append(proceso)
+            if args.modo == 'http':
+                proceso, args.url = lanzar_app(args.port, args.db)
+                procesos.append(proceso)
+                
+        manager = RedisSessionManager(host=args.host, port=args.port, db=args.db, codec=args.codec)
+        r = manager.redis_client
+        r.flushdb()
+        cliente = ClienteDirecto(manager) if args.modo == 'directo' else ClienteHTTP(args.url)
+        
+        resultado = manager.crear_sesiones([
+            {'user_id': f"carga_inicial_{i}", 'username': 'Usuario Carga', 'email': 'carga@ejemplo.com'}
+            for i in range(args.sesiones_iniciales)
+        ])
+        tokens = [res['token'] for res in resultado if res['ok']]
+        
+        if args.calentamiento > 0:
+            ejecutar_carga(cliente, mezcla, args.concurrencia, args.calentamiento, tokens)
+            
+        comandos_antes = estadisticas_comandos(r)
+        resultados, duracion = ejecutar_carga(cliente, mezcla, args.concurrencia, args.duracion, tokens)
+        comandos_despues = estadisticas_comandos(r)
+        
+        comandos = {
+            nombre: llamadas - comandos_antes.get(nombre, 0)
+            for nombre, llamadas in comandos_despues.items()
+            if llamadas - comandos_antes.get(nombre, 0) > 0 and nombre != 'info'
+        }
+        total_ops = sum(latencias.contar() for latencias, _ in resultados.values())
+        informe = {
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'modo': args.modo,
+            'concurrencia': args.concurrencia,
+            'duracion_s': duracion,
+            'mezcla': mezcla,
+            'codec': args.codec,
+            'histograma': 'hdr' if HdrHistogram else 'exacto',
+            'total': {'operaciones': total_ops, 'ops_por_segundo': total_ops / duracion},
+            'operaciones': {
+                op: latencias.resumen(duracion, errores) for op, (latencias, errores) in resultados.items()
+            },
+            'redis': {
+                'comandos_por_operacion': sum(comandos.values()) / max(total_ops, 1),
+                'comandos': dict(sorted(comandos.items(), key=lambda c: -c[1]))
+            }
+        }
+        imprimir(informe)
+        
+        if args.comparar:
+            with open(args.comparar, encoding='utf-8') as archivo:
+                comparar(informe, json.load(archivo))
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2, ensure_ascii=False)
+            print(f"\nInforme guardado en {args.salida}")
+    finally:
+        if manager is not None:
+            manager.redis_client.flushdb()
+        for proceso in reversed(procesos):
+            proceso.terminate()
+            proceso.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark de creación de sesiones
+Compara la latencia (p50/p99) del flujo anterior, con un comando por
+viaje de red, contra el script Lua atómico de RedisSessionManager
+
+Uso:
+    redis-server --port 6379 &
+    python scripts/bench_crear_sesion.py --host localhost --port 6379 -n 5000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from redis_operations import RedisSessionManager, SESSION_TTL
+
+def crear_sesion_secuencial(r, user_id, username, email):
+    """Flujo original: HSET, EXPIRE, INCR, HSET (perfil) y ZADD por separado"""
+    session_token = str(uuid.uuid4())
+    session_key = f"session:{session_token}"
+    session_data = {
+        'user_id': user_id,
+        'username': username,
+        'email': email,
+        'created_at': datetime.now().isoformat(),
+        'last_activity': datetime.now().isoformat()
+    }
+    r.hset(session_key, mapping=session_data)
+    r.expire(session_key, SESSION_TTL)
+    r.incr('stats:active_sessions')
+    r.hset(f"user:{user_id}:profile", mapping={
+        'user_id': user_id,
+        'username': username,
+        'email': email,
+        'updated_at': datetime.now().isoformat()
+    })
+    r.zadd('ranking:active_users', {user_id: time.time()})
+    return session_token
+
+def medir(nombre, funcion, iteraciones, calentamiento):
+    """Ejecutar la función y devolver las latencias en milisegundos"""
+    for i in range(calentamiento):
+        funcion(f"bench_warm_{i}", "Usuario Bench", "bench@ejemplo.com")
+
+    latencias = []
+    for i in range(iteraciones):
+        inicio = time.perf_counter()
+        funcion(f"bench_{nombre}_{i}", "Usuario Bench", "bench@ejemplo.com")
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    ordenados = sorted(valores)
+    indice = max(0, int(round(p / 100 * len(ordenados))) - 1)
+    return ordenados[indice]
+
+def imprimir_resultado(nombre, latencias):
+    print(f"{nombre:<22} p50={percentil(latencias, 50):7.3f} ms  "
+          f"p99={percentil(latencias, 99):7.3f} ms  "
+          f"media={statistics.mean(latencias):7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de crear_sesion')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--db', type=int, default=15, help='Base de datos dedicada al benchmark (se vacía)')
+    parser.add_argument('-n', '--iteraciones', type=int, default=5000)
+    parser.add_argument('--calentamiento', type=int, default=200)
+    args = parser.parse_args()
+
+    manager = RedisSessionManager(host=args.host, port=args.port, db=args.db)
+    r = manager.redis_client
+    r.flushdb()
+
+    print(f"Benchmark crear_sesion contra {args.host}:{args.port} (db {args.db}), "
+          f"{args.iteraciones} iteraciones")
+
+    antes = medir('secuencial', lambda *a: crear_sesion_secuencial(r, *a),
+                  args.iteraciones, args.calentamiento)
+    despues = medir('script', manager.crear_sesion, args.iteraciones, args.calentamiento)
+
+    imprimir_resultado('Antes (5 comandos)', antes)
+    imprimir_resultado('Después (script Lua)', despues)
+    print(f"Mejora p50: {percentil(antes, 50) / percentil(despues, 50):.2f}x  "
+          f"p99: {percentil(antes, 99) / percentil(despues, 99):.2f}x")
+
+    r.flushdb()
+
+if __name__ == '__main__':
+    main()
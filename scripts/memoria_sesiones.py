@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Informe de memoria por sesión para cada códec de session_codec
+Crea N sesiones con cada códec en una base de datos dedicada y reporta
+MEMORY USAGE de la clave session:{token}, del perfil que la acompaña y el
+incremento total de used_memory (índices incluidos) por sesión.
+Con --existentes, en lugar de crear sesiones, mide las que ya hay en la
+base de datos agrupadas por formato
+
+Uso:
+    python scripts/memoria_sesiones.py --host localhost --port 6379 -n 10000
+    python scripts/memoria_sesiones.py --host localhost --db 0 --existentes
+"""
+
+import argparse
+import itertools
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from redis_operations import RedisSessionManager, _en_bloques
+from session_codec import CODECS, formato_sesion
+
+def memoria_claves(r, claves):
+    """MEMORY USAGE (SAMPLES 0, exacto) de cada clave; 0 si no existe"""
+    resultado = []
+    for bloque in _en_bloques(claves, 1000):
+        pipe = r.pipeline(transaction=False)
+        for clave in bloque:
+            pipe.memory_usage(clave, samples=0)
+        resultado.extend(bytes_usados or 0 for bytes_usados in pipe.execute())
+    return resultado
+
+def medir_codec(host, port, db, nombre, n):
+    """Crear n sesiones con el códec y medir su memoria"""
+    manager = RedisSessionManager(host=host, port=port, db=db, codec=nombre)
+    r = manager.redis_client
+    r.flushdb()
+    antes = r.info('memory')['used_memory']
+    
+    resultados = []
+    for inicio in range(0, n, 1000):
+        resultados += manager.crear_sesiones([
+            {'user_id': f"mem_{i}", 'username': f"Usuario Memoria {i}", 'email': f"usuario.memoria.{i}@ejemplo.com"}
+            for i in range(inicio, min(inicio + 1000, n))
+        ])
+    despues = r.info('memory')['used_memory']
+    tokens = [res['token'] for res in resultados if res['ok']]
+    
+    sesiones = memoria_claves(r, [f"session:{token}" for token in tokens])
+    perfiles = memoria_claves(r, [f"user:{{mem_{i}}}:profile" for i in range(n)])
+    r.flushdb()
+    return {
+        'codec': nombre,
+        'sesion_bytes': statistics.mean(sesiones),
+        'perfil_bytes': sum(perfiles) / len(tokens),
+        'total_bytes': (despues - antes) / len(tokens)
+    }
+
+def medir_existentes(host, port, db, maximo):
+    """Memoria de las sesiones ya almacenadas, agrupadas por formato"""
+    manager = RedisSessionManager(host=host, port=port, db=db)
+    r = manager.redis_client
+    tokens = [token for token, _ in itertools.islice(r.zscan_iter('index:sessions:expiry', count=1000), maximo)]
+    
+    por_formato = {}
+    for bloque in _en_bloques(tokens, 1000):
+        pipe = r.pipeline(transaction=False)
+        for token in bloque:
+            pipe.hgetall(f"session:{token}")
+        datos = pipe.execute()
+        memoria = memoria_claves(r, [f"session:{token}" for token in bloque])
+        for sesion, bytes_usados in zip(datos, memoria):
+            if sesion:
+                por_formato.setdefault(formato_sesion(sesion) or 'desconocido', []).append(bytes_usados)
+    return por_formato
+
+def main():
+    parser = argparse.ArgumentParser(description='Memoria por sesión según el códec')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--db', type=int, default=15, help='Base de datos (se vacía salvo con --existentes)')
+    parser.add_argument('-n', '--sesiones', type=int, default=10000)
+    parser.add_argument('--existentes', action='store_true', help='Medir las sesiones ya almacenadas')
+    parser.add_argument('--max', type=int, default=100000, help='Máximo de sesiones existentes a medir')
+    args = parser.parse_args()
+    
+    if args.existentes:
+        por_formato = medir_existentes(args.host, args.port, args.db, args.max)
+        print(f"{'formato':<12} {'sesiones':>9} {'media bytes':>12} {'total bytes':>12}")
+        for formato, memoria in sorted(por_formato.items()):
+            print(f"{formato:<12} {len(memoria):>9} {statistics.mean(memoria):>12.1f} {sum(memoria):>12}")
+        return
+        
+    print(f"{args.sesiones} sesiones por códec en {args.host}:{args.port} (db {args.db})")
+    print(f"{'codec':<8} {'session:* B':>12} {'perfil B':>10} {'used_memory B':>14}")
+    for nombre in CODECS:
+        resultado = medir_codec(args.host, args.port, args.db, nombre, args.sesiones)
+        print(f"{resultado['codec']:<8} {resultado['sesion_bytes']:>12.1f} "
+              f"{resultado['perfil_bytes']:>10.1f} {resultado['total_bytes']:>14.1f}")
+
+if __name__ == '__main__':
+    main()
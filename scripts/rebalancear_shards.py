@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Rebalanceo en línea de shards tras añadir o quitar nodos
+Recorre el índice de expiración y el ranking de cada nodo y mueve al nodo
+que les corresponde en el anillo nuevo las sesiones, perfiles y entradas
+del ranking que cambiaron de dueño. Mientras se ejecuta, la aplicación debe
+arrancar con REDIS_NODES (anillo nuevo) y REDIS_PREVIOUS_NODES (anillo
+anterior) para que las sesiones aún no migradas se sigan encontrando
+Con --migrar-perfiles renombra antes los perfiles con el nombre anterior a
+los shards (user:42:profile) a user:{42}:profile, en el nodo del usuario
+
+Uso:
+    python scripts/rebalancear_shards.py --anteriores redis1:6379,redis2:6379 \\
+        --nuevos redis1:6379,redis2:6379,redis3:6379
+    python scripts/rebalancear_shards.py --nuevos redis:6379 --migrar-perfiles
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import redis
+
+import lua_scripts
+from redis_operations import _claves_cerrar_sesiones, _clave_sesiones_usuario
+from session_codec import ERRORES_CODIFICACION, decodificar_sesion
+from sharding import HashRing, parsear_nodos
+
+# Canal donde el script de cierre anuncia las sesiones movidas. No es el de
+# invalidación: la sesión sigue viva en su nodo nuevo y los procesos con
+# filtro de revocados la rechazarían
+CANAL_MOVIDAS = 'sessions:moved'
+
+def conectar(nodos, db):
+    return {
+        f"{h}:{p}": redis.Redis(host=h, port=p, db=db, decode_responses=True, encoding_errors=ERRORES_CODIFICACION)
+        for h, p in nodos
+    }
+
+def mover_sesion(origen, destino, token, cerrar_sesiones):
+    """
+    Copiar session:{token} con DUMP/RESTORE conservando el TTL y después
+    cerrarla en el origen. Si la sesión se cerró entre medias, se descarta
+    la copia para no resucitarla
+    Retorna True si la sesión se movió
+    """
+    session_key = f"session:{token}"
+    pipe = origen.pipeline(transaction=False)
+    pipe.dump(session_key)
+    pipe.pttl(session_key)
+    pipe.zscore('index:sessions:expiry', token)
+    pipe.hget('index:sessions:owner', token)
+    volcado, pttl, expiracion, user_id = pipe.execute()
+    if volcado is None or pttl == -2:
+        return False
+    if user_id is None:
+        # Sesiones anteriores al índice de propietarios o reindexadas sin él
+        user_id = (decodificar_sesion(origen.hgetall(session_key)) or {}).get('user_id')
+    puntuacion = origen.zscore('ranking:active_users', user_id) if user_id else None
+    creada = origen.zscore(_clave_sesiones_usuario(user_id), token) if user_id else None
+    
+    destino.restore(session_key, max(pttl, 0), volcado, replace=True)
+    
+    # El script de cierre es atómico en el origen: si devuelve 0 la sesión
+    # ya no existía y la copia restaurada sobra
+    if not cerrar_sesiones(keys=_claves_cerrar_sesiones([token]), args=[CANAL_MOVIDAS, ''], client=origen)[0]:
+        destino.delete(session_key)
+        return False
+        
+    pipe = destino.pipeline(transaction=False)
+    pipe.zadd('index:sessions:expiry', {token: expiracion})
+    if user_id:
+        pipe.hset('index:sessions:owner', token, user_id)
+    pipe.incr('stats:active_sessions')
+    if puntuacion is not None:
+        pipe.zadd('ranking:active_users', {user_id: puntuacion}, gt=True)
+    if creada is not None:
+        pipe.zadd(_clave_sesiones_usuario(user_id), {token: creada})
+    pipe.execute()
+    return True
+
+def mover_clave(origen, destino, clave):
+    """Mover una clave cualquiera (p. ej. un perfil) con DUMP/RESTORE"""
+    volcado = origen.dump(clave)
+    if volcado is None:
+        return False
+    pttl = origen.pttl(clave)
+    destino.restore(clave, max(pttl, 0), volcado, replace=True)
+    origen.delete(clave)
+    return True
+
+def migrar_perfiles(clientes, anillo, dry_run=False):
+    """
+    Renombrar los perfiles con el nombre anterior a los shards
+    (user:42:profile) a user:{42}:profile en el nodo del usuario
+    Si el perfil nuevo ya existe (el usuario volvió a crear una sesión tras
+    actualizar) sus campos se conservan y solo se añaden los que falten, así
+    que el script se puede repetir. Retorna el número de perfiles migrados
+    """
+    migrados = 0
+    for origen in clientes.values():
+        for clave in origen.scan_iter(match='user:*:profile', count=500):
+            if clave.startswith('user:{'):
+                continue
+            user_id = clave[len('user:'):-len(':profile')]
+            if not dry_run:
+                campos = origen.hgetall(clave)
+                pipe = clientes[anillo.nodo_para_usuario(user_id)].pipeline(transaction=False)
+                for campo, valor in campos.items():
+                    pipe.hsetnx(f"user:{{{user_id}}}:profile", campo, valor)
+                pipe.execute()
+                origen.delete(clave)
+            migrados += 1
+    return migrados
+
+def rebalancear(clientes, anillo, dry_run=False):
+    """Mover todo lo que cambió de dueño; retorna un resumen por tipo"""
+    resumen = {'sesiones': 0, 'perfiles': 0, 'ranking': 0}
+    for nodo, origen in clientes.items():
+        cerrar_sesiones = origen.register_script(lua_scripts.CERRAR_SESIONES)
+        
+        for token, _ in origen.zscan_iter('index:sessions:expiry', count=500):
+            nuevo = anillo.nodo_para_token(token)
+            if nuevo != nodo:
+                if dry_run or mover_sesion(origen, clientes[nuevo], token, cerrar_sesiones):
+                    resumen['sesiones'] += 1
+                    
+        for clave in origen.scan_iter(match='user:{*}:profile', count=500):
+            nuevo = anillo.nodo_para_clave(clave)
+            if nuevo != nodo:
+                if dry_run or mover_clave(origen, clientes[nuevo], clave):
+                    resumen['perfiles'] += 1
+                    
+        for user_id, puntuacion in origen.zscan_iter('ranking:active_users', count=500):
+            nuevo = anillo.nodo_para_usuario(user_id)
+            if nuevo != nodo:
+                if not dry_run:
+                    clientes[nuevo].zadd('ranking:active_users', {user_id: puntuacion}, gt=True)
+                    origen.zrem('ranking:active_users', user_id)
+                resumen['ranking'] += 1
+    return resumen
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebalancear sesiones entre shards')
+    parser.add_argument('--anteriores', default='', help="Nodos anteriores 'host:puerto,...'")
+    parser.add_argument('--nuevos', required=True, help="Nodos nuevos 'host:puerto,...'")
+    parser.add_argument('--db', type=int, default=0)
+    parser.add_argument('--dry-run', action='store_true', help='Solo contar lo que se movería')
+    parser.add_argument('--migrar-perfiles', action='store_true',
+                        help='Renombrar antes los perfiles user:42:profile a user:{42}:profile')
+    args = parser.parse_args()
+    
+    anteriores = parsear_nodos(args.anteriores)
+    nuevos = parsear_nodos(args.nuevos)
+    clientes = conectar(nuevos + [n for n in anteriores if n not in nuevos], args.db)
+    anillo = HashRing([f"{h}:{p}" for h, p in nuevos])
+    
+    if args.migrar_perfiles:
+        print(f"Perfiles migrados al formato con etiqueta hash: {migrar_perfiles(clientes, anillo, args.dry_run)}")
+    resumen = rebalancear(clientes, anillo, dry_run=args.dry_run)
+    print(f"Sesiones movidas: {resumen['sesiones']}  Perfiles: {resumen['perfiles']}  "
+          f"Entradas de ranking: {resumen['ranking']}")
+
+if __name__ == '__main__':
+    main()
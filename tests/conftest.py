@@ -0,0 +1,30 @@
+"""
+Configuración común de las pruebas
+Los módulos de app/ y scripts/ se importan con imports planos, como al
+ejecutarlos; Redis se sustituye por fakeredis con un servidor por host y
+puerto, para poder probar también el modo shards
+"""
+
+import os
+import sys
+
+import fakeredis
+import pytest
+import redis
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, 'scripts'))
+sys.path.insert(0, os.path.join(RAIZ, 'app'))
+
+@pytest.fixture
+def servidores(monkeypatch):
+    """Sustituir redis.Redis por fakeredis; retorna {(host, puerto): servidor}"""
+    servidores = {}
+    
+    class RedisFalso(fakeredis.FakeRedis):
+        def __init__(self, *args, host='localhost', port=6379, **kwargs):
+            servidor = servidores.setdefault((host, port), fakeredis.FakeServer())
+            super().__init__(*args, server=servidor, **kwargs)
+            
+    monkeypatch.setattr(redis, 'Redis', RedisFalso)
+    return servidores
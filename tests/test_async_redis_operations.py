@@ -0,0 +1,31 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import async_redis_operations
+from async_redis_operations import AsyncRedisSessionManager
+
+@pytest.fixture
+def manager(monkeypatch):
+    servidor = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        async_redis_operations.aioredis, 'BlockingConnectionPool',
+        lambda **opciones: fakeredis.FakeAsyncRedis(server=servidor, decode_responses=True).connection_pool
+    )
+    return AsyncRedisSessionManager(refresh_interval=0)
+
+def test_exportacion_con_una_sesion_renovada_a_mitad(manager):
+    async def exportar():
+        tokens = [await manager.crear_sesion(f"u{i}", 'n', 'n@x') for i in range(10)]
+        exportadas = []
+        async for sesion in manager.iterar_sesiones_activas(batch_size=3):
+            exportadas.append(sesion['token'])
+            if len(exportadas) % 3 == 0:
+                await asyncio.sleep(0.01)
+                await manager.obtener_sesion(sesion['token'])
+        await manager.cerrar()
+        return tokens, exportadas
+        
+    tokens, exportadas = asyncio.run(exportar())
+    assert set(exportadas) == set(tokens)
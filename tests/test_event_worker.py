@@ -0,0 +1,76 @@
+import pytest
+
+import lua_scripts
+from event_worker import crear_workers
+from redis_operations import RedisSessionManager
+
+@pytest.fixture
+def manager(servidores):
+    return RedisSessionManager(host='redis', side_effects='stream')
+
+@pytest.fixture
+def worker(manager):
+    worker = crear_workers(manager, workers=1, block_ms=10, min_idle_ms=0, max_deliveries=2)[0]
+    worker.asegurar_grupo()
+    return worker
+
+def pendientes(cliente, worker):
+    return cliente.xpending(lua_scripts.STREAM_EVENTOS, worker.GRUPO)['pending']
+
+def creadas(cliente):
+    return sum(int(v) for k in cliente.keys('stats:sessions_created:minute:*') for v in [cliente.get(k)])
+
+def test_aplica_perfil_ranking_y_analitica(manager, worker):
+    cliente = manager.redis_client
+    manager.crear_sesion('1', 'ana', 'a@x')
+    manager.crear_sesion('2', 'bob', 'b@x')
+    # La petición no toca el perfil ni el ranking
+    assert not cliente.exists('user:{1}:profile')
+    assert cliente.zcard('ranking:active_users') == 0
+    
+    assert worker.procesar_lote() == 2
+    assert cliente.hget('user:{1}:profile', 'username') == 'ana'
+    assert sorted(cliente.zrange('ranking:active_users', 0, -1)) == ['1', '2']
+    assert creadas(cliente) == 2
+    assert pendientes(cliente, worker) == 0
+
+def test_evento_fallido_queda_pendiente_sin_contar_doble(manager, worker):
+    cliente = manager.redis_client
+    # Un perfil con el tipo equivocado hace fallar el script en ese evento
+    cliente.set('user:{2}:profile', 'x')
+    for user_id in ('1', '2', '3'):
+        manager.crear_sesion(user_id, 'n', 'n@x')
+        
+    assert worker.procesar_lote() == 2
+    assert worker.metricas()['eventos_aplicados'] == 2
+    assert pendientes(cliente, worker) == 1
+    assert creadas(cliente) == 2
+    
+    # Los reintentos no vuelven a aplicar los eventos ya confirmados y, al
+    # agotar max_deliveries, la entrada se aparta
+    for _ in range(3):
+        worker.reintentar_pendientes()
+    assert creadas(cliente) == 2
+    assert pendientes(cliente, worker) == 0
+    fallidas = cliente.xrange(worker.STREAM_FALLIDOS)
+    assert [(campos['user_id'], campos['motivo']) for _, campos in fallidas] == [('2', 'reintentos')]
+
+def test_entrada_malformada_se_aparta(manager, worker):
+    cliente = manager.redis_client
+    cliente.xadd(lua_scripts.STREAM_EVENTOS, {'type': 'created'})
+    cliente.xadd(lua_scripts.STREAM_EVENTOS, {'type': 'desconocido', 'token': 't', 'user_id': '1'})
+    manager.crear_sesion('1', 'ana', 'a@x')
+    
+    assert worker.procesar_lote() == 1
+    assert worker.metricas()['eventos_fallidos'] == 2
+    assert pendientes(cliente, worker) == 0
+    assert [campos['motivo'] for _, campos in cliente.xrange(worker.STREAM_FALLIDOS)] == ['malformado'] * 2
+
+def test_reclama_entradas_de_un_consumidor_caido(manager, worker):
+    cliente = manager.redis_client
+    manager.crear_sesion('1', 'ana', 'a@x')
+    cliente.xreadgroup(worker.GRUPO, 'caido', {lua_scripts.STREAM_EVENTOS: '>'}, count=10)
+    
+    assert worker.reintentar_pendientes() == (1, 0)
+    assert cliente.hget('user:{1}:profile', 'username') == 'ana'
+    assert pendientes(cliente, worker) == 0
@@ -0,0 +1,125 @@
+import itertools
+import json
+import os
+import random
+
+import pytest
+
+from memory_engine import ArchivoAOF, ListaSaltos, MotorMemoria, RuedaTemporal
+
+def test_rueda_vence_en_su_tick():
+    rueda = RuedaTemporal(ahora=1000)
+    rueda.programar('a', 1005)
+    rueda.programar('b', 1010)
+    assert rueda.avanzar(1004) == []
+    assert rueda.avanzar(1005) == ['a']
+    assert rueda.avanzar(1020) == ['b']
+    assert len(rueda) == 0
+
+def test_rueda_cascada_desde_niveles_superiores():
+    rueda = RuedaTemporal(ahora=0)
+    instantes = {'n1': 100, 'n2': 5000, 'n3': 300000}
+    for ident, instante in instantes.items():
+        rueda.programar(ident, instante)
+    vencidos = {}
+    for ahora in range(0, 300001, 50):
+        for ident in rueda.avanzar(ahora):
+            vencidos[ident] = ahora
+    assert vencidos == instantes
+
+def test_rueda_cancelar_y_reprogramar():
+    rueda = RuedaTemporal(ahora=0)
+    rueda.programar('a', 10)
+    rueda.programar('b', 10)
+    rueda.cancelar('a')
+    rueda.programar('b', 20)
+    assert rueda.avanzar(15) == []
+    assert rueda.avanzar(20) == ['b']
+
+def test_rueda_ranuras_potencia_de_dos():
+    with pytest.raises(ValueError):
+        RuedaTemporal(ranuras=60)
+
+def test_motor_expira_y_avisa():
+    vencidas = []
+    motor = MotorMemoria(al_expirar=lambda clave, datos: vencidas.append((clave, datos)))
+    motor.guardar('session:a', {'user_id': 1}, ttl=10)
+    motor.guardar('session:b', {'user_id': 2})
+    expiracion = motor.expiracion('session:a')
+    assert motor.avanzar(expiracion - 1) == 0
+    assert motor.avanzar(expiracion + 1) == 1
+    assert vencidas == [('session:a', {'user_id': '1'})]
+    assert motor.leer('session:b') == {'user_id': '2'}
+    assert motor.ttl('session:b') == -1
+
+def test_aof_reproduce_el_estado(tmp_path):
+    ruta = str(tmp_path / 'motor.aof')
+    motor = MotorMemoria(aof_path=ruta)
+    motor.guardar('a', {'x': 1}, ttl=3600)
+    motor.guardar('b', {'x': 2})
+    motor.actualizar('a', {'y': 3})
+    motor.expirar('b', 3600)
+    motor.eliminar('c', 'b')
+    motor.cerrar()
+    
+    recuperado = MotorMemoria(aof_path=ruta)
+    assert recuperado.leer('a') == {'x': '1', 'y': '3'}
+    assert recuperado.ttl('a') > 3500
+    assert not recuperado.existe('b')
+    recuperado.cerrar()
+
+def test_aof_descarta_lo_vencido_al_reproducir(tmp_path):
+    ruta = tmp_path / 'motor.aof'
+    ruta.write_text(json.dumps(['S', 'vieja', {'x': '1'}, 1.0]) + '\n' + json.dumps(['S', 'viva', {'x': '2'}, 0]) + '\n')
+    motor = MotorMemoria(aof_path=str(ruta))
+    assert motor.claves() == ['viva']
+    motor.cerrar()
+
+def test_aof_reescritura_compacta(tmp_path):
+    ruta = str(tmp_path / 'motor.aof')
+    motor = MotorMemoria(aof_path=ruta, aof_rewrite_min=10)
+    for i in range(50):
+        motor.guardar('a', {'i': i})
+    motor.guardar('b', {'i': 0})
+    motor.cerrar()
+    with open(ruta) as archivo:
+        assert len(archivo.readlines()) <= 12
+        
+    recuperado = MotorMemoria(aof_path=ruta)
+    assert recuperado.leer('a') == {'i': '49'}
+    assert recuperado.leer('b') == {'i': '0'}
+    recuperado.cerrar()
+
+def test_aof_trunca_la_linea_cortada(tmp_path):
+    ruta = tmp_path / 'motor.aof'
+    completa = json.dumps(['S', 'a', {'x': '1'}, 0]) + '\n'
+    ruta.write_text(completa + '["S","b",{"x"')
+    
+    motor = MotorMemoria(aof_path=str(ruta))
+    assert motor.claves() == ['a']
+    assert os.path.getsize(ruta) == len(completa)
+    motor.guardar('c', {'x': '3'})
+    motor.cerrar()
+    
+    recuperado = MotorMemoria(aof_path=str(ruta))
+    assert sorted(recuperado.claves()) == ['a', 'c']
+    recuperado.cerrar()
+
+def test_aof_fsync_desconocido(tmp_path):
+    with pytest.raises(ValueError):
+        ArchivoAOF(str(tmp_path / 'motor.aof'), fsync='nunca')
+
+def test_lista_de_saltos_ordenada():
+    lista = ListaSaltos()
+    valores = list(range(0, 2000, 2))
+    random.Random(7).shuffle(valores)
+    for valor in valores:
+        lista.agregar(valor)
+    lista.agregar(10)
+    assert len(lista) == 1000
+    assert list(lista) == sorted(valores)
+    
+    assert lista.descartar(10) and not lista.descartar(10) and not lista.descartar(11)
+    assert list(itertools.islice(lista.mayores_que(5), 3)) == [6, 8, 12]
+    assert list(lista.mayores_que(1998)) == []
+    assert len(lista) == 999
@@ -0,0 +1,95 @@
+import time
+
+from memory_operations import MemorySessionManager
+from redis_operations import SESSION_TTL
+
+def paginar(manager, limit, antes_de_cada_pagina=None):
+    tokens, cursor = [], None
+    while True:
+        pagina = manager.listar_sesiones_paginado(limit=limit, cursor=cursor)
+        tokens += [sesion['token'] for sesion in pagina['sesiones']]
+        cursor = pagina['cursor']
+        if not cursor:
+            return tokens
+        if antes_de_cada_pagina:
+            antes_de_cada_pagina(pagina)
+
+def test_crear_obtener_y_cerrar():
+    manager = MemorySessionManager()
+    token = manager.crear_sesion(1, 'ana', 'a@x')
+    otro = manager.crear_sesion(2, 'bob', 'b@x')
+    
+    sesion = manager.obtener_sesion(token)
+    assert (sesion['user_id'], sesion['username']) == ('1', 'ana')
+    assert manager.obtener_estadisticas()['sesiones_activas'] == 2
+    assert manager.cerrar_sesion(token) is True
+    assert manager.cerrar_sesion(token) is False
+    assert manager.obtener_sesion(token) is None
+    estadisticas = manager.obtener_estadisticas()
+    assert estadisticas['sesiones_activas'] == 1
+    assert estadisticas['usuarios_recientes'][-1][0] == '2'
+    assert manager.obtener_sesion(otro) is not None
+
+def test_vencimiento_limpia_los_indices():
+    manager = MemorySessionManager()
+    tokens = [manager.crear_sesion(i, 'n', 'n@x') for i in range(5)]
+    assert manager.contar_sesiones_vencidas() == 0
+    
+    assert manager.motor.avanzar(time.time() + SESSION_TTL + 5) == 5
+    assert manager.obtener_sesiones(tokens) == [None] * 5
+    estadisticas = manager.obtener_estadisticas()
+    assert estadisticas['sesiones_activas'] == 0 and estadisticas['usuarios_en_ranking'] == 0
+    assert manager.listar_sesiones_paginado()['sesiones'] == []
+
+def test_limite_de_sesiones_por_usuario():
+    manager = MemorySessionManager(max_sessions_per_user=2)
+    tokens = [manager.crear_sesion(1, 'ana', 'a@x') for _ in range(3)]
+    assert [bool(s) for s in manager.obtener_sesiones(tokens)] == [False, True, True]
+    assert manager.cerrar_sesiones_usuario(1) == 2
+    assert manager.obtener_estadisticas()['sesiones_activas'] == 0
+
+def test_paginacion_en_orden_con_el_cursor_renovado_o_cerrado():
+    manager = MemorySessionManager(refresh_interval=0)
+    tokens = [manager.crear_sesion(i, 'n', 'n@x') for i in range(7)]
+    assert paginar(manager, 2) == tokens
+    
+    def renovar_ultima(pagina):
+        time.sleep(0.01)
+        manager.obtener_sesion(pagina['sesiones'][-1]['token'])
+        
+    assert set(paginar(manager, 2, renovar_ultima)) == set(tokens)
+    
+    def cerrar_ultima(pagina):
+        manager.cerrar_sesion(pagina['sesiones'][-1]['token'])
+        
+    restantes = paginar(manager, 2)
+    assert paginar(manager, 2, cerrar_ultima) == restantes
+
+def test_analitica_una_vez_por_minuto():
+    manager = MemorySessionManager(refresh_interval=300)
+    token = manager.crear_sesion(1, 'ana', 'a@x')
+    clave = f"session:{token}"
+    anterior = time.time() - 61
+    manager.motor.actualizar(clave, {'last_activity_ts': anterior})
+    expiracion = manager.motor.expiracion(clave)
+    manager._cubetas['minute'].clear()
+    
+    sesion = manager.obtener_sesion(token)
+    assert 'activity_bucket' not in sesion
+    assert manager.motor.expiracion(clave) == expiracion
+    assert float(manager.motor.leer(clave)['last_activity_ts']) == anterior
+    assert manager.obtener_analitica(60, 'minute')['usuarios_unicos'] == 1
+
+def test_indices_reconstruidos_desde_el_aof(tmp_path):
+    ruta = str(tmp_path / 'sesiones.aof')
+    manager = MemorySessionManager(aof_path=ruta, codec='packed')
+    tokens = [manager.crear_sesion(i % 2, 'n', 'n@x') for i in range(4)]
+    manager.cerrar_sesion(tokens[0])
+    manager.cerrar()
+    
+    recuperado = MemorySessionManager(aof_path=ruta)
+    assert recuperado.obtener_estadisticas()['sesiones_activas'] == 3
+    assert paginar(recuperado, 2) == tokens[1:]
+    assert recuperado.cerrar_sesiones_usuario(1) == 2
+    assert recuperado.obtener_estadisticas()['usuarios_en_ranking'] == 1
+    recuperado.cerrar()
@@ -0,0 +1,69 @@
+import pytest
+import redis
+
+import rate_limiter
+from rate_limiter import LimitadorPeticiones, parsear_cuotas
+
+def test_parsear_cuotas():
+    assert parsear_cuotas('crear_sesion=30/60, obtener_sesion=10') == {
+        'crear_sesion': (30, 0.5),
+        'obtener_sesion': (10, 10.0)
+    }
+    assert parsear_cuotas('') == {}
+    for texto in ('crear_sesion', 'crear_sesion=0/60', 'crear_sesion=x/60', '=5/1'):
+        with pytest.raises(ValueError):
+            parsear_cuotas(texto)
+
+@pytest.fixture(params=['local', 'redis'])
+def limitador(request, servidores):
+    cliente = redis.Redis(decode_responses=True) if request.param == 'redis' else None
+    return LimitadorPeticiones(cliente, {'crear_sesion': (3, 1 / 60)})
+
+def test_cubeta_agota_la_rafaga(limitador):
+    resultados = [limitador.comprobar('crear_sesion', '10.0.0.1') for _ in range(4)]
+    assert [permitida for permitida, _, _ in resultados] == [True, True, True, False]
+    assert resultados[2][1] == 0
+    assert 59 <= resultados[3][2] <= 60
+    # Cada cliente tiene su propia cubeta
+    assert limitador.comprobar('crear_sesion', '10.0.0.2')[0]
+    assert limitador.metricas()['decisiones']['crear_sesion'] == {'permitida': 4, 'limitada': 1}
+
+def test_coste_de_lote(limitador):
+    assert limitador.comprobar('crear_sesion', 'c', coste=2)[0]
+    assert not limitador.comprobar('crear_sesion', 'c', coste=2)[0]
+    # Un lote mayor que la capacidad nunca cabe
+    assert limitador.comprobar('crear_sesion', 'd', coste=4) == (False, None, None)
+
+def test_endpoint_sin_cuota(limitador):
+    assert limitador.comprobar('obtener_sesion', 'c') == (True, None, 0)
+
+def test_cubeta_local_se_repone(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: reloj[0])
+    limitador = LimitadorPeticiones(cuotas={'crear_sesion': (2, 1.0)})
+    assert limitador.comprobar('crear_sesion', 'c')[0]
+    assert limitador.comprobar('crear_sesion', 'c')[0]
+    assert not limitador.comprobar('crear_sesion', 'c')[0]
+    reloj[0] += 1
+    assert limitador.comprobar('crear_sesion', 'c')[0]
+
+def test_cubetas_locales_acotadas(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'MAX_CUBETAS_LOCALES', 10)
+    limitador = LimitadorPeticiones(cuotas={'crear_sesion': (5, 0.001)})
+    for i in range(25):
+        limitador.comprobar('crear_sesion', f"10.0.0.{i}")
+    assert len(limitador._cubetas) == 10
+    assert 'ratelimit:crear_sesion:10.0.0.24' in limitador._cubetas
+
+def test_redis_caido_no_bloquea():
+    cliente = redis.Redis(port=1, socket_connect_timeout=0.1)
+    limitador = LimitadorPeticiones(cliente, {'crear_sesion': (1, 1.0)})
+    assert limitador.comprobar('crear_sesion', 'c') == (True, None, 0)
+    assert limitador.metricas()['decisiones']['crear_sesion'] == {'error': 1}
+
+def test_limite_de_concurrencia():
+    limitador = LimitadorPeticiones(max_concurrentes=1)
+    assert limitador.admitir('crear_sesion')
+    assert not limitador.admitir('crear_sesion')
+    limitador.liberar()
+    assert limitador.admitir('crear_sesion')
@@ -0,0 +1,79 @@
+import pytest
+
+import rebalancear_shards
+from redis_operations import RedisSessionManager
+from sharding import HashRing
+
+ANTERIORES = [('redis1', 6379), ('redis2', 6379)]
+NUEVOS = ANTERIORES + [('redis3', 6379)]
+
+@pytest.fixture
+def tokens(servidores):
+    manager = RedisSessionManager(nodes=ANTERIORES)
+    sesiones = manager.crear_sesiones([
+        {'user_id': f"u{i}", 'username': f"n{i}", 'email': 'e@x'} for i in range(100)
+    ])
+    return [sesion['token'] for sesion in sesiones]
+
+def test_rebalanceo_mueve_lo_que_cambia_de_dueno(tokens):
+    clientes = rebalancear_shards.conectar(NUEVOS, 0)
+    anillo = HashRing(list(clientes))
+    
+    simulado = rebalancear_shards.rebalancear(clientes, anillo, dry_run=True)
+    resumen = rebalancear_shards.rebalancear(clientes, anillo)
+    # Las entradas del ranking viajan con las sesiones de su usuario
+    assert resumen['sesiones'] == simulado['sesiones'] > 0
+    assert rebalancear_shards.rebalancear(clientes, anillo) == {'sesiones': 0, 'perfiles': 0, 'ranking': 0}
+    
+    manager = RedisSessionManager(nodes=NUEVOS)
+    assert all(manager.obtener_sesiones(tokens))
+    for nodo, cliente in clientes.items():
+        assert all(anillo.nodo_para_token(t) == nodo for t in cliente.zrange('index:sessions:expiry', 0, -1))
+        assert all(anillo.nodo_para_usuario(u) == nodo for u in cliente.zrange('ranking:active_users', 0, -1))
+        assert int(cliente.get('stats:active_sessions') or 0) == cliente.zcard('index:sessions:expiry')
+        assert cliente.ttl(f"session:{cliente.zrange('index:sessions:expiry', 0, 0)[0]}") > 0
+    assert sum(c.zcard('ranking:active_users') for c in clientes.values()) == len(tokens)
+    assert manager.obtener_estadisticas()['sesiones_activas'] == len(tokens)
+
+def test_sesiones_sin_migrar_se_encuentran_con_el_anillo_anterior(tokens):
+    manager = RedisSessionManager(nodes=NUEVOS, previous_nodes=ANTERIORES)
+    assert all(manager.obtener_sesiones(tokens))
+
+def test_migrar_perfiles_con_el_nombre_anterior(servidores):
+    clientes = rebalancear_shards.conectar(NUEVOS, 0)
+    anillo = HashRing(list(clientes))
+    origen = clientes['redis1:6379']
+    origen.hset('user:42:profile', mapping={'username': 'ana', 'email': 'a@x'})
+    origen.hset('user:7:profile', mapping={'username': 'bob'})
+    destino = clientes[anillo.nodo_para_usuario('7')]
+    destino.hset('user:{7}:profile', mapping={'username': 'roberto'})
+    
+    assert rebalancear_shards.migrar_perfiles(clientes, anillo, dry_run=True) == 2
+    assert origen.exists('user:42:profile')
+    assert rebalancear_shards.migrar_perfiles(clientes, anillo) == 2
+    assert rebalancear_shards.migrar_perfiles(clientes, anillo) == 0
+    
+    assert not origen.exists('user:42:profile', 'user:7:profile')
+    assert clientes[anillo.nodo_para_usuario('42')].hgetall('user:{42}:profile') == {'username': 'ana', 'email': 'a@x'}
+    # Los campos escritos tras actualizar se conservan
+    assert destino.hgetall('user:{7}:profile') == {'username': 'roberto'}
+
+@pytest.mark.parametrize('codec', ['hash', 'packed'])
+def test_rebalanceo_de_sesiones_sin_propietario(servidores, codec):
+    manager = RedisSessionManager(nodes=ANTERIORES, codec=codec)
+    tokens = [manager.crear_sesion(f"u{i}", 'n', 'n@x') for i in range(30)]
+    # Sesiones anteriores al índice de propietarios
+    for cliente in manager.nodos.values():
+        cliente.delete('index:sessions:owner')
+        
+    clientes = rebalancear_shards.conectar(NUEVOS, 0)
+    anillo = HashRing(list(clientes))
+    assert rebalancear_shards.rebalancear(clientes, anillo)['sesiones'] > 0
+    
+    manager = RedisSessionManager(nodes=NUEVOS)
+    assert all(manager.obtener_sesiones(tokens))
+    for nodo, cliente in clientes.items():
+        propietarios = cliente.hgetall('index:sessions:owner')
+        for token in propietarios:
+            assert anillo.nodo_para_token(token) == nodo
+        assert all(anillo.nodo_para_usuario(u) == nodo for u in cliente.zrange('ranking:active_users', 0, -1))
@@ -0,0 +1,156 @@
+import time
+
+import pytest
+
+from redis_operations import RedisSessionManager, SESSION_TTL
+
+@pytest.fixture
+def manager(servidores):
+    return RedisSessionManager(host='redis')
+
+def test_crear_sesion_escribe_todo_en_un_script(manager):
+    cliente = manager.redis_client
+    token = manager.crear_sesion('1', 'ana', 'a@x')
+    
+    sesion = manager.obtener_sesion(token)
+    assert sesion['user_id'] == '1' and sesion['username'] == 'ana' and sesion['email'] == 'a@x'
+    assert SESSION_TTL - 5 < cliente.ttl(f"session:{token}") <= SESSION_TTL
+    assert cliente.get('stats:active_sessions') == '1'
+    assert cliente.hget('user:{1}:profile', 'username') == 'ana'
+    assert cliente.zrange('ranking:active_users', 0, -1) == ['1']
+    assert cliente.hget('index:sessions:owner', token) == '1'
+    assert cliente.zscore('index:sessions:expiry', token) == pytest.approx(time.time() + SESSION_TTL, abs=5)
+
+def test_obtener_sesion_inexistente(manager):
+    assert manager.obtener_sesion('no-existe') is None
+
+def test_cerrar_sesion_limpia_indices(manager):
+    cliente = manager.redis_client
+    token = manager.crear_sesion('1', 'ana', 'a@x')
+    otro = manager.crear_sesion('2', 'bob', 'b@x')
+    
+    assert manager.cerrar_sesion(token) is True
+    assert manager.cerrar_sesion(token) is False
+    assert manager.obtener_sesion(token) is None
+    assert cliente.get('stats:active_sessions') == '1'
+    assert cliente.zscore('index:sessions:expiry', token) is None
+    assert cliente.hget('index:sessions:owner', token) is None
+    assert cliente.zrange('ranking:active_users', 0, -1) == ['2']
+    assert manager.obtener_sesion(otro) is not None
+
+def test_apis_por_lotes(manager):
+    resultados = manager.crear_sesiones([
+        {'user_id': '1', 'username': 'ana', 'email': 'a@x'},
+        {'user_id': '2'},
+        {'user_id': '3', 'username': 'eva', 'email': 'e@x'}
+    ])
+    assert [r['ok'] for r in resultados] == [True, False, True]
+    tokens = [resultados[0]['token'], 'no-existe', resultados[2]['token']]
+    
+    assert [s and s['username'] for s in manager.obtener_sesiones(tokens)] == ['ana', None, 'eva']
+    assert manager.cerrar_sesiones(tokens) == [True, False, True]
+    assert manager.redis_client.get('stats:active_sessions') == '0'
+
+def paginar(manager, limit, antes_de_cada_pagina=None):
+    """Recorrer todas las páginas; antes_de_cada_pagina(pagina) corre entre una y otra"""
+    tokens, cursor = [], None
+    while True:
+        pagina = manager.listar_sesiones_paginado(limit=limit, cursor=cursor)
+        tokens += [sesion['token'] for sesion in pagina['sesiones']]
+        cursor = pagina['cursor']
+        if not cursor:
+            return tokens
+        if antes_de_cada_pagina:
+            antes_de_cada_pagina(pagina)
+
+@pytest.fixture
+def manager_deslizante(servidores):
+    # refresh_interval=0: cada lectura renueva el TTL y la expiración del índice
+    return RedisSessionManager(host='redis', refresh_interval=0)
+
+def test_paginacion_recorre_todo_en_orden(manager_deslizante):
+    tokens = [manager_deslizante.crear_sesion(f"u{i}", 'n', 'n@x') for i in range(7)]
+    assert paginar(manager_deslizante, 2) == tokens
+
+def test_paginacion_con_el_cursor_renovado(manager_deslizante):
+    tokens = [manager_deslizante.crear_sesion(f"u{i}", 'n', 'n@x') for i in range(6)]
+    
+    def renovar_ultima(pagina):
+        time.sleep(0.01)
+        manager_deslizante.obtener_sesion(pagina['sesiones'][-1]['token'])
+        
+    # La sesión renovada pasa al final del índice y puede volver a aparecer,
+    # pero ninguna de las que iban detrás del cursor se pierde
+    assert set(paginar(manager_deslizante, 2, renovar_ultima)) == set(tokens)
+
+def test_paginacion_con_el_cursor_cerrado(manager_deslizante):
+    tokens = [manager_deslizante.crear_sesion(f"u{i}", 'n', 'n@x') for i in range(6)]
+    
+    def cerrar_ultima(pagina):
+        manager_deslizante.cerrar_sesion(pagina['sesiones'][-1]['token'])
+        
+    assert paginar(manager_deslizante, 2, cerrar_ultima) == tokens
+
+def test_paginacion_en_shards_con_el_cursor_renovado(servidores):
+    manager = RedisSessionManager(nodes=[('redis1', 6379), ('redis2', 6379)], refresh_interval=0)
+    tokens = [manager.crear_sesion(f"u{i}", 'n', 'n@x') for i in range(12)]
+    
+    def renovar_ultima(pagina):
+        time.sleep(0.01)
+        manager.obtener_sesion(pagina['sesiones'][-1]['token'])
+        
+    assert set(paginar(manager, 3, renovar_ultima)) == set(tokens)
+
+def test_cursor_invalido(manager):
+    with pytest.raises(ValueError):
+        manager.listar_sesiones_paginado(cursor='no-es-un-cursor')
+
+def test_exportacion_con_una_sesion_renovada_a_mitad(manager_deslizante):
+    tokens = [manager_deslizante.crear_sesion(f"u{i}", 'n', 'n@x') for i in range(10)]
+    exportadas = []
+    for sesion in manager_deslizante.iterar_sesiones_activas(batch_size=3):
+        exportadas.append(sesion['token'])
+        if len(exportadas) % 3 == 0:
+            # Última sesión del lote: es el cursor del siguiente
+            time.sleep(0.01)
+            manager_deslizante.obtener_sesion(sesion['token'])
+    assert set(exportadas) == set(tokens)
+
+@pytest.mark.parametrize('codec', ['hash', 'packed'])
+def test_lectura_en_otro_minuto_solo_anota_la_analitica(servidores, codec):
+    manager = RedisSessionManager(host='redis', refresh_interval=300, codec=codec)
+    cliente = manager.redis_client
+    token = manager.crear_sesion('1', 'ana', 'a@x')
+    clave = f"session:{token}"
+    # Última actividad hace 61 s: otro minuto, pero dentro del intervalo de renovación
+    anterior = time.time() - 61
+    cliente.hset(clave, 'a' if codec == 'packed' else 'last_activity_ts', int(anterior))
+    cliente.expire(clave, 1000)
+    cliente.zadd('index:sessions:expiry', {token: anterior + 1000})
+    cliente.delete(*cliente.keys('stats:active_users:*'))
+    
+    sesion = manager.obtener_sesion(token)
+    assert 'activity_bucket' not in sesion
+    assert float(sesion['last_activity_ts']) == int(anterior)
+    assert cliente.ttl(clave) <= 1000
+    assert cliente.zscore('index:sessions:expiry', token) == anterior + 1000
+    assert manager.obtener_analitica(60, 'minute')['usuarios_unicos'] == 1
+    
+    # El resto de lecturas del minuto no escriben nada
+    cliente.delete(*cliente.keys('stats:active_users:*'))
+    manager.obtener_sesion(token)
+    assert manager.obtener_analitica(60, 'minute')['usuarios_unicos'] == 0
+
+def test_renovacion_respeta_el_intervalo(servidores):
+    manager = RedisSessionManager(host='redis', refresh_interval=300)
+    cliente = manager.redis_client
+    token = manager.crear_sesion('1', 'ana', 'a@x')
+    expiracion = cliente.zscore('index:sessions:expiry', token)
+    
+    cliente.hset(f"session:{token}", 'last_activity_ts', time.time() - 299)
+    manager.obtener_sesion(token)
+    assert cliente.zscore('index:sessions:expiry', token) == expiracion
+    
+    cliente.hset(f"session:{token}", 'last_activity_ts', time.time() - 300)
+    manager.obtener_sesion(token)
+    assert cliente.zscore('index:sessions:expiry', token) > expiracion
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+
+from redis_operations import RedisSessionManager
+from session_codec import CODECS, ERRORES_CODIFICACION, decodificar_sesion, formato_sesion, obtener_codec
+
+def como_hash(campos):
+    """Lista plana campo/valor tal como la devuelve HGETALL con ERRORES_CODIFICACION"""
+    datos = {}
+    for campo, valor in zip(campos[::2], campos[1::2]):
+        datos[campo] = valor.decode('utf-8', ERRORES_CODIFICACION) if isinstance(valor, bytes) else str(valor)
+    return datos
+
+@pytest.mark.parametrize('nombre', ['hash', 'packed'])
+def test_ida_y_vuelta(nombre):
+    ahora = datetime(2024, 5, 1, 12, 30, 15)
+    datos = como_hash(obtener_codec(nombre).campos('42', 'ana', 'á@x', ahora))
+    assert formato_sesion(datos) == nombre
+    sesion = decodificar_sesion(datos)
+    assert (sesion['user_id'], sesion['username'], sesion['email']) == ('42', 'ana', 'á@x')
+    assert sesion['created_at'] == ahora.isoformat()
+    assert float(sesion['last_activity_ts']) == ahora.timestamp()
+
+def test_hash_vacio_es_sesion_inexistente():
+    assert decodificar_sesion({}) is None
+
+def test_codec_desconocido():
+    with pytest.raises(ValueError):
+        obtener_codec('xml')
+
+def test_packed_no_duplica_el_perfil():
+    assert CODECS['hash'].duplica_perfil and not CODECS['packed'].duplica_perfil
+
+def test_formatos_mezclados_en_redis(servidores):
+    antiguo = RedisSessionManager(host='redis', codec='hash')
+    nuevo = RedisSessionManager(host='redis', codec='packed')
+    token_hash = antiguo.crear_sesion('1', 'ana', 'a@x')
+    token_packed = nuevo.crear_sesion('2', 'bob', 'b@x')
+    
+    cliente = nuevo.redis_client
+    assert formato_sesion(cliente.hgetall(f"session:{token_hash}")) == 'hash'
+    assert formato_sesion(cliente.hgetall(f"session:{token_packed}")) == 'packed'
+    assert [s['username'] for s in nuevo.obtener_sesiones([token_hash, token_packed])] == ['ana', 'bob']
+    assert nuevo.cerrar_sesiones([token_hash, token_packed]) == [True, True]
+    assert cliente.zcard('ranking:active_users') == 0
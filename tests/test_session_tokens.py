@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+from redis_operations import RedisSessionManager
+from session_tokens import FiltroRevocados, FirmadorTokens, ValidadorTokens
+
+def test_firma_y_verificacion():
+    firmador = FirmadorTokens(['secreto'], max_age=60)
+    token = firmador.firmar('cuerpo', ahora=1000)
+    assert firmador.verificar(token, ahora=1059) == 'ok'
+    assert firmador.verificar(token, ahora=1060) == 'expirado'
+    
+    cuerpo, expira, firma = token.split('.')
+    assert firmador.verificar(f"{cuerpo}.{expira}.{firma[:-1]}A", ahora=1000) == 'firma'
+    # Alargar la expiración invalida la firma
+    assert firmador.verificar(f"{cuerpo}.{int(expira, 16) + 3600:x}.{firma}", ahora=1000) == 'firma'
+    assert firmador.verificar('basura', ahora=1000) == 'firma'
+    assert firmador.verificar(str(uuid.uuid4()), ahora=1000) == 'sin_firma'
+    assert firmador.verificar('token.con.ñ', ahora=1000) == 'firma'
+
+def test_rotacion_de_secretos():
+    anterior = FirmadorTokens(['viejo'])
+    token = anterior.firmar('cuerpo')
+    assert FirmadorTokens(['nuevo', 'viejo']).verificar(token) == 'ok'
+    assert FirmadorTokens(['nuevo']).verificar(token) == 'firma'
+    with pytest.raises(ValueError):
+        FirmadorTokens([])
+
+def test_filtro_de_revocados():
+    filtro = FiltroRevocados(capacidad=1000)
+    revocados = [str(uuid.uuid4()) for _ in range(500)]
+    filtro.agregar(*revocados)
+    assert all(filtro.contiene(token) for token in revocados)
+    assert not any(filtro.contiene(str(uuid.uuid4())) for _ in range(1000))
+
+def test_filtro_rota_al_llenarse():
+    filtro = FiltroRevocados(capacidad=10)
+    primeros = [f"t{i}" for i in range(10)]
+    filtro.agregar(*primeros)
+    filtro.agregar(*[f"s{i}" for i in range(10)])
+    # La generación anterior se sigue consultando
+    assert all(filtro.contiene(token) for token in primeros)
+    filtro.agregar(*[f"r{i}" for i in range(10)])
+    assert filtro.estadisticas()['rotaciones'] == 2
+
+def test_validador_cuenta_los_rechazos():
+    firmador = FirmadorTokens(['secreto'])
+    validador = ValidadorTokens(firmador, FiltroRevocados(capacidad=100), aceptar_sin_firma=False)
+    token = validador.generar('cuerpo')
+    assert validador.aceptar(token)
+    validador.revocar(token)
+    assert not validador.aceptar(token)
+    assert not validador.aceptar(str(uuid.uuid4()))
+    assert not validador.aceptar('basura')
+    assert validador.estadisticas()['rechazos'] == {'firma': 1, 'expirado': 0, 'sin_firma': 1, 'revocado': 1}
+
+def test_tokens_falsos_no_llegan_a_redis(servidores):
+    manager = RedisSessionManager(host='redis', token_secrets=['secreto'], accept_unsigned_tokens=False,
+                                  revoked_filter_size=1000)
+    token = manager.crear_sesion('1', 'ana', 'a@x')
+    assert manager.validador.firmador.verificar(token) == 'ok'
+    assert manager.obtener_sesion(token)['username'] == 'ana'
+    
+    cuerpo = token.rsplit('.', 2)[0]
+    manager.redis_client.hset(f"session:{cuerpo}.0.falsa", 'user_id', '1')
+    assert manager.obtener_sesion(f"{cuerpo}.0.falsa") is None
+    
+    assert manager.cerrar_sesion(token)
+    assert manager.obtener_sesion(token) is None
+    assert manager.estadisticas_tokens()['rechazos']['revocado'] == 1